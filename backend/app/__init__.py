@@ -1,23 +1,41 @@
 from flask import Flask
-from .extensions import db, cors
+from .database import configure_engines
+from .extensions import db, cors, migrate, response_cache, metrics, covers
 
 def create_app():
     app = Flask(__name__)
     app.config.from_object('app.config.Config')
 
     # Initialize extensions
+    configure_engines(app, db)
     db.init_app(app)
-    cors.init_app(app, origins=['http://localhost:3000', 'http://localhost:3001', 'http://localhost:3002', 'http://localhost:3003'])
+    migrate.init_app(app, db)
+    response_cache.init_app(app)
+    metrics.init_app(app)
+    covers.init_app(app)
+    cors.init_app(app, origins=app.config['CORS_ORIGINS'], expose_headers=['X-Next-Cursor'], supports_credentials=True)
 
     # Register blueprints
     from .routes.book_routes import book_bp
     from .routes.author_routes import author_bp
     from .routes.borrower_routes import borrower_bp
     from .routes.loan_routes import loan_bp
+    from .routes.import_routes import import_bp
+    from .routes.stats_routes import stats_bp
+    from .routes.hold_routes import hold_bp
+    from .routes.batch_routes import batch_bp
+    from .routes.change_routes import change_bp
+    from .routes.autocomplete_routes import autocomplete_bp
     
     app.register_blueprint(book_bp, url_prefix='/api/books')
     app.register_blueprint(author_bp, url_prefix='/api/authors')
     app.register_blueprint(borrower_bp, url_prefix='/api/borrowers')
     app.register_blueprint(loan_bp, url_prefix='/api/loans')
+    app.register_blueprint(import_bp, url_prefix='/api/import')
+    app.register_blueprint(stats_bp, url_prefix='/api/stats')
+    app.register_blueprint(hold_bp, url_prefix='/api/holds')
+    app.register_blueprint(batch_bp, url_prefix='/api/batch')
+    app.register_blueprint(change_bp, url_prefix='/api/changes')
+    app.register_blueprint(autocomplete_bp, url_prefix='/api/autocomplete')
 
     return app
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, exists, func, insert, or_, select
+
+from app.changes import record_changes
+from app.extensions import db, response_cache
+from app.models.models import LOAN_HISTORY_COLUMNS, ArchivedLoan, Loan
+from app.stats import record_deleted_history
+
+# Returned loans are history: nothing updates them again, but they make up
+# most of the loans table. Moving the old ones to loans_archive keeps the
+# table the checkout, return and list queries work on small; the history
+# reads (the loan list and export, stats rebuilds) go through LoanHistory,
+# which covers both tables.
+
+
+def archive_loans(before=None, batch_size=None):
+    """Move loans returned before ``before`` into loans_archive.
+
+    ``before`` defaults to ARCHIVE_AFTER_DAYS ago. Works through the loan id
+    range ``ARCHIVE_BATCH_SIZE`` ids at a time; each batch is one
+    INSERT ... SELECT and one DELETE of the same rows (a single statement on
+    PostgreSQL) and its own commit, so no rows pass through Python and no
+    transaction grows with the table. The stats rollups are left alone, as
+    archived loans still count. Returns the number of loans moved.
+    """
+    before = before or datetime.utcnow().date() - timedelta(days=current_app.config['ARCHIVE_AFTER_DAYS'])
+    batch_size = batch_size or current_app.config['ARCHIVE_BATCH_SIZE']
+    done = (Loan.status == 'returned', Loan.return_date < before)
+    columns = [Loan.__table__.c[name] for name in LOAN_HISTORY_COLUMNS]
+    postgresql = db.session.get_bind().dialect.name == 'postgresql'
+
+    first_id, last_id = db.session.execute(select(func.min(Loan.id), func.max(Loan.id)).where(*done)).one()
+    moved = 0
+    if first_id is None:
+        return moved
+    for start in range(first_id, last_id + 1, batch_size):
+        batch = (Loan.id.between(start, start + batch_size - 1), *done)
+        if postgresql:
+            # WITH moved AS (DELETE ... RETURNING *) INSERT INTO loans_archive SELECT * FROM moved
+            deleted = delete(Loan).where(*batch).returning(*columns).cte('moved')
+            result = db.session.execute(
+                insert(ArchivedLoan).from_select(LOAN_HISTORY_COLUMNS, select(*deleted.c)))
+        else:
+            # SQLite holds the write lock from the INSERT on, so no other writer gets in between
+            db.session.execute(insert(ArchivedLoan).from_select(LOAN_HISTORY_COLUMNS, select(*columns).where(*batch)))
+            result = db.session.execute(delete(Loan).where(*batch).execution_options(synchronize_session=False))
+        moved += result.rowcount
+        db.session.commit()
+    response_cache.invalidate('loans')
+    return moved
+
+
+def has_history(column, value):
+    """Whether any live or archived loan has ``column`` (e.g. 'book_id') equal to ``value``"""
+    return db.session.query(or_(
+        exists().where(Loan.__table__.c[column] == value),
+        exists().where(ArchivedLoan.__table__.c[column] == value),
+    )).scalar()
+
+
+def delete_history(column, value):
+    """Delete every live and archived loan with ``column`` equal to ``value``, rollups included"""
+    record_deleted_history(column, value)
+    for model in (Loan, ArchivedLoan):
+        ids = db.session.scalars(delete(model).where(model.__table__.c[column] == value).returning(model.id)
+                                 .execution_options(synchronize_session=False)).all()
+        record_changes('loans', ids, 'delete')
@@ -0,0 +1,306 @@
+import asyncio
+import hashlib
+import json
+import random
+import time
+from contextlib import asynccontextmanager
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+
+from app.changes import (
+    COMPACTED_THROUGH, LATEST_CHANGE, ChangeLogCompacted, build_changes, change_rows, data_statements,
+)
+from app.config import Config
+from app.database import engine_options
+from app.models.models import Loan, LoanHistory
+from app.models.serializers import AUTHOR_ROWS, BOOK_ROWS, BORROWER_ROWS, LOAN_HISTORY_ROWS, LOAN_ROWS
+from app.overdue import overdue_query
+from app.pagination import PaginationError, keyset_page, parse_int
+from app.routes.author_routes import AUTHOR_SORT_FIELDS
+from app.routes.book_routes import BOOK_SORT_FIELDS, filter_books
+from app.routes.borrower_routes import BORROWER_SORT_FIELDS
+from app.routes.change_routes import COMPACTED_MESSAGE, parse_feed_args
+from app.routes.loan_routes import LOAN_HISTORY_SORT_FIELDS, LOAN_SORT_FIELDS, filter_loans
+
+# The read-only GET endpoints of the four blueprints, served under ASGI.
+# While a query waits on the database the event loop serves other requests,
+# so one process holds as many requests in flight as its pool has
+# connections instead of one per thread. Statements, filters, pagination
+# and serializers are the ones the Flask app uses, so responses are byte for
+# byte the same; writes stay with the WSGI app in wsgi.py. The change stream
+# lives only here: an open stream is a suspended coroutine rather than a
+# worker thread, and it holds a connection only while it polls.
+
+ASYNC_DRIVERS = {'postgresql': 'postgresql+asyncpg', 'sqlite': 'sqlite+aiosqlite'}
+
+
+def async_url(url):
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise RuntimeError(f'The async read API does not support {backend} databases')
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+def create_engine(url, config):
+    options = engine_options(url, {**config, 'DB_POOL_SIZE': config['ASYNC_DB_POOL_SIZE'],
+                                   'DB_MAX_OVERFLOW': config['ASYNC_DB_MAX_OVERFLOW']})
+    if 'connect_args' in options:
+        # asyncpg takes the statement timeout as a server setting, not a libpq option
+        options['connect_args'] = {'server_settings': {'statement_timeout': str(config['DB_STATEMENT_TIMEOUT_MS'])}}
+    return create_async_engine(async_url(url), **options)
+
+
+def engine_for(request):
+    """A replica unless the client wrote recently (same stickiness cookie as the WSGI app)"""
+    state = request.app.state
+    sticky = request.cookies.get(state.config['REPLICA_STICKY_COOKIE'], '')
+    if state.replicas and not (sticky.isdigit() and int(sticky) > time.time()):
+        return random.choice(state.replicas)
+    return state.primary
+
+
+async def fetch(request, statement):
+    async with engine_for(request).connect() as connection:
+        return (await connection.execute(statement)).all()
+
+
+def error_response(message, status_code):
+    # Encoded like Flask's jsonify so both tiers send identical errors
+    body = json.dumps({'error': message}, separators=(',', ':')).encode() + b'\n'
+    return Response(body, status_code=status_code, media_type='application/json')
+
+
+def json_response(request, body):
+    """A JSON response with an ETag, answering a matching If-None-Match with 304"""
+    etag = f'"{hashlib.sha1(body).hexdigest()}"'
+    if etag in request.headers.get('if-none-match', ''):
+        return Response(status_code=304, headers={'ETag': etag})
+    return Response(body, media_type='application/json', headers={'ETag': etag})
+
+
+async def list_page(request, serializer, build, sort_fields, default_sort='id'):
+    config = request.app.state.config
+    try:
+        statement = build(request.query_params)
+        statement, finish = keyset_page(statement, serializer.model, request.query_params, sort_fields, default_sort,
+                                        config['DEFAULT_PAGE_SIZE'], config['MAX_PAGE_SIZE'])
+    except PaginationError as e:
+        return error_response(str(e), 400)
+    rows, next_cursor = finish(await fetch(request, statement))
+    response = json_response(request, serializer.encode(rows) + b'\n')
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+
+async def detail(request, serializer):
+    model = serializer.model
+    rows = await fetch(request, serializer.statement().where(model.id == request.path_params['id']))
+    if not rows:
+        return error_response(f'{model.__name__} not found', 404)
+    return json_response(request, serializer.encode_lines(rows))
+
+
+async def get_books(request):
+    return await list_page(request, BOOK_ROWS, lambda args: filter_books(BOOK_ROWS.statement(), args),
+                           BOOK_SORT_FIELDS)
+
+
+async def get_book(request):
+    return await detail(request, BOOK_ROWS)
+
+
+async def get_authors(request):
+    return await list_page(request, AUTHOR_ROWS, lambda args: AUTHOR_ROWS.statement(), AUTHOR_SORT_FIELDS)
+
+
+async def get_author(request):
+    return await detail(request, AUTHOR_ROWS)
+
+
+async def get_borrowers(request):
+    return await list_page(request, BORROWER_ROWS, lambda args: BORROWER_ROWS.statement(), BORROWER_SORT_FIELDS)
+
+
+async def get_borrower(request):
+    return await detail(request, BORROWER_ROWS)
+
+
+async def get_loans(request):
+    return await list_page(
+        request, LOAN_HISTORY_ROWS, lambda args: filter_loans(LOAN_HISTORY_ROWS.statement(), args, LoanHistory),
+        LOAN_HISTORY_SORT_FIELDS)
+
+
+async def get_active_loans(request):
+    return await list_page(
+        request, LOAN_ROWS, lambda args: filter_loans(LOAN_ROWS.statement().where(Loan.outstanding()), args),
+        LOAN_SORT_FIELDS)
+
+
+def _overdue(args):
+    min_days = parse_int(args, 'min_days_overdue')
+    query = overdue_query(min_days=1 if min_days is None else min_days, max_days=parse_int(args, 'max_days_overdue'),
+                          query=LOAN_ROWS.statement())
+    return filter_loans(query, args)
+
+
+async def get_overdue_loans(request):
+    return await list_page(request, LOAN_ROWS, _overdue, LOAN_SORT_FIELDS, default_sort='due_date')
+
+
+# Seconds an idle stream waits between comment lines that keep proxies from closing it
+KEEPALIVE_SECONDS = 15
+
+
+async def latest_cursor(connection):
+    """app.changes.latest_cursor() on an async connection"""
+    latest = (await connection.execute(LATEST_CHANGE)).scalar()
+    return max(latest, (await connection.execute(COMPACTED_THROUGH)).scalar() or 0)
+
+
+async def changes_since(connection, since, limit, resources):
+    """app.changes.changes_since() on an async connection"""
+    if since < ((await connection.execute(COMPACTED_THROUGH)).scalar() or 0):
+        raise ChangeLogCompacted(since)
+    rows = (await connection.execute(change_rows(since, limit, resources))).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    found = {resource: (await connection.execute(statement)).all()
+             for resource, statement in data_statements(rows).items()}
+    return build_changes(rows, found, since, more)
+
+
+def sse_event(name, payload, id=None):
+    head = f'id: {id}\n' if id is not None else ''
+    return f'{head}event: {name}\ndata: {json.dumps(payload, separators=(",", ":"))}\n\n'
+
+
+class EventStream(StreamingResponse):
+    """A StreamingResponse that calls ``release`` once it has been sent, cut short or abandoned"""
+
+    def __init__(self, content, release, **kwargs):
+        super().__init__(content, **kwargs)
+        self.release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.release()
+
+
+async def stream_changes(request):
+    """Push changes as Server-Sent Events, resuming after Last-Event-ID or ?since=.
+
+    Each ``changes`` event carries the same body as GET /api/changes and the
+    new cursor as its id. The log is polled every CHANGE_POLL_SECONDS with a
+    connection taken from the pool for that poll only, and the stream ends
+    after CHANGE_STREAM_SECONDS so the client reconnects (EventSource does so
+    on its own). A ``reset`` event means the cursor was compacted away, as
+    with the 410 of GET /api/changes. Beyond CHANGE_MAX_STREAMS open streams
+    a process answers 503 with Retry-After.
+    """
+    state = request.app.state
+    config = state.config
+    try:
+        since = parse_int(request.headers, 'Last-Event-ID')
+        if since is None:
+            since = parse_int(request.query_params, 'since')
+        limit, resources = parse_feed_args(request.query_params, config)
+    except PaginationError as e:
+        return error_response(str(e), 400)
+    if state.streams >= config['CHANGE_MAX_STREAMS']:
+        response = error_response('Too many open change streams; retry later or poll GET /api/changes', 503)
+        response.headers['Retry-After'] = str(config['CHANGE_STREAM_SECONDS'])
+        return response
+    poll = config['CHANGE_POLL_SECONDS']
+    duration = config['CHANGE_STREAM_SECONDS']
+    engine = engine_for(request)
+
+    async def events():
+        cursor = since
+        yield f'retry: {int(poll * 1000)}\n\n'
+        if cursor is None:
+            async with engine.connect() as connection:
+                cursor = await latest_cursor(connection)
+            yield sse_event('cursor', {'cursor': cursor}, cursor)
+        started = quiet_since = time.monotonic()
+        while True:
+            async with engine.connect() as connection:
+                try:
+                    changes, cursor, more = await changes_since(connection, cursor, limit, resources)
+                except ChangeLogCompacted:
+                    reset = {'error': COMPACTED_MESSAGE, 'cursor': await latest_cursor(connection)}
+                    changes = None
+            if changes is None:
+                yield sse_event('reset', reset)
+                return
+            if changes:
+                yield sse_event('changes', {'changes': changes, 'cursor': cursor, 'more': more}, cursor)
+                quiet_since = time.monotonic()
+                if more:
+                    continue
+            elif time.monotonic() - quiet_since >= KEEPALIVE_SECONDS:
+                yield ': keep-alive\n\n'
+                quiet_since = time.monotonic()
+            if time.monotonic() - started >= duration:
+                return
+            await asyncio.sleep(poll)
+
+    def release():
+        state.streams -= 1
+
+    state.streams += 1
+    return EventStream(events(), release, media_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # let nginx pass events through as they come
+    })
+
+
+routes = [
+    Route('/api/books', get_books),
+    Route('/api/books/{id:int}', get_book),
+    Route('/api/authors', get_authors),
+    Route('/api/authors/{id:int}', get_author),
+    Route('/api/borrowers', get_borrowers),
+    Route('/api/borrowers/{id:int}', get_borrower),
+    Route('/api/loans', get_loans),
+    Route('/api/loans/active', get_active_loans),
+    Route('/api/loans/overdue', get_overdue_loans),
+    Route('/api/changes/stream', stream_changes),
+]
+
+
+def create_asgi_app(config=None):
+    """Build the async read API from Config (or a dict overriding some of its keys)"""
+    config = {**{key: getattr(Config, key) for key in dir(Config) if key.isupper()}, **(config or {})}
+    primary = create_engine(config.get('ASYNC_DATABASE_URL') or config['SQLALCHEMY_DATABASE_URI'], config)
+    replicas = [create_engine(url, config) for url in config['READ_REPLICA_URLS']]
+
+    @asynccontextmanager
+    async def lifespan(app):
+        yield
+        for engine in (primary, *replicas):
+            await engine.dispose()
+
+    app = Starlette(
+        routes=routes,
+        middleware=[Middleware(
+            CORSMiddleware, allow_origins=config['CORS_ORIGINS'], allow_credentials=True,
+            expose_headers=['X-Next-Cursor', 'ETag'],
+        )],
+        lifespan=lifespan,
+    )
+    app.state.config = config
+    app.state.primary = primary
+    app.state.replicas = replicas
+    app.state.streams = 0
+    return app
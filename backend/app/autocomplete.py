@@ -0,0 +1,226 @@
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from flask import current_app
+from sqlalchemy import func, or_
+
+from app.changes import ChangeLogCompacted, changes_since, latest_cursor
+from app.models.models import Author, Book, Borrower
+from app.models.serializers import RowSerializer
+
+# Typeahead for the pickers: each worker keeps a sorted array of
+# (term, id) pairs per resource and answers a prefix with one bisect,
+# without touching the database. A term is a column value from the start of
+# one of its words, so "smi" finds "John Smith". The array is built on first
+# use and then kept current from the change log (app/changes.py), so writes
+# made through any worker show up within AUTOCOMPLETE_REFRESH_SECONDS. Builds
+# run outside the index lock: lookups meanwhile use the previous index, or
+# the database before the first build completes.
+
+# Terms are cut to this many characters; longer prefixes are checked against the full value
+TERM_LENGTH = 32
+
+# Where a word starts: its first letter or digit after whitespace and any leading punctuation,
+# so an email is one word and "(Book 1)" can be found by "book"
+_WORD_START = re.compile(r'(?<!\S)[^\w\s]*(\w)')
+
+# What a suggestion carries and which of its columns are searched
+SOURCES = {
+    'authors': (RowSerializer(Author, [
+        ('id', Author.id, None),
+        ('name', Author.name, None),
+    ]), ('name',)),
+    'borrowers': (RowSerializer(Borrower, [
+        ('id', Borrower.id, None),
+        ('name', Borrower.name, None),
+        ('email', Borrower.email, None),
+        ('phone', Borrower.phone, None),
+    ]), ('name', 'email')),
+    'books': (RowSerializer(Book, [
+        ('id', Book.id, None),
+        ('title', Book.title, None),
+        ('author_name', func.coalesce(Author.name, 'Unknown'), None),
+        ('available', Book.available, None),
+    ], joins=[(Author, Author.id == Book.author_id)]), ('title',)),
+}
+
+
+def normalize(value):
+    return ' '.join((value or '').casefold().split())
+
+
+def _word_starts(value):
+    return [match.start(1) for match in _WORD_START.finditer(value)]
+
+
+class PrefixIndex:
+    """Prefix lookups over the searched columns of one resource.
+
+    Terms and their row ids are kept in two parallel sorted arrays, which
+    costs far less memory than a trie or a list of tuples. At most
+    AUTOCOMPLETE_MAX_TERMS are held; a resource with more is looked up in
+    the database instead, matching the start of each searched column rather
+    than of each word, and the build is tried again every
+    AUTOCOMPLETE_REBUILD_SECONDS in case it has shrunk.
+    """
+
+    def __init__(self, resource):
+        self.resource = resource
+        self.serializer, searched = SOURCES[resource]
+        self.searched = [self.serializer.keys.index(column) for column in searched]
+        self.id_column = self.serializer.keys.index('id')
+        self.lock = threading.Lock()
+        self.terms = None  # sorted; None until built or when over the limit
+        self.ids = array('q')
+        self.entries = {}  # id -> values in serializer.keys order
+        self.cursor = None  # None until the first build completes
+        self.checked_at = 0.0
+        self.built_at = 0.0
+        self.building = False
+
+    def lookup(self, prefix, limit):
+        """Up to ``limit`` suggestions whose searched columns have a word starting with ``prefix``"""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        with self.lock:
+            build = self._refresh()
+            self.building = self.building or build
+            if not build and self.terms is not None:
+                return self._search(prefix, limit)
+        if build:
+            self._build()
+            with self.lock:
+                if self.terms is not None:
+                    return self._search(prefix, limit)
+        return self._query(prefix, limit)
+
+    def _search(self, prefix, limit):
+        term = prefix[:TERM_LENGTH]
+        terms, keys = self.terms, self.serializer.keys
+        found = {}
+        i = bisect_left(terms, term)
+        while i < len(terms) and len(found) < limit and terms[i].startswith(term):
+            id = self.ids[i]
+            values = self.entries[id]
+            if len(prefix) <= TERM_LENGTH or self._matches(values, prefix):
+                found.setdefault(id, values)
+            i += 1
+        return [dict(zip(keys, values)) for values in found.values()]
+
+    def _matches(self, values, prefix):
+        for column in self.searched:
+            value = normalize(values[column])
+            if any(value.startswith(prefix, start) for start in _word_starts(value)):
+                return True
+        return False
+
+    def _terms(self, values):
+        terms = set()
+        for column in self.searched:
+            value = normalize(values[column])
+            terms.update(value[start:start + TERM_LENGTH] for start in _word_starts(value))
+        return tuple(terms)
+
+    def _refresh(self):
+        """Apply the changes logged since the last check; True when the caller has to build the index"""
+        if self.building:
+            return False
+        now = time.monotonic()
+        if self.cursor is None:
+            return True
+        if self.terms is None:
+            return now - self.built_at >= current_app.config['AUTOCOMPLETE_REBUILD_SECONDS']
+        if now - self.checked_at < current_app.config['AUTOCOMPLETE_REFRESH_SECONDS']:
+            return False
+        self.checked_at = now
+        try:
+            more = True
+            while more:
+                changes, self.cursor, more = changes_since(
+                    self.cursor, current_app.config['MAX_PAGE_SIZE'], [self.resource])
+                for change in changes:
+                    self._apply(change['resource_id'], change['data'])
+        except ChangeLogCompacted:
+            return True
+        return False
+
+    def _build(self):
+        """Load the index without holding the lock, then swap it in"""
+        try:
+            # The cursor is taken first; changes logged during the load are applied again, harmlessly
+            cursor = latest_cursor()
+            terms, ids, entries = self._load()
+            with self.lock:
+                self.cursor, self.terms, self.ids, self.entries = cursor, terms, ids, entries
+                self.built_at = time.monotonic()
+                self.checked_at = 0.0  # catch up with the changes logged during the load on the next lookup
+        finally:
+            with self.lock:
+                self.building = False
+
+    def _load(self):
+        limit = current_app.config['AUTOCOMPLETE_MAX_TERMS']
+        pairs, entries = [], {}
+        for values in self.serializer.values(self.serializer.query().yield_per(10000)):
+            terms = self._terms(values)
+            id = values[self.id_column]
+            entries[id] = tuple(values)
+            pairs.extend((term, id) for term in terms)
+            if len(pairs) > limit:
+                return None, array('q'), {}
+        pairs.sort()
+        return [term for term, _ in pairs], array('q', [id for _, id in pairs]), entries
+
+    def _apply(self, id, data):
+        """Replace the entry of row ``id`` with ``data`` (a row from the change log), or drop it"""
+        if self.terms is None:
+            return
+        old = self.entries.pop(id, None)
+        if old is not None:
+            for term in self._terms(old):
+                i = self._position(term, id)
+                del self.terms[i], self.ids[i]
+        if data is None:
+            return
+        values = tuple(data[key] for key in self.serializer.keys)
+        terms = self._terms(values)
+        if len(self.terms) + len(terms) > current_app.config['AUTOCOMPLETE_MAX_TERMS']:
+            self.terms, self.ids, self.entries = None, array('q'), {}
+            self.built_at = time.monotonic()
+            return
+        self.entries[id] = values
+        for term in terms:
+            i = self._position(term, id)
+            self.terms.insert(i, term)
+            self.ids.insert(i, id)
+
+    def _position(self, term, id):
+        """Where (term, id) is or would go; equal terms are kept in id order"""
+        i = bisect_left(self.terms, term)
+        while i < len(self.terms) and self.terms[i] == term and self.ids[i] < id:
+            i += 1
+        return i
+
+    def _query(self, prefix, limit):
+        # lower(column) LIKE 'prefix%' can use the text_pattern_ops indexes on lower(column) (see models.py)
+        pattern = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        columns = [self.serializer.model.__table__.c[self.serializer.keys[column]] for column in self.searched]
+        query = self.serializer.query().filter(or_(*[func.lower(column).like(pattern, escape='\\') for column in columns]))
+        rows = query.order_by(columns[0], self.serializer.model.id).limit(limit).all()
+        return [dict(zip(self.serializer.keys, values)) for values in self.serializer.values(rows)]
+
+
+_registry_lock = threading.Lock()
+
+
+def get_index(resource):
+    """This worker's index of ``resource``, created on first use"""
+    indexes = current_app.extensions.setdefault('autocomplete', {})
+    if resource not in indexes:
+        with _registry_lock:
+            indexes.setdefault(resource, PrefixIndex(resource))
+    return indexes[resource]
@@ -0,0 +1,295 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from app.changes import record_changes
+from app.extensions import db
+from app.models.models import Author, Book, Borrower, PLACEHOLDER_IMAGE_URL
+from app.search import index_books
+
+# Only the first errors are echoed back; the counts are always exact
+MAX_REPORTED_ERRORS = 100
+
+FORMATS = ('csv', 'ndjson')
+
+
+class RowError(ValueError):
+    """A single input row that cannot be imported"""
+
+
+def iter_records(stream, fmt):
+    """Yield ``(row_number, record)`` pairs from a binary CSV or NDJSON stream.
+
+    Rows are decoded one at a time so memory use does not depend on the size
+    of the feed. Undecodable NDJSON lines are yielded as RowError instances.
+    """
+    text_stream = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    if fmt == 'csv':
+        for number, record in enumerate(csv.DictReader(text_stream), start=1):
+            yield number, record
+    elif fmt == 'ndjson':
+        for number, line in enumerate(text_stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield number, RowError(f'Invalid JSON: {e}')
+                continue
+            if not isinstance(record, dict):
+                record = RowError('Each line must be a JSON object')
+            yield number, record
+    else:
+        raise ValueError(f'Unsupported format {fmt}. Use one of: {", ".join(FORMATS)}')
+
+
+def _text(record, name, required=False):
+    value = record.get(name)
+    if isinstance(value, str):
+        value = value.strip()
+    if value in (None, ''):
+        if required:
+            raise RowError(f'Missing required field: {name}')
+        return None
+    return str(value)
+
+
+def _int(record, name):
+    value = record.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        value = int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise RowError(f'{name} must be an integer')
+    # The columns are 32-bit INTEGERs; a larger value would fail the whole batch
+    if not -2**31 <= value < 2**31:
+        raise RowError(f'{name} is out of range')
+    return value
+
+
+def _check_lengths(table, row):
+    """Reject values longer than their column allows, which would otherwise fail the whole batch"""
+    for name, value in row.items():
+        column = table.c.get(name)
+        length = getattr(column.type, 'length', None) if column is not None else None
+        if length and isinstance(value, str) and len(value) > length:
+            raise RowError(f'{name} must be at most {length} characters')
+
+
+def _date(record, name):
+    value = _text(record, name)
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise RowError(f'{name} must be a date in YYYY-MM-DD format')
+
+
+class BulkImporter:
+    """Batched loader for publisher feeds.
+
+    Rows are validated in Python, checked against the database once per batch
+    (never once per row) and written with COPY on PostgreSQL or a single
+    executemany INSERT elsewhere. Invalid rows are counted and reported
+    without affecting the rest of the batch.
+    """
+
+    def __init__(self, batch_size=None, create_authors=True):
+        self.batch_size = batch_size or current_app.config.get('IMPORT_BATCH_SIZE', 5000)
+        self.create_authors = create_authors
+        self.author_ids = {}
+        self.imported = 0
+        self.rejected = 0
+        self.errors = []
+
+    def report(self):
+        return {'imported': self.imported, 'rejected': self.rejected, 'errors': self.errors}
+
+    def reject(self, number, error):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': number, 'error': str(error)})
+
+    def run(self, entity, records):
+        """Import ``(row_number, record)`` pairs into ``entity`` and return the report"""
+        prepare, write, table = {
+            'authors': (self._prepare_author, self._write_authors, Author.__table__),
+            'books': (self._prepare_book, self._write_books, Book.__table__),
+            'borrowers': (self._prepare_borrower, self._write_borrowers, Borrower.__table__),
+        }[entity]
+
+        batch = []
+        for number, record in records:
+            if isinstance(record, RowError):
+                self.reject(number, record)
+                continue
+            try:
+                row = prepare(record)
+                _check_lengths(table, row)
+                batch.append((number, row))
+            except RowError as e:
+                self.reject(number, e)
+                continue
+            if len(batch) >= self.batch_size:
+                write(batch)
+                batch = []
+        if batch:
+            write(batch)
+        return self.report()
+
+    # Row preparation
+
+    def _prepare_author(self, record):
+        return {
+            'name': _text(record, 'name', required=True),
+            'biography': _text(record, 'biography'),
+            'birth_date': _date(record, 'birth_date'),
+        }
+
+    def _prepare_book(self, record):
+        author_id = _int(record, 'author_id')
+        author_name = _text(record, 'author_name') or _text(record, 'author')
+        if author_id is None and author_name is None:
+            raise RowError('Missing author: provide author_id or author_name')
+        if author_name and len(author_name) > Author.name.type.length:
+            raise RowError(f'author_name must be at most {Author.name.type.length} characters')
+        copies = _int(record, 'copies')
+        if copies is not None and copies < 0:
+            raise RowError('copies must not be negative')
+        return {
+            'title': _text(record, 'title', required=True),
+            'author_id': author_id,
+            'author_name': author_name,
+            'description': _text(record, 'description'),
+            'publication_year': _int(record, 'publication_year'),
+            'isbn': _text(record, 'isbn'),
+            'genre': _text(record, 'genre'),
+            'pages': _int(record, 'pages'),
+            'image_url': _text(record, 'image_url') or PLACEHOLDER_IMAGE_URL,
+            'copies': 1 if copies is None else copies,
+        }
+
+    def _prepare_borrower(self, record):
+        return {
+            'name': _text(record, 'name', required=True),
+            'email': _text(record, 'email', required=True),
+            'phone': _text(record, 'phone'),
+        }
+
+    # Batch writers
+
+    def _write_authors(self, batch):
+        # Author names are not unique, so every valid row is imported
+        rows = [row for _, row in batch]
+        self._insert(Author.__table__, rows)
+        self.imported += len(rows)
+        db.session.commit()
+
+    def _write_borrowers(self, batch):
+        emails = {row['email'] for _, row in batch}
+        existing = set(db.session.scalars(select(Borrower.email).where(Borrower.email.in_(emails))))
+        rows = []
+        for number, row in batch:
+            if row['email'] in existing:
+                self.reject(number, f'Borrower with email {row["email"]} already exists')
+                continue
+            existing.add(row['email'])
+            rows.append(row)
+        self._insert(Borrower.__table__, rows)
+        self.imported += len(rows)
+        db.session.commit()
+
+    def _write_books(self, batch):
+        self._resolve_authors({row['author_name'] for _, row in batch if row['author_id'] is None})
+        author_ids = {row['author_id'] for _, row in batch if row['author_id'] is not None}
+        known_author_ids = set(db.session.scalars(select(Author.id).where(Author.id.in_(author_ids))))
+        isbns = {row['isbn'] for _, row in batch if row['isbn']}
+        seen_isbns = set(db.session.scalars(select(Book.isbn).where(Book.isbn.in_(isbns))))
+
+        rows = []
+        for number, row in batch:
+            author_name = row.pop('author_name')
+            if row['author_id'] is None:
+                row['author_id'] = self.author_ids.get(author_name)
+                if row['author_id'] is None:
+                    self.reject(number, f'Author {author_name} does not exist')
+                    continue
+            elif row['author_id'] not in known_author_ids:
+                self.reject(number, f'Author with ID {row["author_id"]} does not exist')
+                continue
+            if row['isbn']:
+                if row['isbn'] in seen_isbns:
+                    self.reject(number, f'Book with ISBN {row["isbn"]} already exists')
+                    continue
+                seen_isbns.add(row['isbn'])
+            rows.append(row)
+
+        index_books(self._insert(Book.__table__, rows))
+        self.imported += len(rows)
+        db.session.commit()
+
+    def _resolve_authors(self, names):
+        """Fill the name -> id cache for ``names``, creating missing authors"""
+        missing = {name for name in names if name not in self.author_ids}
+        if not missing:
+            return
+        self._cache_authors(missing)
+        missing -= self.author_ids.keys()
+        if missing and self.create_authors:
+            names = sorted(missing)
+            self.author_ids.update(zip(names, self._insert(Author.__table__, [{'name': name} for name in names])))
+
+    def _cache_authors(self, names):
+        rows = db.session.execute(
+            select(Author.name, func.min(Author.id)).where(Author.name.in_(names)).group_by(Author.name))
+        self.author_ids.update(rows.all())
+
+    def _insert(self, table, rows):
+        """Write ``rows`` with COPY on PostgreSQL, executemany INSERT elsewhere, and log them as inserts.
+
+        Returns the new ids in the order of ``rows``. They are taken from what
+        this insert wrote, never inferred from the table, so rows inserted
+        concurrently by other transactions are not mistaken for ours.
+        """
+        if not rows:
+            return []
+        # COPY bypasses the model defaults, so fill them in explicitly
+        now = datetime.utcnow()
+        for row in rows:
+            row.setdefault('created_at', now)
+            if table is Book.__table__:
+                row.setdefault('copies', 1)
+                row.setdefault('available_copies', row['copies'])
+                row.setdefault('available', row['available_copies'] > 0)
+        if db.session.get_bind().dialect.name == 'postgresql':
+            # COPY cannot return ids, so reserve them from the table's sequence and write them explicitly
+            sequence = func.nextval(func.pg_get_serial_sequence(table.name, 'id'))
+            ids = db.session.scalars(select(sequence).select_from(func.generate_series(1, len(rows)))).all()
+            for row, id in zip(rows, ids):
+                row['id'] = id
+            self._copy(table, rows)
+        else:
+            ids = db.session.scalars(table.insert().returning(table.c.id, sort_by_parameter_order=True), rows).all()
+        record_changes(table.name, ids, 'insert')
+        return ids
+
+    def _copy(self, table, rows):
+        columns = list(rows[0])
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([row[column] for column in columns])
+        buffer.seek(0)
+        # Run COPY on the session's own connection so it shares the transaction
+        cursor = db.session.connection().connection.cursor()
+        try:
+            cursor.copy_expert(
+                f'COPY {table.name} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)', buffer)
+        finally:
+            cursor.close()
@@ -0,0 +1,264 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import Response, current_app, g, has_app_context, request
+
+try:
+    import orjson
+except ImportError:  # json reads and writes the same entries, just slower
+    orjson = None
+
+
+class LRUStore:
+    """Thread-safe in-process LRU map with a fixed number of entries, each kept at most ``ttl`` seconds"""
+
+    def __init__(self, max_entries, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires is not None and expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class LocalVersions:
+    """Per-table write counters kept in this process (single-worker deployments)"""
+
+    def __init__(self):
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._started = time.time()
+
+    def get(self, tables):
+        with self._lock:
+            return [self._versions.get(table, (0, self._started)) for table in tables]
+
+    def bump(self, tables):
+        now = time.time()
+        with self._lock:
+            for table in tables:
+                version, _ = self._versions.get(table, (0, now))
+                self._versions[table] = (version + 1, now)
+
+
+class RedisVersions:
+    """Write counters shared by every worker through Redis"""
+
+    def __init__(self, client, prefix):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, tables):
+        keys = [f'{self.prefix}version:{table}' for table in tables]
+        keys += [f'{self.prefix}modified:{table}' for table in tables]
+        values = self.client.mget(keys)
+        count = len(tables)
+        return [(int(values[i] or 0), float(values[count + i] or 0)) for i in range(count)]
+
+    def bump(self, tables):
+        pipe = self.client.pipeline()
+        now = time.time()
+        for table in tables:
+            pipe.incr(f'{self.prefix}version:{table}')
+            pipe.set(f'{self.prefix}modified:{table}', now)
+        pipe.execute()
+
+
+def _dumps(entry):
+    # The body is stored after a JSON header line; never pickle, as anyone able to write to Redis could run code
+    body, status, headers = entry
+    header = orjson.dumps([status, headers]) if orjson is not None else json.dumps([status, headers]).encode()
+    return header + b'\n' + body
+
+
+def _loads(data):
+    header, body = data.split(b'\n', 1)
+    status, headers = orjson.loads(header) if orjson is not None else json.loads(header)
+    return body, status, [tuple(header) for header in headers]
+
+
+class ResponseCache:
+    """Write-invalidated cache for GET responses.
+
+    Every cached view declares the tables its output is built from and every
+    blueprint declares the tables its writes touch. A write bumps a counter
+    per table; cache keys embed the counters of the view's tables, so a
+    write makes exactly the dependent entries unreachable and the LRU ages
+    them out. Entries also expire after RESPONSE_CACHE_TTL, which bounds how
+    long a view stays stale when the data changes without a version bump it
+    can see: the date rolling over (overdue counts), or a CLI job whose
+    invalidation only reached its own process under ``simple``. Reads served
+    by a replica within REPLICA_STICKY_SECONDS of the last write to their
+    tables are not stored, as the replica may not have that write yet.
+    Responses always carry an ETag (and a Last-Modified when the
+    cache is enabled) so unchanged reads can be answered with 304.
+
+    ``RESPONSE_CACHE`` selects the backend: ``null`` (ETags only),
+    ``simple`` (in-process, correct for a single worker) or ``redis``
+    (counters and bodies shared through ``RESPONSE_CACHE_REDIS_URL``, with
+    the in-process LRU in front).
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.local = None
+        self.versions = None
+        self.shared = None
+        self.ttl = None
+        self.prefix = ''
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.get('RESPONSE_CACHE', 'null')
+        self.enabled = backend != 'null'
+        self.ttl = app.config.get('RESPONSE_CACHE_TTL', 300)
+        self.local = LRUStore(app.config.get('RESPONSE_CACHE_SIZE', 512), self.ttl)
+        self.prefix = app.config.get('RESPONSE_CACHE_PREFIX', 'library:')
+        if backend == 'simple':
+            self.versions = LocalVersions()
+        elif backend == 'redis':
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError('RESPONSE_CACHE=redis requires the redis package')
+            self.shared = redis.Redis.from_url(app.config['RESPONSE_CACHE_REDIS_URL'])
+            self.versions = RedisVersions(self.shared, self.prefix)
+        elif backend != 'null':
+            raise RuntimeError(f'Unknown RESPONSE_CACHE backend {backend}')
+        app.extensions['response_cache'] = self
+
+    def stats(self):
+        with self._stats_lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {'hits': hits, 'misses': misses, 'hit_rate': hits / total if total else 0.0}
+
+    def _count(self, hit):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def invalidate(self, *tables):
+        """Make every cached response built from ``tables`` stale"""
+        if not self.enabled:
+            return
+        pending = g.get('_cache_pending') if has_app_context() else None
+        if pending is not None:
+            pending.update(tables)
+        else:
+            self.versions.bump(tables)
+
+    @contextmanager
+    def deferred(self):
+        """Bypass the cache and hold back invalidations until the block ends.
+
+        For work done in one transaction that commits after the block: reads
+        inside it must not be cached or served from the cache, and the
+        invalidations only take effect once the outcome is known.
+        """
+        g._cache_pending = pending = set()
+        try:
+            yield
+        finally:
+            del g._cache_pending
+            self.invalidate(*pending)
+
+    def invalidates(self, blueprint, *tables):
+        """Invalidate ``tables`` after every successful write in ``blueprint``"""
+        @blueprint.after_request
+        def invalidate_after_write(response):
+            if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+                self.invalidate(*tables)
+            return response
+        return blueprint
+
+    def cached(self, *tables):
+        """Serve the view from the cache and answer conditional GETs"""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled or '_cache_pending' in g:
+                    return self._conditional(current_app.make_response(view(*args, **kwargs)), None)
+
+                versions = self.versions.get(tables)
+                key = (request.full_path, tuple(version for version, _ in versions))
+                last_modified = max(modified for _, modified in versions)
+                entry = self._lookup(key)
+                self._count(entry is not None)
+                if entry is None:
+                    response = current_app.make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    response.add_etag()
+                    entry = (response.get_data(), response.status_code, list(response.headers.items()))
+                    if not self._maybe_lagging(last_modified):
+                        self._store(key, entry)
+                body, status, headers = entry
+                return self._conditional(Response(body, status=status, headers=headers), last_modified)
+            return wrapper
+        return decorator
+
+    def _maybe_lagging(self, last_modified):
+        # A replica read soon after a write may predate it, yet would be stored under the new versions
+        return g.get('_read_replica') is not None and \
+            time.time() - last_modified < current_app.config['REPLICA_STICKY_SECONDS']
+
+    def _lookup(self, key):
+        entry = self.local.get(key)
+        if entry is None and self.shared is not None:
+            data = self.shared.get(self._shared_key(key))
+            if data is not None:
+                entry = _loads(data)
+                self.local.set(key, entry)
+        return entry
+
+    def _store(self, key, entry):
+        self.local.set(key, entry)
+        if self.shared is not None:
+            self.shared.set(self._shared_key(key), _dumps(entry), ex=self.ttl)
+
+    def _shared_key(self, key):
+        path, versions = key
+        return f'{self.prefix}response:{path}:{".".join(map(str, versions))}'
+
+    def _conditional(self, response, last_modified):
+        if response.status_code != 200:
+            return response
+        if not response.get_etag()[0]:
+            response.add_etag()
+        if last_modified:
+            response.last_modified = datetime.fromtimestamp(int(last_modified), tz=timezone.utc)
+        return response.make_conditional(request)
@@ -0,0 +1,225 @@
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, event, func, insert, inspect, select
+from sqlalchemy.orm import aliased
+
+from app.database import RoutingSession
+from app.extensions import db
+from app.models.models import SYNCED_RESOURCES, Book, Change, ChangeLogState, LoanHistory
+from app.models.serializers import AUTHOR_ROWS, BOOK_ROWS, BORROWER_ROWS, LOAN_HISTORY_ROWS
+
+# The change log behind GET /api/changes. Every transaction that inserts,
+# updates or deletes authors, books, borrowers or loans appends one row per
+# row it touched, just before it commits, so a client holding the id of the
+# last change it saw (its cursor) can fetch what happened since instead of
+# reloading whole lists. ORM adds, edits and deletes are picked up from the
+# flush, together with the rows that show a column they changed (DEPENDENTS);
+# the set-based UPDATEs and DELETEs of circulation, stats and the bulk jobs
+# call record_changes() with the ids they touched.
+
+# Held from appending to commit on PostgreSQL, so change ids become visible in
+# id order and a reader's cursor never passes a change that commits later
+CHANGE_LOG_LOCK = 0x6368676c
+
+# Loans are served from LoanHistory, so a loan moved to the archive keeps its data
+SERIALIZERS = {
+    'authors': AUTHOR_ROWS,
+    'books': BOOK_ROWS,
+    'borrowers': BORROWER_ROWS,
+    'loans': LOAN_HISTORY_ROWS,
+}
+
+
+# Columns other resources serialize as their own (a book's author_name, a loan's book_title
+# and borrower_name): editing or deleting the source row changes those rows too, so they are
+# logged as updated as well. (resource, column) -> [(dependent resource, model, foreign key)]
+DEPENDENTS = {
+    ('authors', 'name'): [('books', Book, 'author_id')],
+    ('books', 'title'): [('loans', LoanHistory, 'book_id')],
+    ('borrowers', 'name'): [('loans', LoanHistory, 'borrower_id')],
+}
+
+
+class ChangeLogCompacted(Exception):
+    """The cursor is older than what compaction kept; the client has to reload its lists"""
+
+
+def _note(session, resource, id, action):
+    """Add a change to the session's pending ones; a row inserted and deleted in one transaction drops out"""
+    pending = session.info.setdefault('changes', {})
+    key = (resource, id)
+    previous = pending.get(key)
+    if previous == 'insert' and action == 'delete':
+        del pending[key]
+    elif previous != 'insert':
+        pending[key] = action
+
+
+def record_changes(resource, ids, action='update'):
+    """Note that rows ``ids`` of ``resource`` changed; logged when the transaction commits"""
+    session = db.session()
+    for id in ids:
+        _note(session, resource, id, action)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _record_flushed(session, flush_context):
+    for objects, action in ((session.new, 'insert'), (session.dirty, 'update'), (session.deleted, 'delete')):
+        for obj in objects:
+            resource = getattr(obj, '__tablename__', None)
+            if resource not in SYNCED_RESOURCES:
+                continue
+            if action == 'update' and not session.is_modified(obj, include_collections=False):
+                continue
+            _note(session, resource, obj.id, action)
+            for (source, column), dependents in DEPENDENTS.items():
+                if source == resource and (action == 'delete' or inspect(obj).attrs[column].history.has_changes()):
+                    session.info.setdefault('dependents', set()).add((source, column, obj.id))
+
+
+def _note_dependents(session):
+    """Note the rows showing a denormalized column that changed in this transaction as updated"""
+    sources = {}
+    for source, column, id in session.info.pop('dependents', ()):
+        sources.setdefault((source, column), set()).add(id)
+    for key, ids in sources.items():
+        for resource, model, foreign_key in DEPENDENTS[key]:
+            for id in session.scalars(select(model.id).where(getattr(model, foreign_key).in_(ids))):
+                _note(session, resource, id, 'update')
+
+
+@event.listens_for(RoutingSession, 'before_commit')
+def _write_changes(session):
+    # Flush first: the ORM changes of this commit are only seen once they are flushed
+    session.flush()
+    _note_dependents(session)
+    pending = session.info.pop('changes', None)
+    if not pending:
+        return
+    if session.get_bind().dialect.name == 'postgresql':
+        session.execute(select(func.pg_advisory_xact_lock(CHANGE_LOG_LOCK)))
+    now = datetime.utcnow()
+    session.execute(insert(Change), [
+        {'resource': resource, 'resource_id': id, 'action': action, 'created_at': now}
+        for (resource, id), action in pending.items()
+    ])
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('changes', None)
+    session.info.pop('dependents', None)
+
+
+# The statements behind latest_cursor() and changes_since(), also run by the async API (app/async_api.py)
+LATEST_CHANGE = select(func.coalesce(func.max(Change.id), 0))
+COMPACTED_THROUGH = select(ChangeLogState.compacted_through)
+
+
+def latest_cursor():
+    """The id of the newest change, a cursor that skips everything logged so far"""
+    return max(db.session.scalar(LATEST_CHANGE), compacted_through())
+
+
+def compacted_through():
+    return db.session.scalar(COMPACTED_THROUGH) or 0
+
+
+def change_rows(since, limit, resources=None):
+    """The changes after ``since``, oldest first; one more than ``limit`` to tell whether more follow"""
+    query = select(Change.id, Change.resource, Change.resource_id, Change.action).where(Change.id > since)
+    if resources:
+        query = query.where(Change.resource.in_(resources))
+    return query.order_by(Change.id).limit(limit + 1)
+
+
+def data_statements(rows):
+    """``{resource: select()}`` loading the current data of the rows the changes in ``rows`` are about"""
+    wanted = {}
+    for _, resource, resource_id, _ in rows:
+        wanted.setdefault(resource, set()).add(resource_id)
+    return {
+        resource: SERIALIZERS[resource].statement().where(SERIALIZERS[resource].model.id.in_(ids))
+        for resource, ids in wanted.items()
+    }
+
+
+def build_changes(rows, found, since, more):
+    """The ``(changes, cursor, more)`` of changes_since from the change rows and the data rows found"""
+    data = {}
+    for resource, serialized in found.items():
+        serializer = SERIALIZERS[resource]
+        for values in serializer.values(serialized):
+            record = dict(zip(serializer.keys, values))
+            data[(resource, record['id'])] = record
+    changes = [
+        {'id': id, 'resource': resource, 'resource_id': resource_id, 'action': action,
+         'data': data.get((resource, resource_id))}
+        for id, resource, resource_id, action in rows
+    ]
+    return changes, rows[-1].id if rows else since, more
+
+
+def changes_since(since, limit, resources=None):
+    """Up to ``limit`` changes after ``since``, oldest first, with each row's current data.
+
+    ``data`` is the row as its list endpoint serializes it now, or None once
+    it has been deleted; several changes to a row between two syncs all carry
+    its latest state. Returns ``(changes, cursor, more)``. Raises
+    ChangeLogCompacted when changes after ``since`` may already be gone.
+    """
+    if since < compacted_through():
+        raise ChangeLogCompacted(since)
+    rows = db.session.execute(change_rows(since, limit, resources)).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    found = {resource: db.session.execute(statement).all() for resource, statement in data_statements(rows).items()}
+    return build_changes(rows, found, since, more)
+
+
+def compact_changes(before=None, batch_size=None):
+    """Keep the change log bounded.
+
+    Changes superseded by a later change to the same row are deleted, since
+    a client syncing past both only needs the later one. Changes logged
+    before ``before`` (CHANGE_LOG_RETENTION_DAYS ago by default) are deleted
+    outright and the log's ``compacted_through`` mark moved past them, so
+    clients with an older cursor get a 410 and reload. Works through the id
+    range ``batch_size`` ids at a time, one commit per batch. Returns the
+    number of changes deleted.
+    """
+    before = before or datetime.utcnow() - timedelta(days=current_app.config['CHANGE_LOG_RETENTION_DAYS'])
+    batch_size = batch_size or current_app.config['CHANGE_COMPACT_BATCH_SIZE']
+
+    # Move the mark before deleting, so no reader is served a log with a hole in it
+    expired_through = db.session.scalar(select(func.max(Change.id)).where(Change.created_at < before))
+    if expired_through is not None and expired_through > compacted_through():
+        state = db.session.get(ChangeLogState, 1)
+        if state is None:
+            db.session.add(ChangeLogState(id=1, compacted_through=expired_through))
+        else:
+            state.compacted_through = expired_through
+        db.session.commit()
+
+    first_id, last_id = db.session.execute(select(func.min(Change.id), func.max(Change.id))).one()
+    deleted = 0
+    if first_id is None:
+        return deleted
+    newer = aliased(Change)
+    superseded = (
+        select(newer.id)
+        .where(newer.resource == Change.resource, newer.resource_id == Change.resource_id, newer.id > Change.id)
+        .exists()
+    )
+    for start in range(first_id, last_id + 1, batch_size):
+        batch = Change.id.between(start, start + batch_size - 1)
+        if expired_through is not None and start <= expired_through:
+            condition = (Change.id <= expired_through) | superseded
+        else:
+            condition = superseded
+        result = db.session.execute(delete(Change).where(batch, condition)
+                                    .execution_options(synchronize_session=False))
+        deleted += result.rowcount
+        db.session.commit()
+    return deleted
@@ -0,0 +1,291 @@
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, bindparam, case, delete, func, or_, select, update
+
+from app.changes import record_changes
+from app.extensions import db, response_cache
+from app.models.models import Book, Borrower, Hold, Loan
+from app.overdue import fine_amount
+from app.stats import record_checkouts, record_returns
+
+# Matched as literals so the planner can use the partial indexes on holds
+WAITING = db.literal_column("'waiting'")
+READY = db.literal_column("'ready'")
+
+
+def _not_before(column, now):
+    """``now``, unless ``column`` is later: a checkout that commits late must not move last_loaned_at back"""
+    return case((column > now, column), else_=now)
+
+
+class CirculationError(Exception):
+    """A checkout, return or hold that cannot go ahead; carries the HTTP status to answer with"""
+
+    def __init__(self, message, status_code=400, book_ids=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.book_ids = book_ids
+
+    def to_dict(self):
+        data = {'error': str(self)}
+        if self.book_ids:
+            data['book_ids'] = self.book_ids
+        return data
+
+
+def checkout_books(borrower_id, book_ids, days_to_return=14):
+    """Lend ``book_ids`` to a borrower and return the new Loan objects.
+
+    The borrower's counters are bumped by one conditional UPDATE that also
+    enforces MAX_ACTIVE_LOANS and locks the borrower row; the title rows are
+    locked next, before any hold is touched. A copy set aside
+    for the borrower by a ready hold is handed over; otherwise a copy is
+    claimed from the shelf with another conditional UPDATE, so two
+    concurrent checkouts cannot both take the last copy: the database only
+    lets one of them decrement ``available_copies`` past it. The caller owns
+    the transaction; on failure the session has been rolled back and
+    CirculationError raised.
+    """
+    book_ids = list(dict.fromkeys(book_ids))
+    if not book_ids:
+        raise CirculationError('No books to check out')
+
+    now = datetime.utcnow()
+    limit = current_app.config['MAX_ACTIVE_LOANS']
+    borrower = (
+        update(Borrower)
+        .where(Borrower.id == borrower_id)
+        .values(active_loans=Borrower.active_loans + len(book_ids),
+                total_loans=Borrower.total_loans + len(book_ids),
+                last_loaned_at=_not_before(Borrower.last_loaned_at, now))
+        .execution_options(synchronize_session=False)
+    )
+    if limit:
+        borrower = borrower.where(Borrower.active_loans + len(book_ids) <= limit)
+    if db.session.execute(borrower).rowcount != 1:
+        db.session.rollback()
+        _raise_borrower_failure(borrower_id, limit)
+    record_changes('borrowers', [borrower_id])
+    # Titles before their holds, the order release_copies() and place_hold() lock them in
+    db.session.execute(select(Book.id).where(Book.id.in_(book_ids)).order_by(Book.id).with_for_update())
+
+    # The borrower's own holds on these titles are fulfilled; ready ones come with their copy
+    held = db.session.execute(
+        update(Hold)
+        .where(Hold.borrower_id == borrower_id, Hold.book_id.in_(book_ids), Hold.status.in_([WAITING, READY]))
+        .values(status='fulfilled', closed_at=now)
+        .returning(Hold.book_id, Hold.ready_at)
+        .execution_options(synchronize_session=False)
+    ).all()
+    set_aside = {book_id for book_id, ready_at in held if ready_at is not None}
+    from_shelf = [book_id for book_id in book_ids if book_id not in set_aside]
+    counters = dict(active_loans=Book.active_loans + 1, total_loans=Book.total_loans + 1,
+                    last_loaned_at=_not_before(Book.last_loaned_at, now))
+    if from_shelf:
+        claimed = db.session.execute(
+            update(Book)
+            .where(Book.id.in_(from_shelf), Book.available_copies > 0)
+            .values(available_copies=Book.available_copies - 1, available=Book.available_copies > 1, **counters)
+            .execution_options(synchronize_session=False)
+        )
+        if claimed.rowcount != len(from_shelf):
+            db.session.rollback()
+            _raise_checkout_failure(from_shelf)
+    if set_aside:
+        db.session.execute(
+            update(Book).where(Book.id.in_(set_aside)).values(**counters)
+            .execution_options(synchronize_session=False))
+    record_changes('books', book_ids)
+
+    today = now.date()
+    loans = [
+        Loan(book_id=book_id, borrower_id=borrower_id, loan_date=today,
+             due_date=today + timedelta(days=days_to_return), status='active', created_at=now)
+        for book_id in book_ids
+    ]
+    db.session.add_all(loans)
+    db.session.flush()
+    record_checkouts(book_ids, today)
+    return loans
+
+
+def _raise_borrower_failure(borrower_id, limit):
+    # Only the failure path pays for working out what went wrong
+    if db.session.get(Borrower, borrower_id) is None:
+        raise CirculationError(f'Borrower with ID {borrower_id} does not exist', 404)
+    raise CirculationError(f'Borrower has reached the limit of {limit} active loans', 400)
+
+
+def _raise_checkout_failure(book_ids):
+    found = dict(db.session.execute(
+        select(Book.id, Book.available_copies).where(Book.id.in_(book_ids))).all())
+    missing = [book_id for book_id in book_ids if book_id not in found]
+    if missing:
+        raise CirculationError('Book does not exist', 404, missing)
+    unavailable = [book_id for book_id in book_ids if not found[book_id]] or book_ids
+    raise CirculationError('Book is not available for loan', 400, unavailable)
+
+
+def return_loans(*criteria):
+    """Close the outstanding loans matching ``criteria`` and pass their copies on.
+
+    Late returns are charged their final fine. Each copy goes to the next
+    hold on its title, or back on the shelf when nobody is waiting. Returns
+    ``(loan_id, book_id)`` rows for the loans that were closed; a loan that
+    was already returned, even by a concurrent request, is simply not
+    matched.
+    """
+    today = datetime.utcnow().date()
+    rows = db.session.execute(
+        update(Loan)
+        .where(Loan.outstanding(), *criteria)
+        .values(status='returned', return_date=today, fine=fine_amount(today))
+        .returning(Loan.id, Loan.book_id, Loan.borrower_id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if rows:
+        record_changes('loans', [loan_id for loan_id, _, _ in rows])
+        # Borrowers before books, the order checkout_books locks them in
+        for borrower_id, n in Counter(borrower_id for _, _, borrower_id in rows).items():
+            db.session.execute(
+                update(Borrower)
+                .where(Borrower.id == borrower_id)
+                .values(active_loans=Borrower.active_loans - n)
+                .execution_options(synchronize_session=False)
+            )
+            record_changes('borrowers', [borrower_id])
+        book_ids = [book_id for _, book_id, _ in rows]
+        release_copies(Counter(book_ids), returned=True)
+        record_returns(book_ids, today)
+    return [(loan_id, book_id) for loan_id, book_id, _ in rows]
+
+
+def release_copies(counts, returned=False):
+    """Hand freed copies ``{book_id: n}`` to the next holds in line; the rest go back on the shelf.
+
+    The next holds of a title are read from the ix_holds_queue index and
+    marked ready by one UPDATE, so allocation costs the same however long
+    the queue is. The title rows are locked first, which serializes this
+    with place_hold() and with other releases of the same title, so a hold
+    is never made ready twice. With ``returned`` the copies come back from
+    loans, whose books' active_loans drop by as many. Returns the ids of
+    the holds made ready.
+    """
+    if not counts:
+        return []
+    db.session.execute(select(Book.id).where(Book.id.in_(counts)).order_by(Book.id).with_for_update())
+    now = datetime.utcnow()
+    ready, rows = [], []
+    for book_id, n in counts.items():
+        queue = (
+            select(Hold.id)
+            .where(Hold.book_id == book_id, Hold.status == WAITING)
+            .order_by(Hold.priority.desc(), Hold.id)
+            .limit(n)
+        )
+        allocated = db.session.scalars(
+            update(Hold)
+            .where(Hold.id.in_(queue), Hold.status == WAITING)
+            .values(status='ready', ready_at=now)
+            .returning(Hold.id)
+            .execution_options(synchronize_session=False)
+        ).all()
+        ready += allocated
+        rows.append({'_id': book_id, '_shelved': n - len(allocated), '_returned': n if returned else 0})
+    books = Book.__table__
+    shelved = books.c.available_copies + bindparam('_shelved')
+    db.session.execute(
+        update(books)
+        .where(books.c.id == bindparam('_id'))
+        .values(available_copies=shelved, available=shelved > 0,
+                active_loans=books.c.active_loans - bindparam('_returned')),
+        rows,
+    )
+    record_changes('books', counts)
+    return ready
+
+
+def add_copies(book_id, n):
+    """Change how many copies of a title the library owns; new copies go to waiting holds first"""
+    if n > 0:
+        db.session.execute(update(Book).where(Book.id == book_id).values(copies=Book.copies + n)
+                           .execution_options(synchronize_session=False))
+        release_copies({book_id: n})
+    elif n < 0:
+        removed = db.session.execute(
+            update(Book)
+            .where(Book.id == book_id, Book.available_copies + n >= 0)
+            .values(copies=Book.copies + n, available_copies=Book.available_copies + n,
+                    available=Book.available_copies + n > 0)
+            .execution_options(synchronize_session=False)
+        )
+        if removed.rowcount != 1:
+            raise CirculationError('Only copies on the shelf can be removed; the rest are on loan or on hold')
+        record_changes('books', [book_id])
+
+
+def place_hold(borrower_id, book_id, priority=0):
+    """Queue a borrower for a title with no copy on the shelf and return the new Hold"""
+    if db.session.get(Borrower, borrower_id) is None:
+        raise CirculationError(f'Borrower with ID {borrower_id} does not exist', 404)
+    # Locking the title row serializes this with release_copies(), so no copy is shelved past a new hold
+    available = db.session.scalar(select(Book.available_copies).where(Book.id == book_id).with_for_update())
+    if available is None:
+        raise CirculationError('Book does not exist', 404, [book_id])
+    if available > 0:
+        raise CirculationError('A copy is available; check it out instead', 400, [book_id])
+    already = select(Hold.id).where(
+        Hold.book_id == book_id, Hold.borrower_id == borrower_id, Hold.status.in_([WAITING, READY]))
+    if db.session.scalar(already) is not None:
+        raise CirculationError('Borrower already has a hold on this book', 400, [book_id])
+    hold = Hold(book_id=book_id, borrower_id=borrower_id, priority=priority)
+    db.session.add(hold)
+    db.session.flush()
+    return hold
+
+
+def queue_position(hold):
+    """1-based place of a waiting hold in its title's queue, or None once it has left the queue"""
+    if hold.status != 'waiting':
+        return None
+    ahead = db.session.scalar(
+        select(func.count())
+        .where(Hold.book_id == hold.book_id, Hold.status == WAITING,
+               or_(Hold.priority > hold.priority, and_(Hold.priority == hold.priority, Hold.id < hold.id)))
+    )
+    return ahead + 1
+
+
+def close_holds(status, *criteria):
+    """Move the open holds matching ``criteria`` to ``status``, passing on copies set aside for them.
+
+    Returns the number of holds closed.
+    """
+    now = datetime.utcnow()
+    closed = db.session.execute(
+        update(Hold)
+        .where(Hold.status.in_([WAITING, READY]), *criteria)
+        .values(status=status, closed_at=now)
+        .returning(Hold.book_id, Hold.ready_at)
+        .execution_options(synchronize_session=False)
+    ).all()
+    release_copies(Counter(book_id for book_id, ready_at in closed if ready_at is not None))
+    return len(closed)
+
+
+def expire_holds(now=None):
+    """Expire ready holds not picked up within HOLD_PICKUP_DAYS, pass their copies on and commit"""
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=current_app.config['HOLD_PICKUP_DAYS'])
+    expired = close_holds('expired', Hold.status == READY, Hold.ready_at < cutoff)
+    db.session.commit()
+    response_cache.invalidate('holds', 'books')
+    return expired
+
+
+def delete_holds(*criteria):
+    """Delete the holds matching ``criteria`` outright, passing on copies set aside for them"""
+    close_holds('cancelled', *criteria)
+    db.session.execute(delete(Hold).where(*criteria).execution_options(synchronize_session=False))
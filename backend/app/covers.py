@@ -0,0 +1,340 @@
+import hashlib
+import http.client
+import io
+import ipaddress
+import os
+import socket
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import urlsplit
+
+from flask import current_app, send_file
+from werkzeug.utils import import_string
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # covers are still cached and served, only not resized
+    Image = None
+
+# Cover images for the catalogue, served from our own origin. Each remote
+# image_url is fetched once and kept in an on-disk cache shared by all
+# workers; resized variants are made from it on first request and cached
+# next to it. Files are keyed by a hash of the URL, so editing a book's
+# image_url simply misses the cache. The least recently served files are
+# evicted once the cache outgrows COVER_CACHE_MAX_BYTES.
+
+PLACEHOLDER_PATH = os.path.join(os.path.dirname(__file__), 'static', 'cover-placeholder.svg')
+
+# Formats accepted from upstream, by their leading bytes; SVG is refused as it can carry scripts
+IMAGE_SIGNATURES = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+]
+
+# Larger images are refused rather than decoded
+MAX_PIXELS = 40_000_000
+
+# Threads of one worker resizing the same file wait for each other
+_LOCKS = [threading.Lock() for _ in range(64)]
+
+
+def cover_version(url):
+    """Short fingerprint of an image_url (32-bit FNV-1a, as computed by the frontend) for ?v="""
+    value = 0x811c9dc5
+    for byte in url.encode():
+        value = ((value ^ byte) * 0x01000193) & 0xffffffff
+    return f'{value:08x}'
+
+
+class CoverError(Exception):
+    """A cover that cannot be fetched or is not an acceptable image"""
+
+
+def image_type(data):
+    """The MIME type of raster image bytes, or None"""
+    for signature, mimetype in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return mimetype
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+
+def _check_host(url):
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise CoverError(f'Unsupported cover URL {url}')
+
+
+def _connect_public(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None):
+    # Resolves the host once, refuses it unless every address is public and
+    # connects to one of the addresses checked, so a second lookup cannot
+    # answer differently (DNS rebinding)
+    host, port = address
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        raise CoverError(f'Cannot resolve {host}: {e}')
+    for info in infos:
+        if not ipaddress.ip_address(info[4][0].split('%')[0]).is_global:
+            raise CoverError(f'Refusing to fetch a cover from non-public address {info[4][0]}')
+    error = None
+    for info in infos:
+        try:
+            return socket.create_connection((info[4][0], port), timeout, source_address)
+        except OSError as e:
+            error = e
+    raise error
+
+
+def _pinned(connection_class):
+    def connection(host, **kwargs):
+        # Only the socket is redirected: the Host header, SNI and certificate check still use the hostname
+        conn = connection_class(host, **kwargs)
+        conn._create_connection = _connect_public
+        return conn
+    return connection
+
+
+class _PublicHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_pinned(http.client.HTTPConnection), req)
+
+
+class _PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_pinned(http.client.HTTPSConnection), req, context=self._context)
+
+
+class _CheckedRedirects(urllib.request.HTTPRedirectHandler):
+    """Refuses redirects to anything but HTTP(S); their hosts are checked on connecting"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        _check_host(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+def fetch_url(url, timeout, max_bytes, allow_private=False):
+    """The default cover fetcher: GET ``url`` over HTTP(S) and return the body.
+
+    Only public addresses are contacted unless ``allow_private``, so a book's
+    image_url cannot be used to reach internal services; the check is made on
+    the address actually connected to, and proxies from the environment are
+    not used. Raises CoverError.
+    Fetchers are looked up from COVER_FETCHER and called with these
+    arguments, so tests and special deployments can plug in their own.
+    """
+    _check_host(url)
+    handlers = [_CheckedRedirects()]
+    if not allow_private:
+        handlers += [urllib.request.ProxyHandler({}), _PublicHTTPHandler(), _PublicHTTPSHandler()]
+    opener = urllib.request.build_opener(*handlers)
+    request = urllib.request.Request(url, headers={'User-Agent': 'library-manager-covers/1.0', 'Accept': 'image/*'})
+    try:
+        with opener.open(request, timeout=timeout) as response:
+            data = response.read(max_bytes + 1)
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        raise CoverError(f'Cannot fetch {url}: {e}')
+    if len(data) > max_bytes:
+        raise CoverError(f'Cover at {url} is larger than {max_bytes} bytes')
+    return data
+
+
+class CoverCache:
+    """On-disk LRU cache of cover images and their resized variants.
+
+    ``COVER_SIZES`` maps variant names to a maximum width (the height may be
+    half as much again). Failed fetches are remembered for
+    COVER_RETRY_SECONDS so a dead host is not asked on every page view.
+    """
+
+    def __init__(self, app=None):
+        self.directory = None
+        self.max_bytes = None
+        self.fetcher = None
+        self._size = None  # bytes on disk, estimated between scans
+        self._size_lock = threading.Lock()
+        self._fetching = {}  # original path -> Event set when its fetch ends
+        self._fetching_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.directory = app.config['COVER_CACHE_DIR'] or os.path.join(tempfile.gettempdir(), 'library-covers')
+        self.max_bytes = app.config['COVER_CACHE_MAX_BYTES']
+        fetcher = app.config['COVER_FETCHER']
+        self.fetcher = import_string(fetcher) if isinstance(fetcher, str) else fetcher
+        os.makedirs(self.directory, exist_ok=True)
+        app.extensions['covers'] = self
+
+    def response(self, url, size, max_age):
+        """A send_file response with the cover at ``url`` in variant ``size``, or the placeholder.
+
+        The file is sent with send_file, which hands it to the server's
+        wsgi.file_wrapper (sendfile(2) under gunicorn) or to the front end
+        proxy with USE_X_SENDFILE, instead of reading it into Python. The
+        ETag names the cached file, which never changes once written.
+        """
+        response = None
+        for _ in range(2):  # a file evicted between lookup and open is fetched again
+            if not url:
+                break
+            try:
+                path, mimetype = self.get(url, size)
+                stat = os.stat(path)
+                etag = f'{os.path.basename(path)[:16]}{size}-{stat.st_size:x}-{stat.st_mtime_ns:x}'
+                response = send_file(path, mimetype=mimetype, conditional=True, etag=etag,
+                                     last_modified=stat.st_mtime, max_age=max_age)
+                break
+            except FileNotFoundError:
+                continue
+            except CoverError as e:
+                current_app.logger.info('Cover fallback: %s', e)
+                break
+        if response is None:
+            response = send_file(PLACEHOLDER_PATH, mimetype='image/svg+xml', conditional=True, max_age=300)
+        else:
+            response.cache_control.public = True
+            if max_age >= 31536000:
+                response.cache_control.immutable = True
+        response.headers['X-Content-Type-Options'] = 'nosniff'
+        return response
+
+    def get(self, url, size='original'):
+        """Path and MIME type of the cached variant, fetching and resizing as needed"""
+        key = hashlib.sha256(url.encode()).hexdigest()
+        folder = os.path.join(self.directory, key[:2])
+        original = os.path.join(folder, f'{key}.original')
+        if size != 'original' and Image is None:
+            size = 'original'
+        path = os.path.join(folder, f'{key}.{size}')
+        lock = _LOCKS[int(key[:2], 16) % len(_LOCKS)]
+        with lock:
+            if os.path.exists(path):
+                return self._hit(path)
+        if not os.path.exists(original):
+            # Not under the striped lock, so a slow host only holds up requests for its own covers
+            self._fetch_once(url, folder, original)
+        with lock:
+            if os.path.exists(path):
+                return self._hit(path)
+            if size != 'original':
+                self._resize(original, path, current_app.config['COVER_SIZES'][size])
+            return self._hit(path)
+
+    def _fetch_once(self, url, folder, original):
+        # Threads wanting the same cover wait for the one fetching it instead of fetching it again
+        with self._fetching_lock:
+            done = self._fetching.get(original)
+            if done is None:
+                self._fetching[original] = threading.Event()
+        if done is not None:
+            done.wait()
+            if not os.path.exists(original):
+                self._fetch(url, folder, original)  # raises the failure it left behind
+            return
+        try:
+            self._fetch(url, folder, original)
+        finally:
+            with self._fetching_lock:
+                self._fetching.pop(original).set()
+
+    def _fetch(self, url, folder, original):
+        failed = original + '.failed'
+        try:
+            if time.time() - os.stat(failed).st_mtime < current_app.config['COVER_RETRY_SECONDS']:
+                raise CoverError(f'Cover at {url} failed recently')
+        except FileNotFoundError:
+            pass
+        os.makedirs(folder, exist_ok=True)
+        try:
+            data = self.fetcher(url, timeout=current_app.config['COVER_FETCH_TIMEOUT'],
+                                max_bytes=current_app.config['COVER_MAX_BYTES'],
+                                allow_private=current_app.config['COVER_ALLOW_PRIVATE_HOSTS'])
+            if image_type(data) is None:
+                raise CoverError(f'Cover at {url} is not a JPEG, PNG, GIF or WebP image')
+            if Image is not None:
+                self._check_image(data, url)
+        except CoverError:
+            self._write(failed, b'')
+            raise
+        self._write(original, data)
+
+    def _check_image(self, data, url):
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                if image.width * image.height > MAX_PIXELS:
+                    raise CoverError(f'Cover at {url} is too large to decode')
+                image.verify()
+        except CoverError:
+            raise
+        except Exception as e:
+            raise CoverError(f'Cover at {url} is not a readable image: {e}')
+
+    def _resize(self, original, variant, width):
+        with Image.open(original) as image:
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((width, width * 3 // 2))
+            buffer = io.BytesIO()
+            if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+                image.save(buffer, 'PNG', optimize=True)
+            else:
+                image.convert('RGB').save(buffer, 'JPEG', quality=85, optimize=True, progressive=True)
+        self._write(variant, buffer.getvalue())
+
+    def _write(self, path, data):
+        # Write under a temporary name and rename, so other workers never read half a file
+        fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temporary, path)
+        with self._size_lock:
+            if self._size is None:
+                self._size = self._scan()[1]
+            else:
+                self._size += len(data)
+            over = self._size > self.max_bytes
+        if over:
+            self.evict()
+
+    def _hit(self, path):
+        # The access time orders eviction; the modification time stays the file's ETag
+        stat = os.stat(path)
+        os.utime(path, ns=(time.time_ns(), stat.st_mtime_ns))
+        with open(path, 'rb') as f:
+            mimetype = image_type(f.read(16))
+        return path, mimetype
+
+    def _scan(self):
+        files, total = [], 0
+        for folder in os.scandir(self.directory):
+            if not folder.is_dir():
+                continue
+            for entry in os.scandir(folder.path):
+                if entry.name.startswith('tmp'):
+                    continue
+                stat = entry.stat()
+                files.append((stat.st_atime_ns, stat.st_size, entry.path))
+                total += stat.st_size
+        return files, total
+
+    def evict(self):
+        """Delete the least recently served files until the cache is down to 90% of COVER_CACHE_MAX_BYTES"""
+        files, total = self._scan()
+        target = self.max_bytes * 9 // 10
+        for _, size, path in sorted(files):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        with self._size_lock:
+            self._size = total
+        return total
@@ -0,0 +1,134 @@
+import random
+import time
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# The rollup upserts (app/stats.py), month and overdue arithmetic and archive
+# batches are written for these two; other databases are refused at startup
+# rather than failing on the first checkout
+SUPPORTED_BACKENDS = ('postgresql', 'sqlite')
+
+
+def engine_options(url, config):
+    """Pool and timeout settings for the engine of one database URL"""
+    url = sa.engine.make_url(url)
+    options = {'pool_pre_ping': config['DB_POOL_PRE_PING'], 'pool_recycle': config['DB_POOL_RECYCLE']}
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        return options  # one shared in-memory connection, nothing to size
+    options.update(
+        pool_size=config['DB_POOL_SIZE'],
+        max_overflow=config['DB_MAX_OVERFLOW'],
+        pool_timeout=config['DB_POOL_TIMEOUT'],
+    )
+    timeout = config['DB_STATEMENT_TIMEOUT_MS']
+    if timeout and url.get_backend_name() == 'postgresql':
+        options['connect_args'] = {'options': f'-c statement_timeout={int(timeout)}'}
+    return options
+
+
+def configure_engines(app, db):
+    """Apply the pool settings and add a ``replicaN`` bind per READ_REPLICA_URLS entry.
+
+    Must run before ``db.init_app``. Explicit SQLALCHEMY_ENGINE_OPTIONS win.
+    Raises RuntimeError for a database other than PostgreSQL or SQLite.
+    """
+    config = app.config
+    for url in (config['SQLALCHEMY_DATABASE_URI'], *config['READ_REPLICA_URLS']):
+        backend = sa.engine.make_url(url).get_backend_name()
+        if backend not in SUPPORTED_BACKENDS:
+            raise RuntimeError(f'{backend} databases are not supported; use PostgreSQL or SQLite')
+    config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(config['SQLALCHEMY_DATABASE_URI'], config))
+    binds = config.setdefault('SQLALCHEMY_BINDS', {})
+    replicas = []
+    for i, url in enumerate(config['READ_REPLICA_URLS']):
+        key = f'replica{i}'
+        binds[key] = {'url': url, **engine_options(url, config)}
+        db.metadatas.setdefault(key, sa.MetaData())  # no tables of its own; keeps create_all() working
+        replicas.append(key)
+    app.extensions['read_replicas'] = replicas
+    if replicas:
+        app.after_request(_stick_to_primary)
+
+
+def _stick_to_primary(response):
+    # After a write, this client reads from the primary until replication has caught up.
+    # /api/batch passes on the cookies of its write sub-requests instead
+    if request.method not in READ_METHODS and response.status_code < 400 and request.blueprint != 'batch':
+        seconds = current_app.config['REPLICA_STICKY_SECONDS']
+        response.set_cookie(current_app.config['REPLICA_STICKY_COOKIE'], str(int(time.time() + seconds)),
+                            max_age=seconds, httponly=True, samesite=current_app.config['REPLICA_STICKY_SAMESITE'],
+                            secure=current_app.config['REPLICA_STICKY_SAMESITE'] == 'None')
+    return response
+
+
+def _replica_for_request():
+    """The replica engine serving the current request, or None for the primary"""
+    if not has_request_context() or request.method not in READ_METHODS:
+        return None
+    if '_read_replica' not in g:
+        replicas = current_app.extensions.get('read_replicas')
+        sticky = request.cookies.get(current_app.config['REPLICA_STICKY_COOKIE'], '')
+        if not replicas or (sticky.isdigit() and int(sticky) > time.time()):
+            g._read_replica = None
+        else:
+            # One replica per request, so every query in it sees the same snapshot
+            g._read_replica = random.choice(replicas)
+    return g._read_replica
+
+
+def read_from_primary():
+    """Serve the remaining reads of this app context from the primary"""
+    g._read_replica = None
+
+
+class RoutingSession(Session):
+    """Sends the reads of GET requests to a read replica.
+
+    Writes, flushes and every query outside a read request use the bind the
+    model asks for (the primary). A client that has just written is
+    routed to the primary for REPLICA_STICKY_SECONDS (tracked by cookie) so it
+    reads its own writes.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not isinstance(clause, UpdateBase):
+            replica = _replica_for_request()
+            if replica is not None:
+                return self._db.engines[replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def commit(self):
+        if self.info.get('deferred_commits'):
+            # Inside deferred_commits(): keep the work in the open transaction, but
+            # expire like a commit so callers reload what their UPDATEs changed
+            self.flush()
+            self.expire_all()
+            return
+        super().commit()
+
+    def rollback(self):
+        if self.info.get('deferred_commits'):
+            self.info['rolled_back'] = True
+        super().rollback()
+
+    @contextmanager
+    def deferred_commits(self):
+        """Run several units of work as one transaction.
+
+        Within the block commit() only flushes, so everything stays in one
+        transaction for the caller to commit or roll back afterwards. Yields a
+        callable that tells whether anything in the block rolled back, which
+        discards the earlier work too.
+        """
+        self.info['deferred_commits'] = True
+        self.info['rolled_back'] = False
+        try:
+            yield lambda: self.info['rolled_back']
+        finally:
+            del self.info['deferred_commits'], self.info['rolled_back']
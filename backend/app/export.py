@@ -0,0 +1,55 @@
+import csv
+import io
+
+from flask import Response, current_app, stream_with_context
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _ndjson_chunks(serializer, rows, chunk_size):
+    for batch in _batches(rows, chunk_size):
+        yield serializer.encode_lines(batch)
+
+
+def _csv_chunks(serializer, rows, chunk_size):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for i, batch in enumerate(_batches(rows, chunk_size)):
+        if i == 0:
+            writer.writerow(serializer.csv_header)
+        writer.writerows(serializer.csv_rows(batch))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def export_response(query, serializer, fmt, filename):
+    """Stream every row of ``query`` (built from ``serializer.query()``) as NDJSON or CSV.
+
+    Rows are fetched through a server-side cursor ``EXPORT_CHUNK_SIZE`` at a
+    time and written out as they arrive, so worker memory stays flat however
+    large the table is.
+    """
+    chunk_size = current_app.config.get('EXPORT_CHUNK_SIZE', 1000)
+    rows = query.yield_per(chunk_size)
+    if fmt == 'csv':
+        chunks = _csv_chunks(serializer, rows, chunk_size)
+    else:
+        chunks = _ndjson_chunks(serializer, rows, chunk_size)
+    response = Response(stream_with_context(chunks), mimetype=FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}.{fmt}'
+    return response
@@ -1,5 +1,14 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from flask_migrate import Migrate
+from app.cache import ResponseCache
+from app.covers import CoverCache
+from app.database import RoutingSession
+from app.metrics import Metrics
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 cors = CORS()
+migrate = Migrate()
+response_cache = ResponseCache()
+metrics = Metrics()
+covers = CoverCache()
@@ -0,0 +1,236 @@
+import bisect
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help); every series is labelled by route template and method
+METRICS = {
+    'library_http_requests_total': ('counter', 'HTTP requests handled, by status code'),
+    'library_http_request_duration_seconds': ('histogram', 'Time from routing to the response being returned'),
+    'library_db_queries_total': ('counter', 'SQL statements executed while handling requests'),
+    'library_db_seconds_total': ('counter', 'Time spent executing SQL statements'),
+    'library_json_seconds_total': ('counter', 'Time spent serializing JSON response bodies'),
+}
+
+
+class RequestStats:
+    __slots__ = ('started', 'queries', 'db_seconds', 'json_seconds', 'outer')
+
+    def __init__(self, outer=None):
+        self.outer = outer  # the enclosing request's stats, for /api/batch sub-requests
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.json_seconds = 0.0
+
+
+def _current():
+    return g.get('_request_stats') if has_request_context() else None
+
+
+def record_json_time(seconds):
+    """Count JSON encoding done outside the app's JSON provider"""
+    stats = _current()
+    if stats is not None:
+        stats.json_seconds += seconds
+
+
+class Registry:
+    """Counters and latency histograms for this process, updated under one lock"""
+
+    def __init__(self):
+        self.counters = {}  # (name, labels) -> value
+        self.histograms = {}  # labels -> [count per bucket..., count above the last bucket, sum]
+        self.lock = threading.Lock()
+
+    def observe(self, labels, status, stats, seconds):
+        bucket = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        with self.lock:
+            for name, value in (
+                ('library_http_requests_total', 1),
+                ('library_db_queries_total', stats.queries),
+                ('library_db_seconds_total', stats.db_seconds),
+                ('library_json_seconds_total', stats.json_seconds),
+            ):
+                key = (name, labels + (('status', status),) if name == 'library_http_requests_total' else labels)
+                self.counters[key] = self.counters.get(key, 0) + value
+            histogram = self.histograms.get(labels)
+            if histogram is None:
+                histogram = self.histograms[labels] = [0] * (len(LATENCY_BUCKETS) + 2)
+            histogram[bucket] += 1
+            histogram[-1] += seconds
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[list(labels), list(values)] for labels, values in self.histograms.items()],
+            }
+
+
+def merge(snapshots):
+    """Add up the snapshots of several workers"""
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for labels, values in snapshot['histograms']:
+            key = tuple(map(tuple, labels))
+            total = histograms.setdefault(key, [0] * len(values))
+            for i, value in enumerate(values):
+                total[i] += value
+    return counters, histograms
+
+
+def _labels(pairs):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def render(counters, histograms):
+    """Prometheus text exposition format"""
+    lines = []
+    for name, (kind, description) in METRICS.items():
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+        if kind == 'histogram':
+            for labels, values in sorted(histograms.items()):
+                cumulative = 0
+                for bound, count in zip((*LATENCY_BUCKETS, '+Inf'), values):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", bound),))} {cumulative}')
+                lines.append(f'{name}_sum{_labels(labels)} {values[-1]}')
+                lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+            continue
+        for (series, labels), value in sorted(counters.items()):
+            if series == name:
+                lines.append(f'{name}{_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+class Metrics:
+    """Per-route request, SQL and serialization metrics, served at /metrics.
+
+    Every request records its latency in a histogram and adds the number of
+    SQL statements it ran, the time they took and the time spent encoding
+    JSON to counters labelled by route template. The hot path costs a few
+    clock reads and one lock acquisition per request.
+
+    Each gunicorn worker keeps its own numbers. With ``METRICS_DIR`` set,
+    workers write a snapshot there every ``METRICS_FLUSH_INTERVAL`` seconds
+    and /metrics adds them all up, so a scrape sees the whole server; clear
+    the directory when the server is restarted. ``SLOW_QUERY_MS`` logs
+    statements slower than that, with the route that issued them.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.registry = Registry()
+        self.slow_query_seconds = None
+        self.directory = None
+        self.flush_interval = 5
+        self._flushed = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('METRICS_ENABLED', True)
+        slow_ms = app.config.get('SLOW_QUERY_MS', 0)
+        self.slow_query_seconds = slow_ms / 1000 if slow_ms else None
+        self.directory = app.config.get('METRICS_DIR')
+        self.flush_interval = app.config.get('METRICS_FLUSH_INTERVAL', 5)
+        app.extensions['metrics'] = self
+        if not self.enabled:
+            return
+
+        if not event.contains(Engine, 'before_cursor_execute', self._before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            event.listen(Engine, 'handle_error', self._handle_error)
+        self._time_json(app)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule('/metrics', 'metrics', self.expose)
+
+    def _time_json(self, app):
+        dumps = app.json.dumps
+
+        def timed_dumps(obj, **kwargs):
+            started = time.perf_counter()
+            try:
+                return dumps(obj, **kwargs)
+            finally:
+                stats = _current()
+                if stats is not None:
+                    stats.json_seconds += time.perf_counter() - started
+
+        app.json.dumps = timed_dumps
+
+    def _before_request(self):
+        g._request_stats = RequestStats(g.get('_request_stats'))
+
+    def _after_request(self, response):
+        stats = g.pop('_request_stats', None)
+        if stats is not None and stats.outer is not None:
+            g._request_stats = stats.outer
+        if stats is None or request.endpoint == 'metrics':
+            return response
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        labels = (('route', route), ('method', request.method))
+        self.registry.observe(labels, str(response.status_code), stats, time.perf_counter() - stats.started)
+        if self.directory and time.monotonic() - self._flushed > self.flush_interval:
+            self.flush()
+        return response
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = self._query_finished(conn)
+        if self.slow_query_seconds is not None and elapsed >= self.slow_query_seconds:
+            route = f'{request.method} {request.path} ({request.endpoint})' if has_request_context() else '-'
+            logger.warning('Slow query (%.1f ms) in %s: %s', elapsed * 1000, route, ' '.join(statement.split())[:1000])
+
+    def _handle_error(self, context):
+        # A failed statement never reaches after_cursor_execute; pop its start time here so the stack stays balanced
+        if context.execution_context is not None and context.connection is not None \
+                and context.connection.info.get('_query_started'):
+            self._query_finished(context.connection)
+
+    def _query_finished(self, conn):
+        elapsed = time.perf_counter() - conn.info['_query_started'].pop()
+        stats = _current()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+        return elapsed
+
+    def flush(self):
+        """Write this worker's snapshot to METRICS_DIR"""
+        self._flushed = time.monotonic()
+        path = os.path.join(self.directory, f'metrics-{os.getpid()}.json')
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(self.registry.snapshot(), f)
+        os.replace(f'{path}.tmp', path)
+
+    def expose(self):
+        if self.directory:
+            self.flush()
+            snapshots = []
+            for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+        else:
+            snapshots = [self.registry.snapshot()]
+        return Response(render(*merge(snapshots)), mimetype='text/plain; version=0.0.4')
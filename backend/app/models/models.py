@@ -1,8 +1,19 @@
 from app.extensions import db
 from datetime import datetime
 
+PLACEHOLDER_IMAGE_URL = 'https://via.placeholder.com/150x200?text=No+Image'
+
+# Loans that still have the book out; 'overdue' is set by the overdue sweeper
+OUTSTANDING_STATUSES = ('active', 'overdue')
+
+# Indexes are declared here and mirrored by the migrations in migrations/versions.
+# Composite indexes end in id so filtered lists can be keyset-paginated from the index.
+
 class Author(db.Model):
     __tablename__ = 'authors'
+    __table_args__ = (
+        db.Index('ix_authors_name', 'name', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), nullable=False)
@@ -21,6 +32,12 @@ class Author(db.Model):
 
 class Book(db.Model):
     __tablename__ = 'books'
+    __table_args__ = (
+        db.Index('ix_books_author_id', 'author_id', 'id'),
+        db.Index('ix_books_genre', 'genre', 'id'),
+        db.Index('ix_books_title', 'title', 'id'),
+        db.Index('ix_books_total_loans', 'total_loans', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(255), nullable=False)
@@ -31,7 +48,14 @@ class Book(db.Model):
     genre = db.Column(db.String(100))
     pages = db.Column(db.Integer)
     image_url = db.Column(db.Text)
+    # Copies owned and copies on the shelf; ``available`` is kept equal to available_copies > 0
+    copies = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    available_copies = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     available = db.Column(db.Boolean, default=True)
+    # Circulation counters, kept current by app/circulation.py and app/stats.py (see reconcile_counters)
+    active_loans = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total_loans = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_loaned_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     loans = db.relationship('Loan', backref='book', lazy=True)
     
@@ -47,16 +71,28 @@ class Book(db.Model):
             'genre': self.genre,
             'pages': self.pages,
             'image_url': self.image_url,
-            'available': self.available
+            'available': self.available,
+            'copies': self.copies,
+            'available_copies': self.available_copies,
+            'active_loans': self.active_loans,
+            'total_loans': self.total_loans,
+            'last_loaned_at': self.last_loaned_at.isoformat() if self.last_loaned_at else None
         }
 
 class Borrower(db.Model):
     __tablename__ = 'borrowers'
+    __table_args__ = (
+        db.Index('ix_borrowers_name', 'name', 'id'),
+        db.Index('ix_borrowers_active_loans', 'active_loans', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), nullable=False)
     email = db.Column(db.String(255), unique=True, nullable=False)
     phone = db.Column(db.String(20))
+    active_loans = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total_loans = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_loaned_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     loans = db.relationship('Loan', backref='borrower', lazy=True)
     
@@ -65,11 +101,27 @@ class Borrower(db.Model):
             'id': self.id,
             'name': self.name,
             'email': self.email,
-            'phone': self.phone
+            'phone': self.phone,
+            'active_loans': self.active_loans,
+            'total_loans': self.total_loans,
+            'last_loaned_at': self.last_loaned_at.isoformat() if self.last_loaned_at else None
         }
 
 class Loan(db.Model):
     __tablename__ = 'loans'
+    __table_args__ = (
+        db.Index('ix_loans_book_id_status', 'book_id', 'status'),
+        db.Index('ix_loans_borrower_id_status', 'borrower_id', 'status'),
+        db.Index('ix_loans_status', 'status', 'id'),
+        # Serve the active and overdue lists without touching returned loans
+        db.Index('ix_loans_outstanding_due_date', 'due_date',
+                 postgresql_where=db.text("status IN ('active', 'overdue')"),
+                 sqlite_where=db.text("status IN ('active', 'overdue')")),
+        db.Index('ix_loans_outstanding_id', 'id',
+                 postgresql_where=db.text("status IN ('active', 'overdue')"),
+                 sqlite_where=db.text("status IN ('active', 'overdue')")),
+        {'sqlite_autoincrement': True},  # never reuse the ids of archived loans
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False)
@@ -78,8 +130,14 @@ class Loan(db.Model):
     due_date = db.Column(db.Date, nullable=False)
     return_date = db.Column(db.Date)
     status = db.Column(db.String(20), default='active')
+    fine = db.Column(db.Numeric(10, 2), nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    @classmethod
+    def outstanding(cls):
+        """Filter for loans still out, inlined as literals so the planner can use the partial indexes"""
+        return cls.status.in_([db.literal_column(f"'{status}'") for status in OUTSTANDING_STATUSES])
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -90,5 +148,121 @@ class Loan(db.Model):
             'loan_date': self.loan_date.isoformat() if self.loan_date else None,
             'due_date': self.due_date.isoformat() if self.due_date else None,
             'return_date': self.return_date.isoformat() if self.return_date else None,
-            'status': self.status
+            'status': self.status,
+            'fine': float(self.fine) if self.fine is not None else 0.0
+        }
+
+class ArchivedLoan(db.Model):
+    """Returned loans moved out of loans by app/archive.py; same columns, ids kept"""
+    __tablename__ = 'loans_archive'
+    __table_args__ = (
+        db.Index('ix_loans_archive_book_id', 'book_id', 'id'),
+        db.Index('ix_loans_archive_borrower_id', 'borrower_id', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False)
+    borrower_id = db.Column(db.Integer, db.ForeignKey('borrowers.id'), nullable=False)
+    loan_date = db.Column(db.Date, nullable=False)
+    due_date = db.Column(db.Date, nullable=False)
+    return_date = db.Column(db.Date)
+    status = db.Column(db.String(20))
+    fine = db.Column(db.Numeric(10, 2), nullable=False, default=0, server_default='0')
+    created_at = db.Column(db.DateTime)
+
+# Live and archived loans as one read-only selectable, mapped like Loan, for the history reads
+LOAN_HISTORY_COLUMNS = [column.name for column in ArchivedLoan.__table__.columns]
+LoanHistory = db.aliased(Loan, db.union_all(
+    db.select(*[Loan.__table__.c[name] for name in LOAN_HISTORY_COLUMNS]),
+    db.select(ArchivedLoan.__table__),
+).subquery('loan_history'), name='LoanHistory')
+
+# Holds that still want or have a copy; a borrower has at most one per title
+OPEN_HOLD_STATUSES = ('waiting', 'ready')
+
+class Hold(db.Model):
+    """A borrower queued for a title; see app/circulation.py for the lifecycle"""
+    __tablename__ = 'holds'
+    __table_args__ = (
+        db.Index('ix_holds_borrower_id', 'borrower_id', 'id'),
+        db.Index('ix_holds_book_id', 'book_id', 'id'),
+        db.Index('ix_holds_open', 'book_id', 'borrower_id', unique=True,
+                 postgresql_where=db.text("status IN ('waiting', 'ready')"),
+                 sqlite_where=db.text("status IN ('waiting', 'ready')")),
+        db.Index('ix_holds_ready_at', 'ready_at',
+                 postgresql_where=db.text("status = 'ready'"),
+                 sqlite_where=db.text("status = 'ready'")),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False)
+    borrower_id = db.Column(db.Integer, db.ForeignKey('borrowers.id'), nullable=False)
+    # Higher priorities are served first, then first come first served
+    priority = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # waiting -> ready (a copy is set aside) -> fulfilled (checked out), or cancelled / expired
+    status = db.Column(db.String(20), nullable=False, default='waiting', server_default='waiting')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    ready_at = db.Column(db.DateTime)
+    closed_at = db.Column(db.DateTime)
+    book = db.relationship('Book')
+    borrower = db.relationship('Borrower')
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'book_id': self.book_id,
+            'book_title': self.book.title if self.book else 'Unknown',
+            'borrower_id': self.borrower_id,
+            'borrower_name': self.borrower.name if self.borrower else 'Unknown',
+            'priority': self.priority,
+            'status': self.status,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'ready_at': self.ready_at.isoformat() if self.ready_at else None,
+            'closed_at': self.closed_at.isoformat() if self.closed_at else None
         }
+
+# The queue of a title in serving order, read from the index alone when allocating a copy
+db.Index('ix_holds_queue', Hold.book_id, Hold.priority.desc(), Hold.id,
+         postgresql_where=db.text("status = 'waiting'"), sqlite_where=db.text("status = 'waiting'"))
+
+# Prefix lookups of the autocomplete fallback, lower(column) LIKE 'prefix%' (text_pattern_ops
+# makes a PostgreSQL b-tree usable for LIKE whatever the database collation)
+AUTOCOMPLETE_INDEXES = [
+    db.Index(f'ix_{column.table.name}_{column.key}_lower', db.func.lower(column).label(f'{column.key}_lower'),
+             postgresql_ops={f'{column.key}_lower': 'text_pattern_ops'})
+    for column in (Author.name, Book.title, Borrower.name, Borrower.email)
+]
+
+class MonthlyCirculation(db.Model):
+    """Loans started and returned per month, genre and author; kept current by app/stats.py"""
+    __tablename__ = 'monthly_circulation'
+    
+    month = db.Column(db.Date, primary_key=True)  # First day of the month
+    genre = db.Column(db.String(100), primary_key=True)  # '' for books without a genre
+    author_id = db.Column(db.Integer, primary_key=True)
+    loans = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    returns = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+# Resources whose inserts, updates and deletes are written to the change log
+SYNCED_RESOURCES = ('authors', 'books', 'borrowers', 'loans')
+
+class Change(db.Model):
+    """One insert, update or delete of a synced row, in commit order; see app/changes.py"""
+    __tablename__ = 'changes'
+    __table_args__ = (
+        db.Index('ix_changes_key', 'resource', 'resource_id', 'id'),
+        {'sqlite_autoincrement': True},  # never reuse the ids of compacted changes
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    resource = db.Column(db.String(20), nullable=False)  # One of SYNCED_RESOURCES
+    resource_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(10), nullable=False)  # insert, update or delete
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class ChangeLogState(db.Model):
+    """Single row: changes up to ``compacted_through`` may have been dropped by compact_changes()"""
+    __tablename__ = 'change_log_state'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    compacted_through = db.Column(db.Integer, nullable=False, default=0, server_default='0')
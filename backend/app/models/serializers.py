@@ -0,0 +1,211 @@
+import json
+import re
+import time
+from dataclasses import make_dataclass
+from operator import itemgetter
+
+from flask import current_app
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload
+
+from app.extensions import db
+from app.metrics import record_json_time
+from app.models.models import Author, Book, Borrower, Hold, Loan, LoanHistory
+
+try:
+    import orjson
+except ImportError:  # json produces the same bytes, just slower
+    orjson = None
+
+# Columns each relationship contributes to the parent's to_dict(), keyed by
+# (model name, relationship name) because the backrefs only exist once the
+# mappers are configured
+RELATED_COLUMNS = {
+    ('Book', 'author'): ('name',),
+    ('Loan', 'book'): ('title',),
+    ('Loan', 'borrower'): ('name',),
+    ('Hold', 'book'): ('title',),
+    ('Hold', 'borrower'): ('name',),
+}
+
+
+def load_related(query, *relationships):
+    """Eager-load the given many-to-one relationships in the same SELECT.
+
+    Only the columns ``to_dict()`` reads from the related row are fetched, so
+    serializing a list costs one query regardless of its length.
+    """
+    options = []
+    for rel in relationships:
+        target = rel.property.mapper.class_
+        columns = [getattr(target, name) for name in RELATED_COLUMNS[(rel.class_.__name__, rel.key)]]
+        options.append(joinedload(rel).load_only(*columns))
+    return query.options(*options)
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def _fine(value):
+    return float(value) if value is not None else 0.0
+
+
+# orjson writes non-ASCII characters (and DEL) raw, json.dumps escapes them
+_NOT_ASCII = re.compile('[^\x00-\x7e]')
+
+
+def _escape(match):
+    code = ord(match.group())
+    if code > 0xFFFF:
+        code -= 0x10000
+        return '\\u%04x\\u%04x' % (0xD800 | code >> 10, 0xDC00 | code & 0x3FF)
+    return '\\u%04x' % code
+
+
+def _ascii(data):
+    if data.isascii() and b'\x7f' not in data:
+        return data
+    return _NOT_ASCII.sub(_escape, data.decode()).encode()
+
+
+class RowSerializer:
+    """Fast path for large lists: plain column rows instead of ORM objects.
+
+    ``fields`` lists ``(key, column, convert)`` in ``to_dict()`` order. The
+    columns are selected in sorted key order, which is the order jsonify
+    writes, so each row only needs its dates and numbers converted before it
+    is wrapped in a slotted record and encoded with orjson (or json when
+    orjson is not installed). The output is byte-for-byte what
+    ``jsonify([item.to_dict() ...])`` produces.
+    """
+
+    def __init__(self, model, fields, joins=()):
+        self.model = model
+        self.csv_header = [key for key, _, _ in fields]
+        fields = sorted(fields, key=lambda field: field[0])
+        self.keys = tuple(key for key, _, _ in fields)
+        self.columns = [column.label(key) for key, column, _ in fields]
+        self.converters = [(i, convert) for i, (_, _, convert) in enumerate(fields) if convert]
+        self.joins = joins
+        self.record = make_dataclass(f'{model.__name__}Record', self.keys, slots=True)
+        self.csv_order = itemgetter(*[self.keys.index(key) for key in self.csv_header])
+
+    def query(self):
+        """A query over the serialized columns; filter, order and paginate it like Model.query"""
+        query = db.session.query(*self.columns).select_from(self.model)
+        for target, onclause in self.joins:
+            query = query.outerjoin(target, onclause)
+        return query
+
+    def statement(self):
+        """The same as query() as a session-free select(), for the async read API"""
+        statement = select(*self.columns).select_from(self.model)
+        for target, onclause in self.joins:
+            statement = statement.outerjoin(target, onclause)
+        return statement
+
+    def values(self, rows):
+        converters = self.converters
+        for row in rows:
+            values = list(row)
+            for i, convert in converters:
+                values[i] = convert(values[i])
+            yield values
+
+    def encode(self, rows):
+        """The rows as a JSON array"""
+        if orjson is not None:
+            record = self.record
+            return _ascii(orjson.dumps([record(*values) for values in self.values(rows)]))
+        keys = self.keys
+        return json.dumps([dict(zip(keys, values)) for values in self.values(rows)], separators=(',', ':')).encode()
+
+    def encode_lines(self, rows):
+        """The rows as newline-delimited JSON objects"""
+        if orjson is not None:
+            record = self.record
+            return _ascii(b''.join(orjson.dumps(record(*values)) + b'\n' for values in self.values(rows)))
+        keys = self.keys
+        return ''.join(json.dumps(dict(zip(keys, values)), separators=(',', ':')) + '\n'
+                       for values in self.values(rows)).encode()
+
+    def csv_rows(self, rows):
+        """The rows as lists in to_dict() key order, for csv.writer"""
+        return map(self.csv_order, self.values(rows))
+
+    def response(self, rows):
+        started = time.perf_counter()
+        body = self.encode(rows) + b'\n'
+        record_json_time(time.perf_counter() - started)
+        return current_app.response_class(body, mimetype='application/json')
+
+
+AUTHOR_ROWS = RowSerializer(Author, [
+    ('id', Author.id, None),
+    ('name', Author.name, None),
+    ('biography', Author.biography, None),
+    ('birth_date', Author.birth_date, _iso),
+])
+
+BORROWER_ROWS = RowSerializer(Borrower, [
+    ('id', Borrower.id, None),
+    ('name', Borrower.name, None),
+    ('email', Borrower.email, None),
+    ('phone', Borrower.phone, None),
+    ('active_loans', Borrower.active_loans, None),
+    ('total_loans', Borrower.total_loans, None),
+    ('last_loaned_at', Borrower.last_loaned_at, _iso),
+])
+
+BOOK_ROWS = RowSerializer(Book, [
+    ('id', Book.id, None),
+    ('title', Book.title, None),
+    ('author_id', Book.author_id, None),
+    ('author_name', func.coalesce(Author.name, 'Unknown'), None),
+    ('description', Book.description, None),
+    ('publication_year', Book.publication_year, None),
+    ('isbn', Book.isbn, None),
+    ('genre', Book.genre, None),
+    ('pages', Book.pages, None),
+    ('image_url', Book.image_url, None),
+    ('available', Book.available, None),
+    ('copies', Book.copies, None),
+    ('available_copies', Book.available_copies, None),
+    ('active_loans', Book.active_loans, None),
+    ('total_loans', Book.total_loans, None),
+    ('last_loaned_at', Book.last_loaned_at, _iso),
+], joins=[(Author, Author.id == Book.author_id)])
+
+
+def _loan_rows(model):
+    return RowSerializer(model, [
+        ('id', model.id, None),
+        ('book_id', model.book_id, None),
+        ('book_title', func.coalesce(Book.title, 'Unknown'), None),
+        ('borrower_id', model.borrower_id, None),
+        ('borrower_name', func.coalesce(Borrower.name, 'Unknown'), None),
+        ('loan_date', model.loan_date, _iso),
+        ('due_date', model.due_date, _iso),
+        ('return_date', model.return_date, _iso),
+        ('status', model.status, None),
+        ('fine', model.fine, _fine),
+    ], joins=[(Book, Book.id == model.book_id), (Borrower, Borrower.id == model.borrower_id)])
+
+
+LOAN_ROWS = _loan_rows(Loan)
+# Live and archived loans, for the loan history list and export
+LOAN_HISTORY_ROWS = _loan_rows(LoanHistory)
+
+HOLD_ROWS = RowSerializer(Hold, [
+    ('id', Hold.id, None),
+    ('book_id', Hold.book_id, None),
+    ('book_title', func.coalesce(Book.title, 'Unknown'), None),
+    ('borrower_id', Hold.borrower_id, None),
+    ('borrower_name', func.coalesce(Borrower.name, 'Unknown'), None),
+    ('priority', Hold.priority, None),
+    ('status', Hold.status, None),
+    ('created_at', Hold.created_at, _iso),
+    ('ready_at', Hold.ready_at, _iso),
+    ('closed_at', Hold.closed_at, _iso),
+], joins=[(Book, Book.id == Hold.book_id), (Borrower, Borrower.id == Hold.borrower_id)])
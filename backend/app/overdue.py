@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from flask import current_app
+from sqlalchemy import Date, Integer, case, cast, func, literal, select, update
+
+from app.changes import record_changes
+from app.extensions import db, response_cache
+from app.models.models import Loan
+
+
+def days_overdue(today):
+    """SQL expression for how many days past ``today`` a loan's due date is"""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return literal(today, Date) - Loan.due_date
+    return cast(func.julianday(literal(today.isoformat())) - func.julianday(Loan.due_date), Integer)
+
+
+def fine_amount(today):
+    """SQL expression for the fine owed on a loan as of ``today``, capped at MAX_FINE"""
+    per_day = Decimal(current_app.config['FINE_PER_DAY'])
+    max_fine = Decimal(current_app.config['MAX_FINE'])
+    owed = days_overdue(today) * literal(per_day)
+    return case((Loan.due_date >= today, literal(Decimal('0'))), (owed >= max_fine, literal(max_fine)), else_=owed)
+
+
+def overdue_query(today=None, min_days=1, max_days=None, query=None):
+    """Outstanding loans that are between ``min_days`` and ``max_days`` days overdue.
+
+    Filters ``query`` (by default ``Loan.query``) over the loans table.
+    """
+    today = today or datetime.utcnow().date()
+    query = (Loan.query if query is None else query).filter(
+        Loan.outstanding(),
+        Loan.due_date <= today - timedelta(days=min_days),
+    )
+    if max_days is not None:
+        query = query.filter(Loan.due_date >= today - timedelta(days=max_days))
+    return query
+
+
+def sweep_overdue(today=None, batch_size=None):
+    """Mark past-due loans overdue and bring their fines up to date.
+
+    Works through the loan id range in batches of ``SWEEP_BATCH_SIZE``, one
+    UPDATE and commit per batch, so millions of outstanding loans never sit
+    in one long transaction or pass through Python. Loans whose fine is
+    already current are left alone, so re-running is cheap. Returns the
+    number of loans updated.
+    """
+    today = today or datetime.utcnow().date()
+    batch_size = batch_size or current_app.config['SWEEP_BATCH_SIZE']
+    due = (Loan.outstanding(), Loan.due_date < today)
+
+    first_id, last_id = db.session.execute(select(func.min(Loan.id), func.max(Loan.id)).where(*due)).one()
+    updated = 0
+    if first_id is None:
+        return updated
+    for start in range(first_id, last_id + 1, batch_size):
+        ids = db.session.scalars(
+            update(Loan)
+            .where(Loan.id.between(start, start + batch_size - 1), *due)
+            .where((Loan.status != 'overdue') | (Loan.fine < fine_amount(today)))
+            .values(status='overdue', fine=fine_amount(today))
+            .returning(Loan.id)
+            .execution_options(synchronize_session=False)
+        ).all()
+        record_changes('loans', ids)
+        updated += len(ids)
+        db.session.commit()
+    response_cache.invalidate('loans')
+    return updated
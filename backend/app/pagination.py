@@ -0,0 +1,164 @@
+import base64
+import json
+from datetime import date, datetime
+
+from flask import current_app, jsonify
+from sqlalchemy import tuple_
+
+
+class PaginationError(ValueError):
+    """Raised when a list request carries an invalid filter, sort or cursor"""
+
+
+def parse_int(args, name):
+    """Read an optional integer query parameter"""
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise PaginationError(f'{name} must be an integer')
+
+
+def parse_bool(args, name):
+    """Read an optional true/false query parameter"""
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    if value.lower() in ('true', '1', 'yes'):
+        return True
+    if value.lower() in ('false', '0', 'no'):
+        return False
+    raise PaginationError(f'{name} must be true or false')
+
+
+def parse_date(args, name):
+    """Read an optional ISO date (YYYY-MM-DD) query parameter"""
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise PaginationError(f'{name} must be a date in YYYY-MM-DD format')
+
+
+def _encode_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _decode_value(column, value):
+    if value is None:
+        return None
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    return python_type(value)
+
+
+def encode_cursor(sort, row_value, row_id):
+    """Build an opaque cursor pointing just past the given row"""
+    payload = json.dumps([sort, _encode_value(row_value), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; returns (sort, value, id)"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort, value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return sort, value, int(row_id)
+    except (ValueError, TypeError):
+        raise PaginationError('Invalid cursor')
+
+
+def keyset_page(query, model, args, sort_fields, default_sort='id', default_limit=None, max_limit=1000):
+    """Apply keyset pagination to a filtered query or select() without running it.
+
+    ``sort_fields`` maps the names accepted in ``?sort=`` to non-nullable
+    columns; a leading ``-`` sorts descending. The primary key is always used
+    as the tie-breaker so the order is stable and every page, however deep,
+    is a single index range scan. Returns ``(query, finish)``; pass the rows
+    the query returns to ``finish`` to get ``(items, next_cursor)``.
+    """
+    sort = args.get('sort') or default_sort
+    descending = sort.startswith('-')
+    sort_name = sort.lstrip('-')
+    if sort_name not in sort_fields:
+        raise PaginationError(f'Cannot sort by {sort_name}. Allowed: {", ".join(sorted(sort_fields))}')
+    sort_column = sort_fields[sort_name]
+    id_column = model.id
+
+    limit = parse_int(args, 'limit')
+    if limit is None:
+        limit = default_limit
+    if limit is not None:
+        if limit < 1:
+            raise PaginationError('limit must be positive')
+        limit = min(limit, max_limit)
+
+    cursor = args.get('cursor')
+    if cursor:
+        cursor_sort, value, last_id = decode_cursor(cursor)
+        if cursor_sort != sort:
+            raise PaginationError('Cursor does not match the requested sort order')
+        if sort_column is id_column:
+            boundary = id_column < last_id if descending else id_column > last_id
+        else:
+            try:
+                value = _decode_value(sort_column, value)
+            except (ValueError, TypeError, ArithmeticError):  # ArithmeticError: decimal.InvalidOperation
+                raise PaginationError('Invalid cursor')
+            key = tuple_(sort_column, id_column)
+            bound = tuple_(value, last_id)
+            boundary = key < bound if descending else key > bound
+        query = query.filter(boundary)
+
+    if sort_column is id_column:
+        order = [id_column.desc() if descending else id_column.asc()]
+    elif descending:
+        order = [sort_column.desc(), id_column.desc()]
+    else:
+        order = [sort_column.asc(), id_column.asc()]
+    query = query.order_by(*order)
+
+    if limit is None:
+        return query, lambda items: (items, None)
+
+    def finish(items):
+        # One extra row was fetched to learn whether another page exists
+        if len(items) <= limit:
+            return items, None
+        items = items[:limit]
+        last = items[-1]
+        return items, encode_cursor(sort, getattr(last, sort_column.key), last.id)
+
+    return query.limit(limit + 1), finish
+
+
+def paginate(query, model, args, sort_fields, default_sort='id'):
+    """Run ``query`` one keyset page at a time (see keyset_page); returns ``(items, next_cursor)``"""
+    query, finish = keyset_page(query, model, args, sort_fields, default_sort,
+                                current_app.config.get('DEFAULT_PAGE_SIZE'),
+                                current_app.config.get('MAX_PAGE_SIZE', 1000))
+    return finish(query.all())
+
+
+def paginated_response(items, next_cursor, serializer=None):
+    """Serialize a page as a JSON list; the next cursor travels in a header.
+
+    Pass the RowSerializer when ``items`` are rows from its query rather
+    than model instances.
+    """
+    if serializer is not None:
+        response = serializer.response(items)
+    else:
+        response = jsonify([item.to_dict() for item in items])
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
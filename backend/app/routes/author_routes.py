@@ -1,17 +1,27 @@
 from flask import Blueprint, request, jsonify
-from app.extensions import db
+from app.extensions import db, response_cache
 from app.models.models import Author
+from app.pagination import PaginationError, paginate, paginated_response
+from app.search import index_author_books
 
 author_bp = Blueprint('authors', __name__)
+response_cache.invalidates(author_bp, 'authors')
+
+AUTHOR_SORT_FIELDS = {'id': Author.id, 'name': Author.name}
 
 @author_bp.route('', methods=['GET'])
 @author_bp.route('/', methods=['GET'])
+@response_cache.cached('authors')
 def get_authors():
-    """Get all authors"""
-    authors = Author.query.all()
-    return jsonify([author.to_dict() for author in authors])
+    """Get authors, optionally paginated with ?limit= and ?cursor="""
+    try:
+        authors, next_cursor = paginate(Author.query, Author, request.args, AUTHOR_SORT_FIELDS)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    return paginated_response(authors, next_cursor)
 
 @author_bp.route('/<int:id>', methods=['GET'])
+@response_cache.cached('authors')
 def get_author(id):
     """Get a specific author by ID"""
     author = Author.query.get_or_404(id)
@@ -38,6 +48,8 @@ def update_author(id):
         author = Author.query.get_or_404(id)
         data = request.json
         author.name = data.get('name', author.name)
+        # Author names are part of the book search documents
+        index_author_books(author.id)
         db.session.commit()
         return jsonify(author.to_dict())
     except Exception as e:
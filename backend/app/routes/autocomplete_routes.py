@@ -0,0 +1,23 @@
+from flask import Blueprint, jsonify, request
+from app.autocomplete import SOURCES, get_index
+from app.pagination import PaginationError, parse_int
+
+autocomplete_bp = Blueprint('autocomplete', __name__)
+
+# Suggestions per lookup when ?limit= is omitted, and the most one may ask for
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+@autocomplete_bp.route('/<resource>', methods=['GET'])
+def autocomplete(resource):
+    """Suggest authors, borrowers or books with a word starting with ?prefix=, from this worker's index"""
+    if resource not in SOURCES:
+        return jsonify({'error': f'Unknown resource. Use one of: {", ".join(SOURCES)}'}), 404
+    try:
+        limit = parse_int(request.args, 'limit')
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    limit = DEFAULT_LIMIT if limit is None else limit
+    if limit < 1:
+        return jsonify({'error': 'limit must be positive'}), 400
+    return jsonify(get_index(resource).lookup(request.args.get('prefix', ''), min(limit, MAX_LIMIT)))
@@ -0,0 +1,114 @@
+import json
+from flask import Blueprint, current_app, request, jsonify
+from werkzeug.test import EnvironBuilder
+from app.database import READ_METHODS, read_from_primary
+from app.extensions import db, response_cache
+
+batch_bp = Blueprint('batch', __name__)
+
+METHODS = ('GET', 'POST', 'PUT', 'DELETE')
+# Headers of a sub-response that are passed back alongside its body
+FORWARDED_HEADERS = ('X-Next-Cursor', 'ETag', 'Last-Modified')
+
+
+def validate_requests(data):
+    """Return the sub-requests of a batch body as (method, path, body, headers) or raise ValueError"""
+    if not isinstance(data, dict) or not isinstance(data.get('requests'), list) or not data['requests']:
+        raise ValueError('Provide a non-empty list of requests')
+    limit = current_app.config['BATCH_MAX_REQUESTS']
+    if len(data['requests']) > limit:
+        raise ValueError(f'A batch may hold at most {limit} requests')
+    parsed = []
+    for i, spec in enumerate(data['requests']):
+        if not isinstance(spec, dict):
+            raise ValueError(f'Request {i} must be an object')
+        method = str(spec.get('method', 'GET')).upper()
+        path = spec.get('path')
+        if method not in METHODS:
+            raise ValueError(f'Request {i}: method must be one of {", ".join(METHODS)}')
+        if not isinstance(path, str) or not path.startswith('/api/') or path.startswith('/api/batch'):
+            raise ValueError(f'Request {i}: path must be an /api/ URL other than /api/batch')
+        headers = spec.get('headers') or {}
+        if not isinstance(headers, dict) or not all(isinstance(value, str) for value in headers.values()):
+            raise ValueError(f'Request {i}: headers must be an object of strings')
+        try:
+            json.dumps(spec.get('body'), allow_nan=False)
+        except ValueError:
+            raise ValueError(f'Request {i}: body must be valid JSON')
+        parsed.append((method, path, spec.get('body'), headers))
+    return parsed
+
+
+def run_subrequest(method, path, body, headers):
+    """Dispatch one sub-request through the app in the current app context, so it shares the batch's DB session"""
+    if request.headers.get('Cookie'):
+        headers = {'Cookie': request.headers['Cookie'], **headers}
+    try:
+        builder = EnvironBuilder(path=path, method=method, json=body, headers=headers)
+        with current_app.request_context(builder.get_environ()):
+            response = current_app.full_dispatch_request()
+    except Exception:
+        current_app.logger.exception('Batch sub-request %s %s failed', method, path)
+        db.session.rollback()
+        return {'status': 500, 'headers': {}, 'body': {'error': 'Internal server error'}}, []
+    if response.is_json:
+        content = response.get_json()
+    else:
+        content = response.get_data(as_text=True) or None
+    return {
+        'status': response.status_code,
+        'headers': {name: response.headers[name] for name in FORWARDED_HEADERS if name in response.headers},
+        'body': content,
+    }, response.headers.getlist('Set-Cookie')
+
+
+@batch_bp.route('', methods=['POST'])
+@batch_bp.route('/', methods=['POST'])
+def run_batch():
+    """Run several API requests in one round trip and one DB session.
+
+    Sub-requests run in order. With ``atomic`` they also share one
+    transaction: the first one that fails rolls back the whole batch.
+    """
+    data = request.json
+    try:
+        subrequests = validate_requests(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if any(method not in READ_METHODS for method, _, _, _ in subrequests):
+        # Reads after a write in the same batch must see it
+        read_from_primary()
+    results, cookies = [], []
+    if not data.get('atomic'):
+        for subrequest in subrequests:
+            result, set_cookies = run_subrequest(*subrequest)
+            if result['status'] >= 400:
+                db.session.rollback()
+            results.append(result)
+            cookies += set_cookies
+        response = jsonify({'responses': results})
+    else:
+        failed = None
+        with response_cache.deferred():
+            with db.session().deferred_commits() as rolled_back:
+                for i, subrequest in enumerate(subrequests):
+                    result, set_cookies = run_subrequest(*subrequest)
+                    results.append(result)
+                    cookies += set_cookies
+                    if result['status'] >= 400 or rolled_back():
+                        failed = i
+                        break
+            if failed is None:
+                db.session.commit()
+            else:
+                db.session.rollback()
+        if failed is None:
+            response = jsonify({'responses': results})
+        else:
+            response = jsonify({'error': f'Request {failed} failed; no changes were saved', 'responses': results})
+            response.status_code = 400
+            cookies = []
+    for cookie in cookies:
+        response.headers.add('Set-Cookie', cookie)
+    return response
@@ -1,22 +1,110 @@
-from flask import Blueprint, request, jsonify
-from app.extensions import db
-from app.models.models import Book, Author
+from flask import Blueprint, current_app, request, jsonify
+from app.extensions import db, covers, response_cache
+from app.models.models import Book, Author, Hold, Loan, PLACEHOLDER_IMAGE_URL
+from app.export import FORMATS as EXPORT_FORMATS, export_response
+from app.models.serializers import BOOK_ROWS, load_related
+from app.pagination import PaginationError, paginate, paginated_response, parse_bool, parse_int
+from app.search import index_book, remove_book, search_book_ids
+from app.archive import delete_history, has_history
+from app.circulation import CirculationError, add_copies, delete_holds
+from app.covers import cover_version
+from app.stats import record_book_moved
 
 book_bp = Blueprint('books', __name__)
+response_cache.invalidates(book_bp, 'books', 'loans', 'borrowers', 'holds')
+
+BOOK_SORT_FIELDS = {'id': Book.id, 'title': Book.title, 'total_loans': Book.total_loans}
+
+def filter_books(query, args):
+    """Apply the list filters accepted by the book endpoints"""
+    if args.get('genre'):
+        query = query.filter(Book.genre == args['genre'])
+    author_id = parse_int(args, 'author_id')
+    if author_id is not None:
+        query = query.filter(Book.author_id == author_id)
+    available = parse_bool(args, 'available')
+    if available is not None:
+        query = query.filter(Book.available == available)
+    year_from = parse_int(args, 'year_from')
+    if year_from is not None:
+        query = query.filter(Book.publication_year >= year_from)
+    year_to = parse_int(args, 'year_to')
+    if year_to is not None:
+        query = query.filter(Book.publication_year <= year_to)
+    return query
 
 @book_bp.route('', methods=['GET'])
 @book_bp.route('/', methods=['GET'])
+@response_cache.cached('books', 'authors')
 def get_books():
-    """Get all books"""
-    books = Book.query.all()
-    return jsonify([book.to_dict() for book in books])
+    """Get books, optionally filtered and paginated with ?limit= and ?cursor="""
+    try:
+        query = filter_books(BOOK_ROWS.query(), request.args)
+        books, next_cursor = paginate(query, Book, request.args, BOOK_SORT_FIELDS)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    return paginated_response(books, next_cursor, BOOK_ROWS)
+
+@book_bp.route('/export', methods=['GET'])
+def export_books():
+    """Stream books as NDJSON or CSV; accepts the same filters as the list"""
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unsupported format. Use one of: {", ".join(EXPORT_FORMATS)}'}), 400
+    try:
+        query = filter_books(BOOK_ROWS.query(), request.args)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    return export_response(query.order_by(Book.id), BOOK_ROWS, fmt, 'books')
+
+@book_bp.route('/search', methods=['GET'])
+@response_cache.cached('books', 'authors')
+def search_books():
+    """Ranked full-text search over title, author name, genre and description"""
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({'error': 'Query parameter q is required'}), 400
+    try:
+        limit = parse_int(request.args, 'limit')
+        offset = parse_int(request.args, 'offset')
+        if limit is not None and limit < 1:
+            raise PaginationError('limit must be positive')
+        if offset is not None and offset < 0:
+            raise PaginationError('offset must not be negative')
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    limit = min(20 if limit is None else limit, current_app.config.get('MAX_PAGE_SIZE', 1000))
+
+    book_ids = search_book_ids(q, limit, offset or 0)
+    books = load_related(Book.query.filter(Book.id.in_(book_ids)), Book.author).all()
+    books_by_id = {book.id: book for book in books}
+    return jsonify([books_by_id[book_id].to_dict() for book_id in book_ids if book_id in books_by_id])
 
 @book_bp.route('/<int:id>', methods=['GET'])
+@response_cache.cached('books', 'authors')
 def get_book(id):
     """Get a specific book by ID"""
     book = Book.query.get_or_404(id)
     return jsonify(book.to_dict())
 
+@book_bp.route('/<int:id>/cover', methods=['GET'])
+def get_book_cover(id):
+    """Serve the book's cover from the local cache; ?size=small|medium|original, default medium.
+
+    Requests carrying the current ``?v=`` (cover_version of the image_url)
+    may be cached by browsers for a year, as the URL changes with the cover.
+    """
+    size = request.args.get('size', 'medium')
+    if size != 'original' and size not in current_app.config['COVER_SIZES']:
+        return jsonify({'error': f'Unknown size. Use one of: {", ".join([*current_app.config["COVER_SIZES"], "original"])}'}), 400
+    image_url, = Book.query.with_entities(Book.image_url).filter(Book.id == id).first_or_404()
+    url = None if image_url in (None, '', PLACEHOLDER_IMAGE_URL) else image_url
+    if url and request.args.get('v') == cover_version(url):
+        max_age = 31536000
+    else:
+        max_age = current_app.config['COVER_MAX_AGE']
+    return covers.response(url, size, max_age)
+
 @book_bp.route('', methods=['POST'])
 @book_bp.route('/', methods=['POST'])
 def create_book():
@@ -41,6 +129,10 @@ def create_book():
             if existing_book:
                 return jsonify({'error': f'Book with ISBN {data["isbn"]} already exists'}), 400
         
+        copies = data.get('copies', 1)
+        if not isinstance(copies, int) or copies < 0:
+            return jsonify({'error': 'copies must be a non-negative integer'}), 400
+        
         new_book = Book(
             title=data['title'],
             author_id=data['author_id'],
@@ -49,9 +141,14 @@ def create_book():
             description=data.get('description'),
             genre=data.get('genre'),
             pages=data.get('pages'),
-            image_url=data.get('image_url', 'https://via.placeholder.com/150x200?text=No+Image')
+            image_url=data.get('image_url', PLACEHOLDER_IMAGE_URL),
+            copies=copies,
+            available_copies=copies,
+            available=copies > 0
         )
         db.session.add(new_book)
+        db.session.flush()
+        index_book(new_book.id)
         db.session.commit()
         return jsonify(new_book.to_dict()), 201
         
@@ -80,6 +177,7 @@ def update_book(id):
             if existing_book:
                 return jsonify({'error': f'Book with ISBN {data["isbn"]} already exists'}), 400
         
+        old_genre, old_author_id = book.genre, book.author_id
         book.title = data.get('title', book.title)
         book.author_id = data.get('author_id', book.author_id)
         book.publication_year = data.get('publication_year', book.publication_year)
@@ -89,9 +187,21 @@ def update_book(id):
         book.pages = data.get('pages', book.pages)
         book.image_url = data.get('image_url', book.image_url)
         
+        if 'copies' in data:
+            if not isinstance(data['copies'], int) or data['copies'] < 0:
+                return jsonify({'error': 'copies must be a non-negative integer'}), 400
+            add_copies(book.id, data['copies'] - book.copies)
+        
+        # The circulation rollup is keyed by genre and author
+        if (book.genre or '') != (old_genre or '') or book.author_id != old_author_id:
+            record_book_moved(book.id, old_genre, old_author_id)
+        index_book(book.id)
         db.session.commit()
         return jsonify(book.to_dict())
         
+    except CirculationError as e:
+        db.session.rollback()
+        return jsonify(e.to_dict()), e.status_code
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
@@ -103,20 +213,19 @@ def delete_book(id):
         book = Book.query.get_or_404(id)
         force_delete = request.args.get('force') == 'true'
         
-        if book.loans:
-            active_loans = [loan for loan in book.loans if loan.status == 'active']
-            if active_loans:
-                return jsonify({'error': 'Cannot delete book with active loans. Please return the book first.'}), 400
-            elif not force_delete:
+        if db.session.query(Loan.query.filter(Loan.book_id == id, Loan.outstanding()).exists()).scalar():
+            return jsonify({'error': 'Cannot delete book with active loans. Please return the book first.'}), 400
+        if has_history('book_id', id):
+            if not force_delete:
                 return jsonify({
                     'error': 'Cannot delete book with loan history. This book has been borrowed before.',
                     'suggestion': 'Add ?force=true to URL to force delete and remove loan history.'
                 }), 400
-            else:
-                # Force delete: remove all loan records first
-                for loan in book.loans:
-                    db.session.delete(loan)
+            # Force delete: remove all loan records first, archived ones included
+            delete_history('book_id', id)
             
+        delete_holds(Hold.book_id == id)
+        remove_book(book.id)
         db.session.delete(book)
         db.session.commit()
         return '', 204
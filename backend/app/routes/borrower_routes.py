@@ -1,17 +1,29 @@
 from flask import Blueprint, request, jsonify
-from app.extensions import db
-from app.models.models import Borrower
+from app.extensions import db, response_cache
+from app.archive import delete_history, has_history
+from app.circulation import delete_holds
+from app.models.models import Borrower, Hold, Loan
+from app.pagination import PaginationError, paginate, paginated_response
 
 borrower_bp = Blueprint('borrowers', __name__)
+response_cache.invalidates(borrower_bp, 'borrowers', 'loans', 'books', 'holds')
+
+BORROWER_SORT_FIELDS = {'id': Borrower.id, 'name': Borrower.name, 'email': Borrower.email,
+                        'active_loans': Borrower.active_loans}
 
 @borrower_bp.route('', methods=['GET'])
 @borrower_bp.route('/', methods=['GET'])
+@response_cache.cached('borrowers')
 def get_borrowers():
-    """Get all borrowers"""
-    borrowers = Borrower.query.all()
-    return jsonify([borrower.to_dict() for borrower in borrowers])
+    """Get borrowers, optionally paginated with ?limit= and ?cursor="""
+    try:
+        borrowers, next_cursor = paginate(Borrower.query, Borrower, request.args, BORROWER_SORT_FIELDS)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    return paginated_response(borrowers, next_cursor)
 
 @borrower_bp.route('/<int:id>', methods=['GET'])
+@response_cache.cached('borrowers')
 def get_borrower(id):
     """Get a specific borrower by ID"""
     borrower = Borrower.query.get_or_404(id)
@@ -76,17 +88,23 @@ def update_borrower(id):
 
 @borrower_bp.route('/<int:id>', methods=['DELETE'])
 def delete_borrower(id):
-    """Delete a borrower"""
+    """Delete a borrower; ?force=true also removes their returned loan history"""
     try:
         borrower = Borrower.query.get_or_404(id)
-        # Check if borrower has active loans
-        active_loans = [loan for loan in borrower.loans if not loan.returned]
-        if active_loans:
+        if db.session.query(Loan.query.filter(Loan.borrower_id == id, Loan.outstanding()).exists()).scalar():
             return jsonify({'error': 'Cannot delete borrower with active loans'}), 400
+        if has_history('borrower_id', id):
+            if request.args.get('force') != 'true':
+                return jsonify({
+                    'error': 'Cannot delete borrower with loan history.',
+                    'suggestion': 'Add ?force=true to URL to force delete and remove loan history.'
+                }), 400
+            delete_history('borrower_id', id)
             
+        delete_holds(Hold.borrower_id == id)
         db.session.delete(borrower)
         db.session.commit()
         return '', 204
     except Exception as e:
         db.session.rollback()
-        return jsonify({'error': str(e)}), 400
\ No newline at end of file
+        return jsonify({'error': str(e)}), 400
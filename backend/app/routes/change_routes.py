@@ -0,0 +1,45 @@
+from flask import Blueprint, current_app, jsonify, request
+from app.changes import ChangeLogCompacted, changes_since, latest_cursor
+from app.models.models import SYNCED_RESOURCES
+from app.pagination import PaginationError, parse_int
+
+change_bp = Blueprint('changes', __name__)
+
+COMPACTED_MESSAGE = 'Changes after this cursor are no longer kept; reload the lists and sync from the cursor given'
+
+def parse_feed_args(args, config):
+    """Read ?limit= and ?resource= (comma-separated) and return (limit, resources)"""
+    limit = parse_int(args, 'limit')
+    if limit is None:
+        limit = config['CHANGE_FEED_PAGE_SIZE']
+    if limit < 1:
+        raise PaginationError('limit must be positive')
+    resources = [name for name in args.get('resource', '').split(',') if name]
+    unknown = [name for name in resources if name not in SYNCED_RESOURCES]
+    if unknown:
+        raise PaginationError(f'Unknown resource: {", ".join(unknown)}. Use {", ".join(SYNCED_RESOURCES)}')
+    return min(limit, config['MAX_PAGE_SIZE']), resources
+
+@change_bp.route('', methods=['GET'])
+@change_bp.route('/', methods=['GET'])
+def get_changes():
+    """Get the inserts, updates and deletes after ?since=, oldest first.
+
+    Without ?since= only the current cursor is returned: take it before
+    loading the lists, then sync from it. Answers 410 with a fresh cursor
+    once the changes after ``since`` have been compacted away. The pushed
+    variant, /api/changes/stream, is served by the async API (asgi.py),
+    where an open stream does not hold a worker thread.
+    """
+    try:
+        since = parse_int(request.args, 'since')
+        limit, resources = parse_feed_args(request.args, current_app.config)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    if since is None:
+        return jsonify({'changes': [], 'cursor': latest_cursor(), 'more': False})
+    try:
+        changes, cursor, more = changes_since(since, limit, resources)
+    except ChangeLogCompacted:
+        return jsonify({'error': COMPACTED_MESSAGE, 'cursor': latest_cursor()}), 410
+    return jsonify({'changes': changes, 'cursor': cursor, 'more': more})
@@ -0,0 +1,75 @@
+from flask import Blueprint, request, jsonify
+from app.extensions import db, response_cache
+from app.circulation import CirculationError, close_holds, place_hold, queue_position
+from app.models.models import Hold
+from app.models.serializers import HOLD_ROWS
+from app.pagination import PaginationError, paginate, paginated_response, parse_int
+
+hold_bp = Blueprint('holds', __name__)
+response_cache.invalidates(hold_bp, 'holds', 'books')
+
+HOLD_SORT_FIELDS = {'id': Hold.id, 'created_at': Hold.created_at}
+
+def hold_response(hold, status_code=200):
+    data = hold.to_dict()
+    data['position'] = queue_position(hold)
+    return jsonify(data), status_code
+
+@hold_bp.route('', methods=['GET'])
+@hold_bp.route('/', methods=['GET'])
+@response_cache.cached('holds', 'books', 'borrowers')
+def get_holds():
+    """Get holds, optionally filtered by book_id, borrower_id and status, and paginated"""
+    try:
+        query = HOLD_ROWS.query()
+        if request.args.get('status'):
+            query = query.filter(Hold.status == request.args['status'])
+        borrower_id = parse_int(request.args, 'borrower_id')
+        if borrower_id is not None:
+            query = query.filter(Hold.borrower_id == borrower_id)
+        book_id = parse_int(request.args, 'book_id')
+        if book_id is not None:
+            query = query.filter(Hold.book_id == book_id)
+        holds, next_cursor = paginate(query, Hold, request.args, HOLD_SORT_FIELDS)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    return paginated_response(holds, next_cursor, HOLD_ROWS)
+
+@hold_bp.route('/<int:id>', methods=['GET'])
+@response_cache.cached('holds', 'books', 'borrowers')
+def get_hold(id):
+    """Get a hold and, while it is waiting, its place in the queue"""
+    return hold_response(Hold.query.get_or_404(id))
+
+@hold_bp.route('', methods=['POST'])
+@hold_bp.route('/', methods=['POST'])
+def create_hold():
+    """Place a hold on a book with no copy on the shelf"""
+    try:
+        data = request.json
+        hold = place_hold(data['borrower_id'], data['book_id'], data.get('priority', 0))
+        db.session.commit()
+        return hold_response(hold, 201)
+        
+    except KeyError as e:
+        return jsonify({'error': f'Missing required field: {str(e)}'}), 400
+    except CirculationError as e:
+        db.session.rollback()
+        return jsonify(e.to_dict()), e.status_code
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+
+@hold_bp.route('/<int:id>/cancel', methods=['PUT'])
+def cancel_hold(id):
+    """Cancel a waiting or ready hold; a copy set aside for it goes to the next in line"""
+    try:
+        if not close_holds('cancelled', Hold.id == id):
+            hold = Hold.query.get_or_404(id)
+            return jsonify({'error': f'Hold is already {hold.status}'}), 400
+        db.session.commit()
+        return hold_response(Hold.query.get(id))
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
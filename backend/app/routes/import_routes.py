@@ -0,0 +1,27 @@
+from flask import Blueprint, request, jsonify
+from app.bulk_import import FORMATS, BulkImporter, iter_records
+from app.extensions import db, response_cache
+
+import_bp = Blueprint('import', __name__)
+response_cache.invalidates(import_bp, 'authors', 'books', 'borrowers')
+
+CONTENT_TYPE_FORMATS = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'ndjson',
+    'application/ndjson': 'ndjson',
+}
+
+@import_bp.route('/<any(authors, books, borrowers):entity>', methods=['POST'])
+def bulk_import(entity):
+    """Stream a CSV or NDJSON feed into a table in large batches"""
+    fmt = request.args.get('format') or CONTENT_TYPE_FORMATS.get(request.mimetype)
+    if fmt not in FORMATS:
+        return jsonify({'error': f'Unsupported format. Use ?format= with one of: {", ".join(FORMATS)}'}), 400
+    create_authors = request.args.get('create_authors', 'true') == 'true'
+    try:
+        importer = BulkImporter(create_authors=create_authors)
+        report = importer.run(entity, iter_records(request.stream, fmt))
+        return jsonify(report)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
@@ -1,22 +1,90 @@
 from flask import Blueprint, request, jsonify
-from app.extensions import db
-from app.models.models import Loan, Book, Borrower
-from datetime import datetime, timedelta
+from app.extensions import db, response_cache
+from app.models.models import ArchivedLoan, Loan, LoanHistory, OUTSTANDING_STATUSES
+from app.archive import delete_history
+from app.circulation import CirculationError, checkout_books, release_copies, return_loans
+from app.export import FORMATS as EXPORT_FORMATS, export_response
+from app.models.serializers import LOAN_HISTORY_ROWS, LOAN_ROWS, load_related
+from app.overdue import overdue_query
+from app.stats import record_deleted_loans
+from app.pagination import PaginationError, paginate, paginated_response, parse_date, parse_int
 
 loan_bp = Blueprint('loans', __name__)
+response_cache.invalidates(loan_bp, 'loans', 'books', 'borrowers', 'holds')
+
+LOAN_SORT_FIELDS = {'id': Loan.id, 'loan_date': Loan.loan_date, 'due_date': Loan.due_date}
+LOAN_HISTORY_SORT_FIELDS = {'id': LoanHistory.id, 'loan_date': LoanHistory.loan_date, 'due_date': LoanHistory.due_date}
+
+def get_loans_by_id(loan_ids):
+    """Load loans with the book and borrower fields their to_dict() needs"""
+    return load_related(Loan.query.filter(Loan.id.in_(loan_ids)), Loan.book, Loan.borrower).all()
+
+def filter_loans(query, args, model=Loan):
+    """Apply the list filters accepted by the loan endpoints (to Loan or LoanHistory)"""
+    if args.get('status'):
+        query = query.filter(model.status == args['status'])
+    borrower_id = parse_int(args, 'borrower_id')
+    if borrower_id is not None:
+        query = query.filter(model.borrower_id == borrower_id)
+    book_id = parse_int(args, 'book_id')
+    if book_id is not None:
+        query = query.filter(model.book_id == book_id)
+    due_from = parse_date(args, 'due_from')
+    if due_from is not None:
+        query = query.filter(model.due_date >= due_from)
+    due_to = parse_date(args, 'due_to')
+    if due_to is not None:
+        query = query.filter(model.due_date <= due_to)
+    return query
 
 @loan_bp.route('', methods=['GET'])
 @loan_bp.route('/', methods=['GET'])
+@response_cache.cached('loans', 'books', 'borrowers')
 def get_loans():
-    """Get all loans"""
-    loans = Loan.query.all()
-    return jsonify([loan.to_dict() for loan in loans])
+    """Get loans, archived ones included, optionally filtered and paginated with ?limit= and ?cursor="""
+    try:
+        query = filter_loans(LOAN_HISTORY_ROWS.query(), request.args, LoanHistory)
+        loans, next_cursor = paginate(query, LoanHistory, request.args, LOAN_HISTORY_SORT_FIELDS)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    return paginated_response(loans, next_cursor, LOAN_HISTORY_ROWS)
 
 @loan_bp.route('/active', methods=['GET'])
+@response_cache.cached('loans', 'books', 'borrowers')
 def get_active_loans():
-    """Get all active (not returned) loans"""
-    active_loans = Loan.query.filter_by(status='active').all()
-    return jsonify([loan.to_dict() for loan in active_loans])
+    """Get active (not returned) loans, optionally filtered and paginated"""
+    try:
+        query = filter_loans(LOAN_ROWS.query().filter(Loan.outstanding()), request.args)
+        active_loans, next_cursor = paginate(query, Loan, request.args, LOAN_SORT_FIELDS)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    return paginated_response(active_loans, next_cursor, LOAN_ROWS)
+
+@loan_bp.route('/overdue', methods=['GET'])
+def get_overdue_loans():
+    """Get outstanding loans past their due date, most overdue first"""
+    try:
+        min_days = parse_int(request.args, 'min_days_overdue')
+        max_days = parse_int(request.args, 'max_days_overdue')
+        query = overdue_query(min_days=1 if min_days is None else min_days, max_days=max_days,
+                              query=LOAN_ROWS.query())
+        query = filter_loans(query, request.args)
+        loans, next_cursor = paginate(query, Loan, request.args, LOAN_SORT_FIELDS, default_sort='due_date')
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    return paginated_response(loans, next_cursor, LOAN_ROWS)
+
+@loan_bp.route('/export', methods=['GET'])
+def export_loans():
+    """Stream loans, archived ones included, as NDJSON or CSV; accepts the same filters as the list"""
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unsupported format. Use one of: {", ".join(EXPORT_FORMATS)}'}), 400
+    try:
+        query = filter_loans(LOAN_HISTORY_ROWS.query(), request.args, LoanHistory)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    return export_response(query.order_by(LoanHistory.id), LOAN_HISTORY_ROWS, fmt, 'loans')
 
 @loan_bp.route('', methods=['POST'])
 @loan_bp.route('/', methods=['POST'])
@@ -28,31 +96,56 @@ def create_loan():
         borrower_id = data['borrower_id']
         days_to_return = data.get('days_to_return', 14)  # Default 2 weeks
         
-        # Check if book exists and is available
-        book = Book.query.get_or_404(book_id)
-        if not book.available:
-            return jsonify({'error': 'Book is not available for loan'}), 400
-            
-        # Check if borrower exists
-        borrower = Borrower.query.get_or_404(borrower_id)
+        # Claim the book and create the loan in one transaction
+        new_loan, = checkout_books(borrower_id, [book_id], days_to_return)
+        db.session.commit()
+        return jsonify(get_loans_by_id([new_loan.id])[0].to_dict()), 201
         
-        # Create loan
-        due_date = datetime.utcnow().date() + timedelta(days=days_to_return)
-        new_loan = Loan(
-            book_id=book_id,
-            borrower_id=borrower_id,
-            due_date=due_date
-        )
+    except KeyError as e:
+        return jsonify({'error': f'Missing required field: {str(e)}'}), 400
+    except CirculationError as e:
+        return jsonify(e.to_dict()), e.status_code
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+
+@loan_bp.route('/batch', methods=['POST'])
+def batch_loans():
+    """Check out and/or return many books for one borrower in a single transaction"""
+    try:
+        data = request.json
+        borrower_id = data['borrower_id']
+        checkout_ids = data.get('checkout', [])
+        return_ids = list(dict.fromkeys(data.get('return', [])))
+        days_to_return = data.get('days_to_return', 14)
+        if not checkout_ids and not return_ids:
+            return jsonify({'error': 'Provide book IDs to checkout and/or return'}), 400
         
-        # Mark book as unavailable
-        book.available = False
+        # Returns go first so a borrower can swap a book in one request
+        returned = []
+        if return_ids:
+            returned = return_loans(Loan.borrower_id == borrower_id, Loan.book_id.in_(return_ids))
+            if len(returned) != len(return_ids):
+                db.session.rollback()
+                closed = {book_id for _, book_id in returned}
+                return jsonify({
+                    'error': 'Borrower has no active loan for some of these books',
+                    'book_ids': [book_id for book_id in return_ids if book_id not in closed]
+                }), 400
         
-        db.session.add(new_loan)
+        new_loans = checkout_books(borrower_id, checkout_ids, days_to_return) if checkout_ids else []
         db.session.commit()
-        return jsonify(new_loan.to_dict()), 201
+        
+        loans = {loan.id: loan for loan in get_loans_by_id([loan.id for loan in new_loans] + [loan_id for loan_id, _ in returned])}
+        return jsonify({
+            'checked_out': [loans[loan.id].to_dict() for loan in new_loans],
+            'returned': [loans[loan_id].to_dict() for loan_id, _ in returned]
+        })
         
     except KeyError as e:
         return jsonify({'error': f'Missing required field: {str(e)}'}), 400
+    except CirculationError as e:
+        return jsonify(e.to_dict()), e.status_code
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
@@ -61,22 +154,13 @@ def create_loan():
 def return_book(id):
     """Return a borrowed book"""
     try:
-        loan = Loan.query.get_or_404(id)
-        
-        if loan.status == 'returned':
+        # Close the loan only if it is still active, so concurrent returns cannot both succeed
+        if not return_loans(Loan.id == id):
+            Loan.query.get_or_404(id)
             return jsonify({'error': 'Book already returned'}), 400
             
-        # Mark loan as returned
-        loan.status = 'returned'
-        loan.return_date = datetime.utcnow().date()
-        
-        # Mark book as available
-        book = Book.query.get(loan.book_id)
-        if book:
-            book.available = True
-            
         db.session.commit()
-        return jsonify(loan.to_dict())
+        return jsonify(get_loans_by_id([id])[0].to_dict())
         
     except Exception as e:
         db.session.rollback()
@@ -84,16 +168,21 @@ def return_book(id):
 
 @loan_bp.route('/<int:id>', methods=['DELETE'])
 def delete_loan(id):
-    """Delete a loan record"""
+    """Delete a loan record, live or archived"""
     try:
-        loan = Loan.query.get_or_404(id)
+        loan = db.session.get(Loan, id)
+        if loan is None:
+            # The list shows archived loans too; they leave the archive and the rollups the same way
+            ArchivedLoan.query.get_or_404(id)
+            delete_history('id', id)
+            db.session.commit()
+            return '', 204
         
-        # If loan is not returned, make book available again
-        if loan.status == 'active':
-            book = Book.query.get(loan.book_id)
-            if book:
-                book.available = True
+        # If loan is not returned, pass the copy to the next hold or back on the shelf
+        if loan.status in OUTSTANDING_STATUSES:
+            release_copies({loan.book_id: 1})
                 
+        record_deleted_loans([loan])
         db.session.delete(loan)
         db.session.commit()
         return '', 204
@@ -0,0 +1,163 @@
+from datetime import datetime
+from flask import Blueprint, request, jsonify
+from sqlalchemy import func, select
+from app.extensions import db, response_cache
+from app.models.models import Author, Book, Borrower, MonthlyCirculation
+from app.overdue import overdue_query
+from app.pagination import PaginationError, parse_int
+from app.stats import month_start
+
+stats_bp = Blueprint('stats', __name__)
+
+STATS_TABLES = ('loans', 'books', 'authors', 'borrowers')
+
+# A century; further back than that the first month falls outside the calendar
+MAX_MONTHS = 1200
+
+def parse_window(args):
+    """Read ?months= and ?limit= and return (first month included, limit)"""
+    months = parse_int(args, 'months')
+    limit = parse_int(args, 'limit')
+    months = 12 if months is None else months
+    limit = 10 if limit is None else limit
+    if months < 1 or limit < 1:
+        raise PaginationError('months and limit must be positive')
+    if months > MAX_MONTHS:
+        raise PaginationError(f'months must be at most {MAX_MONTHS}')
+    today = datetime.utcnow().date()
+    index = today.year * 12 + today.month - months
+    return month_start(today.replace(year=index // 12, month=index % 12 + 1, day=1)), min(limit, 100)
+
+def loans_per_genre(since, limit):
+    loans = func.sum(MonthlyCirculation.loans)
+    rows = db.session.execute(
+        select(MonthlyCirculation.genre, loans, loans * 1.0 / func.sum(loans).over())
+        .where(MonthlyCirculation.month >= since)
+        .group_by(MonthlyCirculation.genre)
+        .order_by(loans.desc())
+        .limit(limit)
+    )
+    return [{'genre': genre or None, 'loans': count, 'share': round(share or 0, 4)} for genre, count, share in rows]
+
+def top_books(limit):
+    rows = db.session.execute(
+        select(Book.id, Book.title, Author.name, Book.total_loans, Book.active_loans)
+        .outerjoin(Author, Author.id == Book.author_id)
+        .where(Book.total_loans > 0)
+        .order_by(Book.total_loans.desc(), Book.id.desc())
+        .limit(limit)
+    )
+    return [
+        {'book_id': book_id, 'title': title, 'author_name': author_name or 'Unknown',
+         'total_loans': total, 'active_loans': active}
+        for book_id, title, author_name, total, active in rows
+    ]
+
+@stats_bp.route('', methods=['GET'])
+@stats_bp.route('/', methods=['GET'])
+@response_cache.cached(*STATS_TABLES)
+def get_dashboard():
+    """Headline circulation numbers for the dashboard"""
+    this_month = month_start(datetime.utcnow().date())
+    loans, returns = db.session.execute(
+        select(func.coalesce(func.sum(MonthlyCirculation.loans), 0), func.coalesce(func.sum(MonthlyCirculation.returns), 0))
+        .where(MonthlyCirculation.month == this_month)
+    ).one()
+    active = db.session.scalar(select(func.coalesce(func.sum(Borrower.active_loans), 0)))
+    overdue = overdue_query().count()
+    return jsonify({
+        'active_loans': active,
+        'overdue_loans': overdue,
+        'loans_this_month': loans,
+        'returns_this_month': returns,
+        'top_books': top_books(5),
+        'top_genres': loans_per_genre(this_month, 5),
+    })
+
+@stats_bp.route('/genres', methods=['GET'])
+@response_cache.cached(*STATS_TABLES)
+def get_genre_stats():
+    """Loans per genre over the last ?months= months, with each genre's share"""
+    try:
+        since, limit = parse_window(request.args)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(loans_per_genre(since, limit))
+
+@stats_bp.route('/top-books', methods=['GET'])
+@response_cache.cached(*STATS_TABLES)
+def get_top_books():
+    """Most borrowed books of all time"""
+    try:
+        _, limit = parse_window(request.args)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(top_books(limit))
+
+@stats_bp.route('/borrowers', methods=['GET'])
+@response_cache.cached(*STATS_TABLES)
+def get_borrower_stats():
+    """Borrowers with the most books out right now, ranked"""
+    try:
+        _, limit = parse_window(request.args)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    rows = db.session.execute(
+        select(Borrower.id, Borrower.name, Borrower.active_loans,
+               func.rank().over(order_by=Borrower.active_loans.desc()))
+        .where(Borrower.active_loans > 0)
+        .order_by(Borrower.active_loans.desc(), Borrower.id)
+        .limit(limit)
+    )
+    return jsonify([
+        {'borrower_id': borrower_id, 'name': name, 'active_loans': count, 'rank': rank}
+        for borrower_id, name, count, rank in rows
+    ])
+
+@stats_bp.route('/authors', methods=['GET'])
+@response_cache.cached(*STATS_TABLES)
+def get_author_stats():
+    """Loans per author over the last ?months= months and loans per title (utilization)"""
+    try:
+        since, limit = parse_window(request.args)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    loans = func.sum(MonthlyCirculation.loans)
+    rows = db.session.execute(
+        select(MonthlyCirculation.author_id, Author.name, loans, func.rank().over(order_by=loans.desc()))
+        .join(Author, Author.id == MonthlyCirculation.author_id)
+        .where(MonthlyCirculation.month >= since)
+        .group_by(MonthlyCirculation.author_id, Author.name)
+        .order_by(loans.desc(), MonthlyCirculation.author_id)
+        .limit(limit)
+    ).all()
+    author_ids = [author_id for author_id, _, _, _ in rows]
+    titles = dict(db.session.execute(
+        select(Book.author_id, func.count()).where(Book.author_id.in_(author_ids)).group_by(Book.author_id)
+    ).all())
+    return jsonify([
+        {'author_id': author_id, 'name': name, 'loans': count, 'books': titles.get(author_id, 0),
+         'loans_per_book': round(count / titles[author_id], 2) if titles.get(author_id) else None, 'rank': rank}
+        for author_id, name, count, rank in rows
+    ])
+
+@stats_bp.route('/monthly', methods=['GET'])
+@response_cache.cached(*STATS_TABLES)
+def get_monthly_stats():
+    """Loans and returns per month over the last ?months= months, with a running total"""
+    try:
+        since, _ = parse_window(request.args)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    loans = func.sum(MonthlyCirculation.loans)
+    rows = db.session.execute(
+        select(MonthlyCirculation.month, loans, func.sum(MonthlyCirculation.returns),
+               func.sum(loans).over(order_by=MonthlyCirculation.month))
+        .where(MonthlyCirculation.month >= since)
+        .group_by(MonthlyCirculation.month)
+        .order_by(MonthlyCirculation.month)
+    )
+    return jsonify([
+        {'month': month.strftime('%Y-%m'), 'loans': count, 'returns': returned, 'cumulative_loans': running}
+        for month, count, returned, running in rows
+    ])
@@ -0,0 +1,150 @@
+import re
+
+from sqlalchemy import bindparam, text
+
+from app.extensions import db
+
+# The search index lives in its own table, keyed by book id, so it can be a
+# tsvector + GIN index on PostgreSQL and an FTS5 virtual table on SQLite.
+# Routes keep it in sync by calling index_book/remove_book inside the same
+# transaction as the write, so it never disagrees with the books table.
+
+_POSTGRES_DDL = [
+    'CREATE TABLE IF NOT EXISTS book_search (book_id INTEGER PRIMARY KEY, document TSVECTOR NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS ix_book_search_document ON book_search USING GIN (document)',
+]
+
+_SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS book_search USING fts5("
+    "title, author_name, genre, description, tokenize = 'porter unicode61')",
+]
+
+# Title matches rank above author, genre and description matches
+_POSTGRES_DOCUMENT = """
+    setweight(to_tsvector('english', coalesce(b.title, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(a.name, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce(b.genre, '')), 'C') ||
+    setweight(to_tsvector('english', coalesce(b.description, '')), 'D')
+"""
+
+_SQLITE_WEIGHTS = 'bm25(book_search, 10.0, 5.0, 2.0, 1.0)'
+
+
+def _dialect():
+    return db.session.get_bind().dialect.name
+
+
+def create_search_index():
+    """Create the search table and its index if they do not exist yet"""
+    dialect = _dialect()
+    statements = {'postgresql': _POSTGRES_DDL, 'sqlite': _SQLITE_DDL}.get(dialect, [])
+    for statement in statements:
+        db.session.execute(text(statement))
+    db.session.commit()
+
+
+def _reindex(where, params, expanding=()):
+    """Rebuild the index rows for the books matching ``where`` in one statement"""
+    dialect = _dialect()
+    db.session.flush()
+
+    def statement(sql):
+        # ``expanding`` names the list parameters, as in ``b.id IN :book_ids``
+        return text(sql).bindparams(*[bindparam(name, expanding=True) for name in expanding])
+
+    if dialect == 'postgresql':
+        db.session.execute(statement(f"""
+            INSERT INTO book_search (book_id, document)
+            SELECT b.id, {_POSTGRES_DOCUMENT}
+            FROM books b LEFT JOIN authors a ON a.id = b.author_id
+            WHERE {where}
+            ON CONFLICT (book_id) DO UPDATE SET document = EXCLUDED.document
+        """), params)
+    elif dialect == 'sqlite':
+        db.session.execute(statement(f'DELETE FROM book_search WHERE rowid IN (SELECT b.id FROM books b WHERE {where})'), params)
+        db.session.execute(statement(f"""
+            INSERT INTO book_search (rowid, title, author_name, genre, description)
+            SELECT b.id, b.title, a.name, b.genre, b.description
+            FROM books b LEFT JOIN authors a ON a.id = b.author_id
+            WHERE {where}
+        """), params)
+
+
+def index_book(book_id):
+    """Insert or refresh the index entry for one book"""
+    _reindex('b.id = :book_id', {'book_id': book_id})
+
+
+def index_books(book_ids):
+    """Index the given books, e.g. the rows of a bulk insert"""
+    if book_ids:
+        _reindex('b.id IN :book_ids', {'book_ids': list(book_ids)}, expanding=('book_ids',))
+
+
+def index_author_books(author_id):
+    """Refresh the entries of every book by an author, e.g. after a rename"""
+    _reindex('b.author_id = :author_id', {'author_id': author_id})
+
+
+def remove_book(book_id):
+    """Drop the index entry for a deleted book"""
+    dialect = _dialect()
+    if dialect == 'postgresql':
+        db.session.execute(text('DELETE FROM book_search WHERE book_id = :book_id'), {'book_id': book_id})
+    elif dialect == 'sqlite':
+        db.session.execute(text('DELETE FROM book_search WHERE rowid = :book_id'), {'book_id': book_id})
+
+
+def rebuild_search_index():
+    """Recreate every index entry from scratch (after seeding or bulk loads)"""
+    dialect = _dialect()
+    if dialect in ('postgresql', 'sqlite'):
+        db.session.execute(text('DELETE FROM book_search'))
+        _reindex('1 = 1', {})
+    db.session.commit()
+
+
+def _fts5_query(q):
+    # Quote every term so user input cannot inject FTS5 syntax; the last term
+    # is a prefix match so results keep up with typing
+    terms = re.findall(r'\w+', q)
+    if not terms:
+        return None
+    quoted = ['"%s"' % term for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def search_book_ids(q, limit, offset=0):
+    """Return the ids of books matching ``q``, best match first"""
+    dialect = _dialect()
+    params = {'limit': limit, 'offset': offset}
+    if dialect == 'postgresql':
+        params['q'] = q
+        rows = db.session.execute(text("""
+            SELECT s.book_id
+            FROM book_search s, websearch_to_tsquery('english', :q) query
+            WHERE s.document @@ query
+            ORDER BY ts_rank_cd(s.document, query) DESC, s.book_id
+            LIMIT :limit OFFSET :offset
+        """), params)
+    elif dialect == 'sqlite':
+        params['q'] = _fts5_query(q)
+        if params['q'] is None:
+            return []
+        rows = db.session.execute(text(f"""
+            SELECT rowid FROM book_search
+            WHERE book_search MATCH :q
+            ORDER BY {_SQLITE_WEIGHTS}, rowid
+            LIMIT :limit OFFSET :offset
+        """), params)
+    else:
+        # No full-text support: unranked substring match
+        params['q'] = f'%{q}%'
+        rows = db.session.execute(text("""
+            SELECT b.id FROM books b LEFT JOIN authors a ON a.id = b.author_id
+            WHERE b.title LIKE :q OR b.description LIKE :q OR b.genre LIKE :q OR a.name LIKE :q
+            ORDER BY b.id
+            LIMIT :limit OFFSET :offset
+        """), params)
+    return [row[0] for row in rows]
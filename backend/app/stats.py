@@ -0,0 +1,241 @@
+from collections import Counter, defaultdict
+from datetime import date
+
+from sqlalchemy import Date, DateTime, bindparam, cast, delete, func, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.changes import record_changes
+from app.extensions import db
+from app.models.models import (
+    ArchivedLoan, Book, Borrower, Loan, LoanHistory, MonthlyCirculation, OUTSTANDING_STATUSES,
+)
+
+# The circulation rollups behind /api/stats and the loan counters on books
+# and borrowers. Checkout, return and delete paths adjust them in the same
+# transaction as the loan change, touching one row per affected book,
+# borrower and month rather than rescanning loans. The rollup is keyed by a
+# book's current genre and author, so editing those moves the book's counts
+# (record_book_moved); rebuild_stats() and
+# reconcile_counters() recompute them from scratch after bulk loads.
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def month_start_sql(column):
+    """SQL expression for the first day of the month of a date column"""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return cast(func.date_trunc('month', column), Date)
+    return func.date(column, 'start of month', type_=Date)
+
+
+def _upsert(model):
+    # Only PostgreSQL and SQLite get past configure_engines()
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+
+def _apply_monthly(events, keys=None):
+    """Add ``{(month, book_id, 'loans'|'returns'): delta}`` to the monthly rollup.
+
+    Counts go to each book's current genre and author unless ``keys`` maps
+    book ids to another ``(genre, author_id)``.
+    """
+    if keys is None:
+        book_ids = {book_id for _, book_id, _ in events}
+        rows = db.session.execute(
+            select(Book.id, func.coalesce(Book.genre, ''), Book.author_id).where(Book.id.in_(book_ids)))
+        keys = {book_id: (genre, author_id) for book_id, genre, author_id in rows}
+
+    totals = defaultdict(lambda: {'loans': 0, 'returns': 0})
+    for (month, book_id, column), delta in events.items():
+        if book_id in keys:
+            totals[(month, *keys[book_id])][column] += delta
+    if not totals:
+        return
+    stmt = _upsert(MonthlyCirculation)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['month', 'genre', 'author_id'],
+        set_={
+            'loans': MonthlyCirculation.loans + stmt.excluded.loans,
+            'returns': MonthlyCirculation.returns + stmt.excluded.returns,
+        },
+    )
+    db.session.execute(stmt, [
+        {'month': month, 'genre': genre, 'author_id': author_id, **counts}
+        for (month, genre, author_id), counts in totals.items()
+    ])
+
+
+COUNTED_BY = {Book: 'book_id', Borrower: 'borrower_id'}
+
+
+def _last_loaned_at(model, *criteria):
+    """Correlated subquery for when a book or borrower was last lent, over live and archived loans"""
+    started = func.coalesce(LoanHistory.created_at, LoanHistory.loan_date, type_=DateTime)
+    return select(func.max(started)).where(getattr(LoanHistory, COUNTED_BY[model]) == model.id, *criteria) \
+        .scalar_subquery()
+
+
+def _apply_counts(model, deltas, deleted):
+    """Add ``{id: (total_delta, active_delta)}`` to the loan counters of books or borrowers.
+
+    ``deleted`` matches the LoanHistory rows about to be deleted; last_loaned_at
+    is recomputed without them for the rows touched, in case their latest
+    loan is among them.
+    """
+    if not deltas:
+        return
+    table = model.__table__
+    db.session.execute(
+        update(table)
+        .where(table.c.id == bindparam('_id'))
+        .values(total_loans=table.c.total_loans + bindparam('_total'),
+                active_loans=table.c.active_loans + bindparam('_active')),
+        [{'_id': id, '_total': total, '_active': active} for id, (total, active) in deltas.items()],
+    )
+    db.session.execute(
+        update(model).where(model.id.in_(deltas)).values(last_loaned_at=_last_loaned_at(model, ~deleted))
+        .execution_options(synchronize_session=False))
+    record_changes(table.name, deltas)
+
+
+def record_checkouts(book_ids, day):
+    """Count new loans of ``book_ids`` made on ``day`` (the counters are bumped by the checkout itself)"""
+    if book_ids:
+        _apply_monthly(Counter({(month_start(day), book_id, 'loans'): n for book_id, n in Counter(book_ids).items()}))
+
+
+def record_returns(book_ids, day):
+    """Count returns of ``book_ids`` made on ``day``"""
+    if book_ids:
+        _apply_monthly(Counter({(month_start(day), book_id, 'returns'): n for book_id, n in Counter(book_ids).items()}))
+
+
+def _remove(events, book_deltas, borrower_deltas, deleted):
+    """Apply negative ``events`` and counter deltas, then drop monthly rows that are back to zero"""
+    if not events:
+        return
+    _apply_monthly(events)
+    _apply_counts(Book, book_deltas, deleted)
+    _apply_counts(Borrower, borrower_deltas, deleted)
+    _drop_empty_months({month for month, _, _ in events})
+
+
+def _drop_empty_months(months):
+    # Drop rows that are back to zero so they do not show up in rankings
+    db.session.execute(delete(MonthlyCirculation).where(
+        MonthlyCirculation.month.in_(months), MonthlyCirculation.loans == 0, MonthlyCirculation.returns == 0))
+
+
+def record_book_moved(book_id, genre, author_id):
+    """Move a book's loans and returns from its old ``genre`` and ``author_id`` to its current ones.
+
+    Call after changing the book's genre or author, in the same transaction.
+    The book's history is counted per month in SQL, so this reads one row
+    per month the book was lent or returned in.
+    """
+    events = Counter()
+    for column, date_column in (('loans', LoanHistory.loan_date), ('returns', LoanHistory.return_date)):
+        month = month_start_sql(date_column)
+        counts = db.session.execute(
+            select(month, func.count()).where(LoanHistory.book_id == book_id, date_column.isnot(None)).group_by(month))
+        for day, n in counts:
+            events[(day, book_id, column)] += n
+    if not events:
+        return
+    _apply_monthly(Counter({key: -n for key, n in events.items()}), {book_id: (genre or '', author_id)})
+    _apply_monthly(events)
+    _drop_empty_months({month for month, _, _ in events})
+
+
+def record_deleted_loans(loans):
+    """Take loans about to be deleted back out of the rollups and counters"""
+    events = Counter()
+    book_deltas = defaultdict(lambda: [0, 0])
+    borrower_deltas = defaultdict(lambda: [0, 0])
+    for loan in loans:
+        events[(month_start(loan.loan_date), loan.book_id, 'loans')] -= 1
+        if loan.return_date:
+            events[(month_start(loan.return_date), loan.book_id, 'returns')] -= 1
+        active = -1 if loan.status in OUTSTANDING_STATUSES else 0
+        for deltas, id in ((book_deltas, loan.book_id), (borrower_deltas, loan.borrower_id)):
+            deltas[id][0] -= 1
+            deltas[id][1] += active
+    _remove(events, book_deltas, borrower_deltas, LoanHistory.id.in_([loan.id for loan in loans]))
+
+
+def record_deleted_history(column, value):
+    """Take the live and archived loans with ``column`` equal to ``value`` out of the rollups and counters.
+
+    Call before deleting them. The loans are counted per book, borrower,
+    month and status in SQL, so this reads a handful of rows however long
+    the history is.
+    """
+    events = Counter()
+    book_deltas = defaultdict(lambda: [0, 0])
+    borrower_deltas = defaultdict(lambda: [0, 0])
+    for table in (Loan.__table__, ArchivedLoan.__table__):
+        loan_month, return_month = month_start_sql(table.c.loan_date), month_start_sql(table.c.return_date)
+        groups = (table.c.book_id, table.c.borrower_id, loan_month, return_month, table.c.status)
+        counts = db.session.execute(select(*groups, func.count()).where(table.c[column] == value).group_by(*groups))
+        for book_id, borrower_id, loaned, returned, status, n in counts:
+            events[(loaned, book_id, 'loans')] -= n
+            if returned:
+                events[(returned, book_id, 'returns')] -= n
+            active = -n if status in OUTSTANDING_STATUSES else 0
+            for deltas, id in ((book_deltas, book_id), (borrower_deltas, borrower_id)):
+                deltas[id][0] -= n
+                deltas[id][1] += active
+    _remove(events, book_deltas, borrower_deltas, getattr(LoanHistory, column) == value)
+
+
+def reconcile_counters():
+    """Recompute the loan counters of every book and borrower, fixing any drift.
+
+    One correlated UPDATE per table, which only writes the rows whose
+    counters are wrong. Returns ``{'books': n, 'borrowers': n}`` rows repaired.
+    """
+    repaired = {}
+    for name, model in (('books', Book), ('borrowers', Borrower)):
+        live, archived = Loan.__table__.c[COUNTED_BY[model]], ArchivedLoan.__table__.c[COUNTED_BY[model]]
+        total = (select(func.count()).where(live == model.id).scalar_subquery()
+                 + select(func.count()).where(archived == model.id).scalar_subquery())
+        active = select(func.count()).where(live == model.id, Loan.outstanding()).scalar_subquery()
+        last = _last_loaned_at(model)
+        ids = db.session.scalars(
+            update(model)
+            .where(or_(model.total_loans != total, model.active_loans != active,
+                       model.last_loaned_at.is_distinct_from(last)))
+            .values(total_loans=total, active_loans=active, last_loaned_at=last)
+            .returning(model.id)
+            .execution_options(synchronize_session=False)
+        ).all()
+        record_changes(name, ids)
+        repaired[name] = len(ids)
+    db.session.commit()
+    return repaired
+
+
+def rebuild_stats():
+    """Recompute the monthly rollup and the loan counters from the live and archived loans"""
+    db.session.execute(delete(MonthlyCirculation))
+
+    for column, date_column in (('loans', LoanHistory.loan_date), ('returns', LoanHistory.return_date)):
+        month = month_start_sql(date_column)
+        genre = func.coalesce(Book.genre, '')
+        counts = (
+            select(month, genre, Book.author_id, func.count())
+            .select_from(LoanHistory).join(Book, Book.id == LoanHistory.book_id)
+            .where(date_column.isnot(None))
+            .group_by(month, genre, Book.author_id)
+        )
+        stmt = _upsert(MonthlyCirculation).from_select(['month', 'genre', 'author_id', column], counts)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['month', 'genre', 'author_id'],
+            set_={column: getattr(stmt.excluded, column)},
+        )
+        db.session.execute(stmt)
+    reconcile_counters()
@@ -0,0 +1,17 @@
+import argparse
+from datetime import date
+
+from app import create_app
+from app.archive import archive_loans
+
+app = create_app()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Move returned loans older than ARCHIVE_AFTER_DAYS into loans_archive (run nightly from cron)')
+    parser.add_argument('--before', type=date.fromisoformat, help='archive loans returned before this day (YYYY-MM-DD)')
+    parser.add_argument('--batch-size', type=int)
+    args = parser.parse_args()
+
+    with app.app_context():
+        moved = archive_loans(args.before, args.batch_size)
+    print(f"Archived {moved} returned loans")
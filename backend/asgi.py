@@ -0,0 +1,5 @@
+from app.async_api import create_asgi_app
+
+# Async read API for the GET endpoints; run next to the WSGI app in wsgi.py, e.g.
+#   uvicorn asgi:app --workers 4 --port 5001
+app = create_asgi_app()
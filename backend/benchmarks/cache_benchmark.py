@@ -0,0 +1,97 @@
+"""Read-heavy workload against the response cache.
+
+Runs the same request mix with the cache disabled and with the in-process
+backend, and prints the hit rate and the latency saved per request.
+
+    python benchmarks/cache_benchmark.py --books 20000 --requests 5000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+READ_URLS = [
+    '/api/books?limit=50',
+    '/api/books?limit=50&genre=Fiction',
+    '/api/authors?limit=100',
+    '/api/borrowers?limit=100',
+    '/api/loans/active?limit=50',
+]
+GENRES = ['Fiction', 'Mystery', 'Science', 'History', 'Fantasy']
+
+
+def seed(db, books):
+    from app.models.models import Author, Book, Borrower
+    db.session.execute(Author.__table__.insert(), [{'name': f'Author {i}'} for i in range(max(books // 20, 1))])
+    db.session.execute(Book.__table__.insert(), [
+        {'title': f'Book {i}', 'author_id': i % max(books // 20, 1) + 1, 'genre': GENRES[i % len(GENRES)],
+         'isbn': str(9780000000000 + i), 'available': True}
+        for i in range(books)
+    ])
+    db.session.execute(Borrower.__table__.insert(), [
+        {'name': f'Borrower {i}', 'email': f'borrower{i}@example.com'} for i in range(max(books // 10, 1))
+    ])
+    db.session.commit()
+
+
+def run_mix(client, requests, write_ratio, books, rng):
+    latencies = []
+    for _ in range(requests):
+        if rng.random() < write_ratio:
+            client.put(f'/api/books/{rng.randint(1, books)}', json={'pages': rng.randint(50, 900)})
+            continue
+        url = rng.choice(READ_URLS)
+        start = time.perf_counter()
+        response = client.get(url)
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200, url
+    latencies.sort()
+    return {
+        'mean_ms': statistics.mean(latencies) * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--write-ratio', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'cache_benchmark.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    from app import create_app
+    from app.extensions import db, response_cache
+    from app.search import create_search_index
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        create_search_index()
+        seed(db, args.books)
+
+    results = {}
+    for backend in ('null', 'simple'):
+        app.config['RESPONSE_CACHE'] = backend
+        response_cache.init_app(app)
+        response_cache.hits = response_cache.misses = 0
+        client = app.test_client()
+        results[backend] = run_mix(client, args.requests, args.write_ratio, args.books, random.Random(args.seed))
+        results[backend].update(response_cache.stats())
+
+    for backend, result in results.items():
+        print(f"{backend:>6}: mean {result['mean_ms']:.2f} ms  p95 {result['p95_ms']:.2f} ms  "
+              f"hit rate {result['hit_rate']:.1%}")
+    saved = results['null']['mean_ms'] - results['simple']['mean_ms']
+    print(f'latency saved per read: {saved:.2f} ms ({saved / results["null"]["mean_ms"]:.0%})')
+
+
+if __name__ == '__main__':
+    main()
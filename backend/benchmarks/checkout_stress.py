@@ -0,0 +1,90 @@
+"""Concurrent checkout stress test.
+
+Many threads race to borrow the same small set of books (and return them
+again). Afterwards every book must have at most one active loan, its
+``available`` flag must agree with that loan, and the loan counters on books
+and borrowers must need no repair. Exits non-zero otherwise. Uses a
+throwaway SQLite file unless DATABASE_URL is set.
+
+    python benchmarks/checkout_stress.py --threads 32 --attempts 200
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--attempts', type=int, default=200, help='requests per thread')
+    parser.add_argument('--books', type=int, default=5)
+    args = parser.parse_args()
+
+    if 'DATABASE_URL' not in os.environ:
+        path = os.path.join(tempfile.mkdtemp(), 'checkout_stress.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    from app import create_app
+    from app.extensions import db
+    from app.models.models import Author, Book, Borrower, Loan
+    from app.search import create_search_index
+    from app.stats import reconcile_counters
+
+    app = create_app()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        create_search_index()
+        db.session.add(Author(name='Stress Author'))
+        db.session.flush()
+        db.session.add_all(Book(title=f'Contended {i}', author_id=1) for i in range(args.books))
+        db.session.add_all(Borrower(name=f'Borrower {i}', email=f'stress{i}@example.com') for i in range(args.threads))
+        db.session.commit()
+
+    outcomes = Counter()
+    lock = threading.Lock()
+    start_line = threading.Barrier(args.threads)
+
+    def worker(borrower_id):
+        client = app.test_client()
+        rng = random.Random(borrower_id)
+        start_line.wait()
+        for _ in range(args.attempts):
+            response = client.post('/api/loans', json={'book_id': rng.randint(1, args.books), 'borrower_id': borrower_id})
+            outcome = 'borrowed' if response.status_code == 201 else 'refused'
+            if response.status_code == 201 and rng.random() < 0.5:
+                client.put(f"/api/loans/{response.json['id']}/return")
+            with lock:
+                outcomes[outcome] += 1
+
+    threads = [threading.Thread(target=worker, args=(i + 1,)) for i in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        active = Counter(book_id for book_id, in db.session.query(Loan.book_id).filter(Loan.status == 'active'))
+        available = dict(db.session.query(Book.id, Book.available))
+        drift = reconcile_counters()
+
+    double_loans = {book_id: count for book_id, count in active.items() if count > 1}
+    mismatched = [book_id for book_id, flag in available.items() if flag == bool(active.get(book_id))]
+    total = sum(outcomes.values())
+    print(f'{total} checkout attempts in {elapsed:.2f}s ({total / elapsed:.0f}/s): '
+          f"{outcomes['borrowed']} borrowed, {outcomes['refused']} refused")
+    print(f'double loans: {double_loans or "none"}; availability mismatches: {mismatched or "none"}; '
+          f"counter drift: {drift['books']} books, {drift['borrowers']} borrowers")
+    sys.exit(1 if double_loans or mismatched or any(drift.values()) else 0)
+
+
+if __name__ == '__main__':
+    main()
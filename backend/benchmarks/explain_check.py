@@ -0,0 +1,145 @@
+"""Query-plan regression check for the hot read paths.
+
+Seeds a large database, calls each hot endpoint, captures every SELECT it
+issues and runs EXPLAIN on it. Exits non-zero if any plan contains a
+sequential scan that is not expected for that endpoint. Uses a throwaway
+SQLite file unless DATABASE_URL points at a (disposable) PostgreSQL
+database.
+
+    python benchmarks/explain_check.py --books 100000
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# (url, tables a full scan is acceptable on, per dialect). SQLite reports
+# walking a table in rowid order with an early LIMIT exit, which is how id
+# ordered keyset pages are served, as a plain SCAN, so those pages list the
+# table here.
+HOT_PATHS = [
+    ('/api/books?limit=50', {'sqlite': {'books'}}),
+    ('/api/books?limit=50&genre=Mystery', {}),
+    ('/api/books?limit=50&author_id=7', {}),
+    ('/api/books?limit=50&sort=title', {}),
+    ('/api/books/search?q=book', {}),
+    ('/api/books/123', {}),
+    ('/api/authors?limit=50&sort=name', {}),
+    ('/api/borrowers?limit=50&sort=name', {}),
+    ('/api/loans?limit=50', {'sqlite': {'loans', 'loans_archive'}}),
+    ('/api/loans?limit=50&borrower_id=42', {}),
+    ('/api/loans?limit=50&book_id=42', {}),
+    ('/api/loans/active?limit=50', {'sqlite': {'loans'}}),
+    ('/api/loans/active?limit=50&sort=due_date', {}),
+    ('/api/loans/overdue?limit=50', {}),
+    ('/api/loans/overdue?limit=50&borrower_id=42', {}),
+    ('/api/holds?limit=50&book_id=42', {}),
+    ('/api/holds?limit=50&borrower_id=42', {}),
+]
+
+GENRES = ['Fiction', 'Mystery', 'Science', 'History', 'Fantasy', 'Romance', 'Biography', 'Poetry']
+
+
+def seed(db, books):
+    from app.models.models import Author, Book, Borrower, Loan
+    rng = random.Random(7)
+    authors = max(books // 20, 1)
+    borrowers = max(books // 10, 1)
+    today = date.today()
+    db.session.execute(Author.__table__.insert(), [{'name': f'Author {i}'} for i in range(authors)])
+    db.session.execute(Book.__table__.insert(), [
+        {'title': f'Book {rng.random():.8f}', 'author_id': rng.randint(1, authors),
+         'genre': rng.choice(GENRES), 'publication_year': rng.randint(1900, 2024), 'available': True}
+        for _ in range(books)
+    ])
+    db.session.execute(Borrower.__table__.insert(), [
+        {'name': f'Borrower {i}', 'email': f'borrower{i}@example.com'} for i in range(borrowers)
+    ])
+    loans = []
+    for i in range(books * 2):
+        loan_date = today - timedelta(days=rng.randint(0, 3 * 365))
+        outstanding = rng.random() < 0.05
+        loans.append({
+            'book_id': rng.randint(1, books), 'borrower_id': rng.randint(1, borrowers),
+            'loan_date': loan_date, 'due_date': loan_date + timedelta(days=14),
+            'return_date': None if outstanding else loan_date + timedelta(days=rng.randint(1, 30)),
+            'status': 'active' if outstanding else 'returned', 'fine': 0,
+        })
+    db.session.execute(Loan.__table__.insert(), loans)
+    db.session.commit()
+
+
+def sequential_scans(connection, dialect, statement, parameters):
+    """Return the tables the plan for ``statement`` reads without an index"""
+    if dialect == 'postgresql':
+        plan = [row[0] for row in connection.exec_driver_sql(f'EXPLAIN {statement}', parameters)]
+        return {match for line in plan for match in re.findall(r'Seq Scan on (\w+)', line)}
+    plan = [row[-1] for row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)]
+    return {match.group(1) for line in plan
+            if (match := re.match(r'SCAN (\w+)$', line)) or (match := re.match(r'SCAN TABLE (\w+)$', line))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=100000)
+    args = parser.parse_args()
+
+    if 'DATABASE_URL' not in os.environ:
+        path = os.path.join(tempfile.mkdtemp(), 'explain_check.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    from sqlalchemy import event, text
+    from app import create_app
+    from app.extensions import db
+    from app.search import create_search_index, rebuild_search_index
+
+    app = create_app()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        create_search_index()
+        seed(db, args.books)
+        rebuild_search_index()
+        db.session.execute(text('ANALYZE'))
+        db.session.commit()
+        engine = db.engine
+        dialect = engine.dialect.name
+
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            captured.append((statement, parameters))
+
+    client = app.test_client()
+    failures = 0
+    for url, allowed in HOT_PATHS:
+        captured.clear()
+        event.listen(engine, 'before_cursor_execute', capture)
+        response = client.get(url)
+        event.remove(engine, 'before_cursor_execute', capture)
+        if response.status_code != 200:
+            print(f'FAIL {url}: HTTP {response.status_code}')
+            failures += 1
+            continue
+
+        with engine.connect() as connection:
+            scans = set()
+            for statement, parameters in captured:
+                scans |= sequential_scans(connection, dialect, statement, parameters)
+        unexpected = scans - allowed.get(dialect, set())
+        if unexpected:
+            failures += 1
+        print(f"{'FAIL' if unexpected else 'ok  '} {url} ({len(captured)} queries)"
+              + (f": sequential scan on {', '.join(sorted(unexpected))}" if unexpected else ''))
+
+    print(f'{failures} hot path(s) with unexpected sequential scans' if failures else 'No unexpected sequential scans')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
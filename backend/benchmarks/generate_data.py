@@ -0,0 +1,442 @@
+"""Deterministic synthetic library data at production scale.
+
+Builds authors, books, borrowers and years of loan history with skewed,
+library-like distributions: a small share of titles and borrowers accounts
+for most loans, genres follow a fixed mix, popular titles own more copies
+and a set share of the loans still out is overdue. Rows are generated in
+fixed-size chunks, each from its own seed, by a pool of worker processes,
+so the same --seed gives the same database whatever the worker count.
+On PostgreSQL the workers COPY their chunks in parallel; SQLite has a
+single writer, so the parent inserts the chunks with executemany as the
+workers produce them. Secondary indexes are dropped for the load and
+rebuilt afterwards.
+
+Writes to DATABASE_URL, --output (a SQLite file) or a throwaway SQLite
+file. With --fixture-dir the SQLite database for a given scale and seed is
+built once, kept there and copied for every later run:
+
+    python benchmarks/generate_data.py --books 2000000 --borrowers 300000 --loans 30000000 --workers 8
+    python benchmarks/generate_data.py --books 100000 --fixture-dir ~/.cache/library-fixtures --output bench.db
+"""
+import argparse
+import csv
+import hashlib
+import io
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from functools import lru_cache
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+CHUNK_SIZE = 50000
+
+# Relative share of the catalog per genre
+GENRES = {'Fiction': 28, 'Mystery': 14, 'Romance': 12, 'Fantasy': 10, 'Children': 9, 'Science': 8,
+          'History': 8, 'Biography': 7, 'Poetry': 4}
+FIRST_NAMES = ['Ava', 'Ben', 'Chloe', 'Daniel', 'Emma', 'Felix', 'Grace', 'Hugo', 'Isla', 'Jack', 'Kate', 'Liam',
+               'Maya', 'Noah', 'Olivia', 'Priya', 'Quinn', 'Ravi', 'Sofia', 'Tom', 'Uma', 'Victor', 'Wen', 'Yusuf']
+LAST_NAMES = ['Adams', 'Brown', 'Chen', 'Diaz', 'Evans', 'Fischer', 'Garcia', 'Hughes', 'Ito', 'Jones', 'Khan',
+              'Lopez', 'Martin', 'Nguyen', 'Okafor', 'Patel', 'Rossi', 'Smith', 'Tanaka', 'Walker', 'Young', 'Zhang']
+WORDS = ['river', 'night', 'garden', 'empire', 'shadow', 'winter', 'glass', 'harbor', 'letters', 'storm', 'silver',
+         'forest', 'crown', 'island', 'memory', 'fire', 'secret', 'light', 'stone', 'journey', 'city', 'song']
+
+# Popularity skew (Zipf exponents): most loans go to a few titles, borrowers are less lopsided
+BOOK_SKEW = 1.1
+BORROWER_SKEW = 0.9
+AUTHOR_SKEW = 1.0
+
+COLUMNS = {
+    'authors': ('id', 'name', 'biography', 'birth_date', 'created_at'),
+    'books': ('id', 'title', 'author_id', 'description', 'publication_year', 'isbn', 'genre', 'pages',
+              'image_url', 'copies', 'available_copies', 'available', 'created_at'),
+    'borrowers': ('id', 'name', 'email', 'phone', 'created_at'),
+    'loans': ('id', 'book_id', 'borrower_id', 'loan_date', 'due_date', 'return_date', 'status', 'fine',
+              'created_at'),
+}
+
+
+@dataclass(frozen=True)
+class Plan:
+    """What to generate; every row follows from these and the seed"""
+    books: int
+    authors: int
+    borrowers: int
+    loans: int  # returned loans making up the history
+    outstanding: int  # loans still out
+    overdue_rate: float  # share of the outstanding loans past their due date
+    years: int
+    seed: int
+    today: date
+    loan_days: int = 14
+    fine_per_day: Decimal = Decimal('0.25')
+    max_fine: Decimal = Decimal('20.00')
+    max_active_loans: int = 10
+
+    def key(self):
+        """Name of the fixture for this plan; the day it was built does not count"""
+        params = {name: str(value) for name, value in asdict(self).items() if name != 'today'}
+        return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def zipf_rank(u, n, s):
+    """Map a uniform ``u`` in [0, 1) to a 0-based rank among ``n`` with probability falling as rank ** -s"""
+    if s == 1:
+        x = n ** u
+    else:
+        x = ((n ** (1 - s) - 1) * u + 1) ** (1 / (1 - s))
+    return min(int(x) - 1, n - 1)
+
+
+@lru_cache(maxsize=None)
+def spreader(n):
+    """A multiplier coprime to ``n``, which scatters popularity ranks over ids 1..n"""
+    a = max(int(n * 0.6180339887), 1)
+    while math.gcd(a, n) != 1:
+        a += 1
+    return a
+
+
+def book_id(plan, rank):
+    return rank * spreader(plan.books) % plan.books + 1
+
+
+def borrower_id(plan, rank):
+    return rank * spreader(plan.borrowers) % plan.borrowers + 1
+
+
+def copies_of(plan, book_id):
+    """Copies the library owns of a title: the most borrowed titles are stocked deepest"""
+    rank = (book_id - 1) * pow(spreader(plan.books), -1, plan.books) % plan.books if plan.books > 1 else 0
+    share = rank / plan.books
+    return 8 if share < 0.001 else 4 if share < 0.01 else 2 if share < 0.1 else 1
+
+
+def fine(plan, days_late):
+    return min(days_late * plan.fine_per_day, plan.max_fine) if days_late > 0 else Decimal('0')
+
+
+def _rng(plan, table, chunk):
+    return random.Random(f'{plan.seed}:{table}:{chunk}')
+
+
+def _ids(count, chunk):
+    return range(chunk * CHUNK_SIZE + 1, min((chunk + 1) * CHUNK_SIZE, count) + 1)
+
+
+def _moment(rng, day):
+    return datetime.combine(day, datetime.min.time()) + timedelta(seconds=rng.randrange(8 * 3600, 20 * 3600))
+
+
+def _authors(plan, chunk):
+    rng = _rng(plan, 'authors', chunk)
+    rows = []
+    for id in _ids(plan.authors, chunk):
+        born = date(rng.randint(1850, 2000), rng.randint(1, 12), rng.randint(1, 28)) if rng.random() < 0.7 else None
+        biography = f'Writes about {rng.choice(WORDS)} and {rng.choice(WORDS)}.' if rng.random() < 0.4 else None
+        rows.append((id, f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}', biography, born,
+                     _moment(rng, plan.today - timedelta(days=plan.years * 365))))
+    return rows
+
+
+def _books(plan, chunk):
+    from app.models.models import PLACEHOLDER_IMAGE_URL
+    rng = _rng(plan, 'books', chunk)
+    genres, weights = zip(*GENRES.items())
+    added = plan.today - timedelta(days=plan.years * 365)
+    rows = []
+    for id in _ids(plan.books, chunk):
+        words = rng.sample(WORDS, 3)
+        title = rng.choice([f'The {words[0].title()} of {words[1].title()}', f'{words[0].title()} and {words[1].title()}',
+                            f'A {words[0].title()} {words[1].title()} {words[2].title()}'])
+        description = ' '.join(rng.choices(WORDS, k=rng.randint(8, 30))).capitalize() + '.' \
+            if rng.random() < 0.6 else None
+        copies = copies_of(plan, id)
+        rows.append((
+            id, title, zipf_rank(rng.random(), plan.authors, AUTHOR_SKEW) + 1, description,
+            max(plan.today.year - int(rng.expovariate(1 / 20)), 1800), f'978{id:010d}',
+            rng.choices(genres, weights)[0], max(int(rng.gauss(320, 120)), 40), PLACEHOLDER_IMAGE_URL,
+            copies, copies, True, _moment(rng, added),
+        ))
+    return rows
+
+
+def _borrowers(plan, chunk):
+    rng = _rng(plan, 'borrowers', chunk)
+    joined = plan.today - timedelta(days=plan.years * 365)
+    rows = []
+    for id in _ids(plan.borrowers, chunk):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        phone = f'555-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}' if rng.random() < 0.8 else None
+        rows.append((id, f'{first} {last}', f'{first}.{last}.{id}@example.com'.lower(), phone,
+                     _moment(rng, joined + timedelta(days=rng.randrange(plan.years * 365)))))
+    return rows
+
+
+def _loans(plan, chunk):
+    """Returned loans; chunk ``c`` covers the c-th slice of the history, so ids follow loan dates"""
+    rng = _rng(plan, 'loans', chunk)
+    ids = _ids(plan.loans, chunk)
+    # The history ends before the last possible due date of a loan still out
+    first = plan.today - timedelta(days=plan.years * 365)
+    span = plan.years * 365 - 90
+    chunks = math.ceil(plan.loans / CHUNK_SIZE)
+    start, end = span * chunk // chunks, max(span * (chunk + 1) // chunks, span * chunk // chunks + 1)
+    days = sorted(rng.randrange(start, end) for _ in ids)
+    rows = []
+    for id, offset in zip(ids, days):
+        loan_date = first + timedelta(days=offset)
+        due_date = loan_date + timedelta(days=plan.loan_days)
+        # Most come back on time; the late tail is what fines are made of
+        kept = rng.randint(3, plan.loan_days) if rng.random() < 0.85 else rng.randint(plan.loan_days + 1, 60)
+        return_date = loan_date + timedelta(days=kept)
+        rows.append((
+            id, book_id(plan, zipf_rank(rng.random(), plan.books, BOOK_SKEW)),
+            borrower_id(plan, zipf_rank(rng.random(), plan.borrowers, BORROWER_SKEW)),
+            loan_date, due_date, return_date, 'returned', fine(plan, (return_date - due_date).days),
+            _moment(rng, loan_date),
+        ))
+    return rows
+
+
+def outstanding_loans(plan):
+    """Loans still out, at most one per copy and MAX_ACTIVE_LOANS per borrower; ids follow the history"""
+    rng = _rng(plan, 'outstanding', 0)
+    per_book, per_borrower = Counter(), Counter()
+    loans = []
+    for _ in range(plan.outstanding * 20):
+        if len(loans) == plan.outstanding:
+            break
+        book = book_id(plan, zipf_rank(rng.random(), plan.books, BOOK_SKEW))
+        borrower = borrower_id(plan, zipf_rank(rng.random(), plan.borrowers, BORROWER_SKEW))
+        if per_book[book] >= copies_of(plan, book) or (
+                plan.max_active_loans and per_borrower[borrower] >= plan.max_active_loans):
+            continue
+        per_book[book] += 1
+        per_borrower[borrower] += 1
+        if rng.random() < plan.overdue_rate:
+            loan_date = plan.today - timedelta(days=rng.randint(plan.loan_days + 1, plan.loan_days + 75))
+        else:
+            loan_date = plan.today - timedelta(days=rng.randint(0, plan.loan_days))
+        loans.append((book, borrower, loan_date, _moment(rng, loan_date)))
+    loans.sort(key=lambda loan: loan[3])
+    rows = []
+    for id, (book, borrower, loan_date, created_at) in enumerate(loans, plan.loans + 1):
+        due_date = loan_date + timedelta(days=plan.loan_days)
+        days_late = (plan.today - due_date).days
+        rows.append((id, book, borrower, loan_date, due_date, None, 'overdue' if days_late > 0 else 'active',
+                     fine(plan, days_late), created_at))
+    return rows
+
+
+GENERATORS = {'authors': _authors, 'books': _books, 'borrowers': _borrowers, 'loans': _loans}
+_engines = {}
+
+
+def copy_rows(url, table, rows):
+    """COPY ``rows`` of ``table`` into PostgreSQL on a connection of this process's own"""
+    import sqlalchemy as sa
+    from sqlalchemy.pool import NullPool
+    engine = _engines.get(url)
+    if engine is None:
+        engine = _engines[url] = sa.create_engine(url, poolclass=NullPool)
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.copy_expert(f'COPY {table} ({", ".join(COLUMNS[table])}) FROM STDIN WITH (FORMAT csv)', buffer)
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def _chunk(plan, table, chunk, url):
+    rows = GENERATORS[table](plan, chunk)
+    if url is None:
+        return rows
+    copy_rows(url, table, rows)
+    return len(rows)
+
+
+def _in_order(pool, tasks, window):
+    """Run ``tasks`` on ``pool`` and yield their results in order, with at most ``window`` in flight"""
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.submit(*task))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def generate(db, plan, workers=None, log=print):
+    """Fill the (empty, migrated) database of the current app with ``plan``'s data"""
+    from sqlalchemy import func, select, text, update
+    from sqlalchemy.schema import DropIndex
+    from app.models.models import Author, Book, Borrower, Loan
+    from app.search import rebuild_search_index
+    from app.stats import rebuild_stats
+
+    tables = {'authors': Author.__table__, 'books': Book.__table__, 'borrowers': Borrower.__table__,
+              'loans': Loan.__table__}
+    engine = db.engine
+    postgres = engine.dialect.name == 'postgresql'
+    url = engine.url.render_as_string(hide_password=False) if postgres else None
+    workers = workers or os.cpu_count()
+
+    indexes = [index for table in tables.values() for index in table.indexes]
+    for index in indexes:
+        # IF EXISTS rather than checkfirst, which cannot reflect the expression indexes and skips them
+        db.session.execute(DropIndex(index, if_exists=True))
+    db.session.commit()
+
+    with ProcessPoolExecutor(workers) as pool:
+        for name, count in (('authors', plan.authors), ('books', plan.books), ('borrowers', plan.borrowers),
+                            ('loans', plan.loans)):
+            started = time.perf_counter()
+            tasks = [(_chunk, plan, name, chunk, url) for chunk in range(math.ceil(count / CHUNK_SIZE))]
+            for rows in _in_order(pool, tasks, workers * 2):
+                if not postgres:
+                    db.session.execute(tables[name].insert(), [dict(zip(COLUMNS[name], row)) for row in rows])
+            db.session.commit()
+            elapsed = time.perf_counter() - started
+            log(f'{name}: {count} rows in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.0f}/s)')
+
+    rows = outstanding_loans(plan)
+    if postgres:
+        copy_rows(url, 'loans', rows)
+    else:
+        db.session.execute(Loan.__table__.insert(), [dict(zip(COLUMNS['loans'], row)) for row in rows])
+    db.session.commit()
+    overdue = sum(1 for row in rows if row[6] == 'overdue')
+    log(f'outstanding loans: {len(rows)} ({overdue} overdue)')
+
+    started = time.perf_counter()
+    for index in indexes:
+        index.create(db.session.connection())
+    # Take the copies out on loan off the shelf
+    out = select(func.count()).where(Loan.book_id == Book.id, Loan.outstanding()).scalar_subquery()
+    db.session.execute(
+        update(Book).where(Book.id.in_(select(Loan.book_id).where(Loan.outstanding())))
+        .values(available_copies=Book.copies - out, available=Book.copies - out > 0)
+        .execution_options(synchronize_session=False))
+    if postgres:
+        # The ids were written explicitly, so move the sequences past them
+        for name in tables:
+            db.session.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{name}', 'id'), (SELECT coalesce(max(id), 1) FROM {name}))"))
+    db.session.commit()
+    rebuild_search_index()
+    rebuild_stats()
+    db.session.execute(text('ANALYZE'))
+    db.session.commit()
+    log(f'indexes, search index and stats rebuilt in {time.perf_counter() - started:.1f}s')
+
+
+def prepare(app, plan, fixture_dir=None, workers=None, log=print):
+    """Give the app's database ``plan``'s data, from the fixture in ``fixture_dir`` when there is one.
+
+    The database is recreated from scratch. Fixtures are SQLite files named
+    after the plan; a missing one is generated into the app's database and
+    then copied into ``fixture_dir``. Returns 'reused' or 'generated'.
+    """
+    from flask_migrate import stamp
+    from app.extensions import db
+    from app.search import create_search_index
+
+    with app.app_context():
+        engine = db.engine
+        fixture = None
+        if fixture_dir:
+            if engine.dialect.name != 'sqlite' or not engine.url.database:
+                raise RuntimeError('Fixtures are SQLite files; clone a PostgreSQL database with createdb -T instead')
+            fixture = os.path.join(os.path.expanduser(fixture_dir), f'library-{plan.key()}.db')
+            if os.path.exists(fixture):
+                engine.dispose()
+                shutil.copyfile(fixture, engine.url.database)
+                log(f'reused fixture {fixture}')
+                return 'reused'
+
+        db.drop_all()
+        db.create_all()
+        create_search_index()
+        stamp(directory=os.path.join(os.path.dirname(__file__), '..', 'migrations'))
+        generate(db, plan, workers, log)
+
+        if fixture:
+            engine.dispose()
+            os.makedirs(os.path.dirname(fixture), exist_ok=True)
+            shutil.copyfile(engine.url.database, f'{fixture}.tmp')
+            os.replace(f'{fixture}.tmp', fixture)
+            log(f'saved fixture {fixture}')
+        return 'generated'
+
+
+def make_plan(config, books, seed=42, authors=None, borrowers=None, loans=None, outstanding=None,
+              overdue_rate=0.15, years=3):
+    """A Plan scaled from the catalog size, with the app's fine and loan limit settings"""
+    loans = books * 10 if loans is None else loans
+    return Plan(
+        books=books,
+        authors=authors or max(books // 20, 1),
+        borrowers=borrowers or max(books // 10, 1),
+        loans=loans,
+        outstanding=loans // 50 if outstanding is None else outstanding,
+        overdue_rate=overdue_rate,
+        years=years,
+        seed=seed,
+        today=date.today(),
+        fine_per_day=Decimal(config['FINE_PER_DAY']),
+        max_fine=Decimal(config['MAX_FINE']),
+        max_active_loans=config['MAX_ACTIVE_LOANS'],
+    )
+
+
+def add_arguments(parser, books=100000):
+    parser.add_argument('--books', type=int, default=books)
+    parser.add_argument('--authors', type=int, help='default: books / 20')
+    parser.add_argument('--borrowers', type=int, help='default: books / 10')
+    parser.add_argument('--loans', type=int, help='returned loans in the history; default: books * 10')
+    parser.add_argument('--outstanding', type=int, help='loans still out; default: loans / 50')
+    parser.add_argument('--overdue-rate', type=float, default=0.15, help='share of the outstanding loans overdue')
+    parser.add_argument('--years', type=int, default=3, help='years of loan history')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, help='generator processes; default: one per CPU')
+    parser.add_argument('--fixture-dir', help='build the SQLite database once per plan here and reuse it')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--output', help='SQLite file to write instead of DATABASE_URL')
+    args = parser.parse_args()
+
+    if args.output:
+        os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(args.output)}'
+    elif 'DATABASE_URL' not in os.environ:
+        path = os.path.join(tempfile.mkdtemp(), 'generated.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    from app import create_app
+
+    app = create_app()
+    plan = make_plan(app.config, args.books, args.seed, args.authors, args.borrowers, args.loans, args.outstanding,
+                     args.overdue_rate, args.years)
+    started = time.perf_counter()
+    outcome = prepare(app, plan, args.fixture_dir, args.workers)
+    print(f"{outcome} {os.environ['DATABASE_URL']} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Concurrent hold queue stress test.
+
+Many threads borrow, return, queue for and pick up a few titles with
+several copies each. Afterwards every copy of every title must be
+accounted for exactly once (on loan, set aside for a ready hold, or on the
+shelf), no hold may still be waiting while a copy sits on the shelf, and
+the loan counters must need no repair. Exits non-zero otherwise. Uses a
+throwaway SQLite file unless DATABASE_URL is set.
+
+    python benchmarks/hold_stress.py --threads 32 --attempts 200
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--attempts', type=int, default=200, help='actions per thread')
+    parser.add_argument('--books', type=int, default=3)
+    parser.add_argument('--copies', type=int, default=3, help='copies of each title')
+    args = parser.parse_args()
+
+    if 'DATABASE_URL' not in os.environ:
+        path = os.path.join(tempfile.mkdtemp(), 'hold_stress.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    from app import create_app
+    from app.extensions import db
+    from app.models.models import Author, Book, Borrower, Hold, Loan
+    from app.search import create_search_index
+    from app.stats import reconcile_counters
+
+    app = create_app()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        create_search_index()
+        db.session.add(Author(name='Stress Author'))
+        db.session.flush()
+        db.session.add_all(Book(title=f'Popular {i}', author_id=1, copies=args.copies, available_copies=args.copies)
+                           for i in range(args.books))
+        db.session.add_all(Borrower(name=f'Borrower {i}', email=f'holds{i}@example.com') for i in range(args.threads))
+        db.session.commit()
+
+    outcomes = Counter()
+    lock = threading.Lock()
+    start_line = threading.Barrier(args.threads)
+
+    def worker(borrower_id):
+        client = app.test_client()
+        rng = random.Random(borrower_id)
+        loans = []
+        start_line.wait()
+        for _ in range(args.attempts):
+            ready = client.get(f'/api/holds?borrower_id={borrower_id}&status=ready').json
+            if ready:
+                # Pick up a copy set aside for us
+                response = client.post('/api/loans', json={'book_id': ready[0]['book_id'], 'borrower_id': borrower_id})
+                outcome = 'picked up' if response.status_code == 201 else 'pickup failed'
+                if response.status_code == 201:
+                    loans.append(response.json['id'])
+            elif loans and rng.random() < 0.5:
+                response = client.put(f'/api/loans/{loans.pop(rng.randrange(len(loans)))}/return')
+                outcome = 'returned' if response.status_code == 200 else 'return failed'
+            else:
+                book_id = rng.randint(1, args.books)
+                response = client.post('/api/loans', json={'book_id': book_id, 'borrower_id': borrower_id})
+                if response.status_code == 201:
+                    loans.append(response.json['id'])
+                    outcome = 'borrowed'
+                else:
+                    response = client.post('/api/holds', json={'book_id': book_id, 'borrower_id': borrower_id})
+                    outcome = 'queued' if response.status_code == 201 else 'refused'
+                    if response.status_code == 201 and rng.random() < 0.2:
+                        client.put(f"/api/holds/{response.json['id']}/cancel")
+                        outcome = 'cancelled'
+            with lock:
+                outcomes[outcome] += 1
+
+    threads = [threading.Thread(target=worker, args=(i + 1,)) for i in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        on_loan = Counter(book_id for book_id, in db.session.query(Loan.book_id).filter(Loan.outstanding()))
+        set_aside = Counter(book_id for book_id, in db.session.query(Hold.book_id).filter(Hold.status == 'ready'))
+        waiting = Counter(book_id for book_id, in db.session.query(Hold.book_id).filter(Hold.status == 'waiting'))
+        books = db.session.query(Book.id, Book.copies, Book.available_copies, Book.available).all()
+        drift = reconcile_counters()
+
+    unaccounted = [book_id for book_id, copies, shelved, _ in books
+                   if shelved < 0 or on_loan[book_id] + set_aside[book_id] + shelved != copies]
+    skipped = [book_id for book_id, _, shelved, _ in books if shelved > 0 and waiting[book_id]]
+    mismatched = [book_id for book_id, _, shelved, flag in books if flag != (shelved > 0)]
+    total = sum(outcomes.values())
+    print(f'{total} actions in {elapsed:.2f}s ({total / elapsed:.0f}/s): '
+          + ', '.join(f'{count} {outcome}' for outcome, count in sorted(outcomes.items())))
+    print(f'copies unaccounted for: {unaccounted or "none"}; queues skipped over a shelved copy: {skipped or "none"}; '
+          f'availability mismatches: {mismatched or "none"}; '
+          f"counter drift: {drift['books']} books, {drift['borrowers']} borrowers")
+    sys.exit(1 if unaccounted or skipped or mismatched or any(drift.values()) else 0)
+
+
+if __name__ == '__main__':
+    main()
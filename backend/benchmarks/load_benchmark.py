@@ -0,0 +1,317 @@
+"""Mixed-workload load test of the API, per endpoint.
+
+Seeds a database at the requested scale, then drives a realistic mix of
+browsing, borrowing, returning and loan listing through the in-process
+app from one or more threads. For every endpoint it reports throughput,
+p50/p95/p99 latency, SQL queries per request and the process's peak RSS.
+Results can be saved as JSON and compared against an earlier run; the
+comparison exits non-zero when an endpoint regressed. --fixture-dir swaps
+the uniform seed for generate_data.py's skewed data. Uses a throwaway
+SQLite file unless DATABASE_URL points at a (disposable) PostgreSQL
+database.
+
+    python benchmarks/load_benchmark.py --books 50000 --requests 20000 --output after.json --baseline before.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+GENRES = ['Fiction', 'Mystery', 'Science', 'History', 'Fantasy', 'Romance', 'Biography', 'Poetry']
+WORDS = ['river', 'night', 'garden', 'empire', 'shadow', 'winter', 'glass', 'harbor', 'letters', 'storm']
+
+# (endpoint, weight): roughly what the frontend does, mostly reads
+WORKLOAD = [
+    ('GET /api/books', 30),
+    ('GET /api/books/{id}', 15),
+    ('GET /api/books/search', 10),
+    ('GET /api/authors', 5),
+    ('GET /api/borrowers', 5),
+    ('GET /api/loans/active', 15),
+    ('POST /api/loans', 10),
+    ('PUT /api/loans/{id}/return', 10),
+]
+
+
+def seed(db, books, rng):
+    """Catalog of ``books`` books with three years of loan history, 5% still out"""
+    from app.models.models import Author, Book, Borrower, Loan
+    authors = max(books // 20, 1)
+    borrowers = max(books // 10, 1)
+    today = date.today()
+    outstanding = set(rng.sample(range(1, books + 1), books // 20))
+    db.session.execute(Author.__table__.insert(), [{'name': f'Author {i}'} for i in range(authors)])
+    db.session.execute(Book.__table__.insert(), [
+        {'title': f'The {rng.choice(WORDS).title()} of {rng.choice(WORDS).title()} {i}',
+         'author_id': rng.randint(1, authors), 'genre': rng.choice(GENRES),
+         'publication_year': rng.randint(1900, 2024), 'available': i not in outstanding,
+         'available_copies': 0 if i in outstanding else 1}
+        for i in range(1, books + 1)
+    ])
+    db.session.execute(Borrower.__table__.insert(), [
+        {'name': f'Borrower {i}', 'email': f'borrower{i}@example.com'} for i in range(borrowers)
+    ])
+    loans = []
+    for _ in range(books * 2):
+        loan_date = today - timedelta(days=rng.randint(30, 3 * 365))
+        loans.append({
+            'book_id': rng.randint(1, books), 'borrower_id': rng.randint(1, borrowers),
+            'loan_date': loan_date, 'due_date': loan_date + timedelta(days=14),
+            'return_date': loan_date + timedelta(days=rng.randint(1, 30)), 'status': 'returned', 'fine': 0,
+        })
+    for book_id in outstanding:
+        loan_date = today - timedelta(days=rng.randint(0, 13))
+        loans.append({
+            'book_id': book_id, 'borrower_id': rng.randint(1, borrowers), 'loan_date': loan_date,
+            'due_date': loan_date + timedelta(days=14), 'return_date': None, 'status': 'active', 'fine': 0,
+        })
+    db.session.execute(Loan.__table__.insert(), loans)
+    db.session.commit()
+    return authors, borrowers
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024  # bytes on macOS, KiB elsewhere
+
+
+def percentile(ordered, fraction):
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class Workload:
+    """Issues one request of a randomly chosen kind and records what it cost"""
+
+    def __init__(self, books, borrowers, active_loan_ids):
+        self.books = books
+        self.borrowers = borrowers
+        self.active = list(active_loan_ids)
+        self.lock = threading.Lock()
+        self.endpoints, weights = zip(*WORKLOAD)
+        self.cumulative = [sum(weights[:i + 1]) for i in range(len(weights))]
+        self.samples = defaultdict(list)  # endpoint -> [(seconds, queries, status, peak rss)]
+
+    def request(self, client, rng):
+        endpoint = rng.choices(self.endpoints, cum_weights=self.cumulative)[0]
+        method, url, body = self._build(endpoint, rng)
+        if url is None:
+            return None
+        queries.count = 0
+        start = time.perf_counter()
+        response = client.open(url, method=method, json=body)
+        elapsed = time.perf_counter() - start
+        if endpoint == 'POST /api/loans' and response.status_code == 201:
+            with self.lock:
+                self.active.append(response.json['id'])
+        return endpoint, (elapsed, queries.count, response.status_code, peak_rss_mb())
+
+    def _build(self, endpoint, rng):
+        if endpoint == 'GET /api/books':
+            genre = f'&genre={rng.choice(GENRES)}' if rng.random() < 0.5 else ''
+            return 'GET', f'/api/books?limit=50{genre}', None
+        if endpoint == 'GET /api/books/{id}':
+            return 'GET', f'/api/books/{rng.randint(1, self.books)}', None
+        if endpoint == 'GET /api/books/search':
+            return 'GET', f'/api/books/search?q={rng.choice(WORDS)}', None
+        if endpoint == 'GET /api/authors':
+            return 'GET', '/api/authors?limit=50&sort=name', None
+        if endpoint == 'GET /api/borrowers':
+            return 'GET', '/api/borrowers?limit=50&sort=name', None
+        if endpoint == 'GET /api/loans/active':
+            return 'GET', '/api/loans/active?limit=50', None
+        if endpoint == 'POST /api/loans':
+            return 'POST', '/api/loans', {'book_id': rng.randint(1, self.books),
+                                          'borrower_id': rng.randint(1, self.borrowers)}
+        with self.lock:
+            if not self.active:
+                return None, None, None
+            loan_id = self.active.pop(rng.randrange(len(self.active)))
+        return 'PUT', f'/api/loans/{loan_id}/return', None
+
+
+queries = threading.local()
+
+
+def run(app, workload, requests, threads, warmup, seed):
+    def worker(index, count, record):
+        client = app.test_client()
+        rng = random.Random(seed * 1000 + index)
+        for _ in range(count):
+            result = workload.request(client, rng)
+            if result and record:
+                endpoint, sample = result
+                with workload.lock:
+                    workload.samples[endpoint].append(sample)
+
+    def spread(total, record):
+        pool = [threading.Thread(target=worker, args=(i, total // threads + (i < total % threads), record))
+                for i in range(threads)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+
+    spread(warmup, False)
+    started = time.perf_counter()
+    spread(requests, True)
+    return time.perf_counter() - started
+
+
+def summarize(samples, elapsed):
+    def describe(rows, wall):
+        latencies = sorted(seconds for seconds, _, _, _ in rows)
+        return {
+            'requests': len(rows),
+            'errors': sum(1 for _, _, status, _ in rows if status >= 500),
+            'throughput_rps': round(len(rows) / wall, 1),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+            'queries_per_request': round(sum(count for _, count, _, _ in rows) / len(rows), 2),
+            'peak_rss_mb': max((rss for _, _, _, rss in rows if rss is not None), default=None),
+        }
+
+    # An endpoint's throughput is measured against the time spent serving it,
+    # so it does not depend on its share of the mix
+    endpoints = {name: describe(rows, sum(seconds for seconds, _, _, _ in rows))
+                 for name, rows in sorted(samples.items())}
+    overall = describe([row for rows in samples.values() for row in rows], elapsed)
+    return endpoints, overall
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """Return a line per metric that got worse than ``baseline`` by more than ``tolerance``"""
+    regressions = []
+    rows = [('overall', results['overall'], baseline['overall'])]
+    rows += [(name, stats, baseline['endpoints'][name])
+             for name, stats in results['endpoints'].items() if name in baseline['endpoints']]
+    for name, new, old in rows:
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+            if new[metric] > old[metric] * (1 + tolerance):
+                regressions.append(f'{name}: {metric} {old[metric]} -> {new[metric]}')
+        if new['throughput_rps'] < old['throughput_rps'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput_rps {old['throughput_rps']} -> {new['throughput_rps']}")
+        # Query counts move with the code, not with machine load; the margin
+        # only absorbs small shifts in the success/failure mix of writes
+        if new['queries_per_request'] > old['queries_per_request'] + 0.25:
+            regressions.append(f"{name}: queries_per_request {old['queries_per_request']} -> {new['queries_per_request']}")
+        if new['errors'] > old['errors']:
+            regressions.append(f"{name}: errors {old['errors']} -> {new['errors']}")
+    old_rss, new_rss = baseline['overall']['peak_rss_mb'], results['overall']['peak_rss_mb']
+    if old_rss and new_rss and new_rss > old_rss * (1 + tolerance):
+        regressions.append(f'overall: peak_rss_mb {old_rss:.1f} -> {new_rss:.1f}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=20000, help='catalog size; authors, borrowers and loans scale with it')
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--warmup', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--fixture-dir', help='use skewed data from generate_data.py, built once per scale and kept here')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare against the JSON results of an earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='allowed relative slowdown before flagging')
+    args = parser.parse_args()
+
+    if 'DATABASE_URL' not in os.environ:
+        path = os.path.join(tempfile.mkdtemp(), 'load_benchmark.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    from sqlalchemy import event
+    from app import create_app
+    from app.extensions import db
+    from app.models.models import Loan
+    from app.search import create_search_index, rebuild_search_index
+    from app.stats import rebuild_stats
+
+    app = create_app()
+    if args.fixture_dir:
+        from generate_data import make_plan, prepare
+        plan = make_plan(app.config, args.books, args.seed)
+        prepare(app, plan, args.fixture_dir)
+        borrowers = plan.borrowers
+    with app.app_context():
+        if not args.fixture_dir:
+            db.drop_all()
+            db.create_all()
+            create_search_index()
+            _, borrowers = seed(db, args.books, random.Random(args.seed))
+            rebuild_search_index()
+            rebuild_stats()
+        active = [loan_id for loan_id, in db.session.query(Loan.id).filter(Loan.outstanding())]
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def count_query(conn, cursor, statement, parameters, context, executemany):
+        queries.count = getattr(queries, 'count', 0) + 1
+
+    workload = Workload(args.books, borrowers, active)
+    elapsed = run(app, workload, args.requests, args.threads, args.warmup, args.seed)
+    endpoints, overall = summarize(workload.samples, elapsed)
+    results = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'database': engine.dialect.name,
+            'python': platform.python_version(),
+            'books': args.books,
+            'requests': args.requests,
+            'threads': args.threads,
+            'seed': args.seed,
+        },
+        'overall': overall,
+        'endpoints': endpoints,
+    }
+    if args.fixture_dir:
+        results['meta']['data'] = 'generated'
+
+    print(f"{'endpoint':<30}{'req':>7}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}{'rss MB':>9}")
+    for name, stats in [*endpoints.items(), ('overall', overall)]:
+        rss = f"{stats['peak_rss_mb']:.1f}" if stats['peak_rss_mb'] is not None else '-'
+        print(f"{name:<30}{stats['requests']:>7}{stats['throughput_rps']:>10}{stats['p50_ms']:>10}"
+              f"{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['queries_per_request']:>9}{rss:>9}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        changed = [key for key in ('database', 'books', 'requests', 'threads', 'seed', 'data')
+                   if baseline['meta'].get(key) != results['meta'].get(key)]
+        if changed:
+            print(f"warning: baseline was run with different {', '.join(changed)}; numbers are not comparable")
+        regressions = compare(results, baseline, args.tolerance)
+        print('\n'.join(f'REGRESSION {line}' for line in regressions) or 'No regressions against the baseline')
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Query-count check for the list routes.
+
+Seeds a database, requests every list route at two page sizes and counts
+the SQL statements each request issues. A route that loads a relationship
+per row issues more statements for the larger page; the check fails, and
+exits non-zero, unless every route issues the same number at both sizes.
+Uses a throwaway SQLite file unless DATABASE_URL points at a (disposable)
+PostgreSQL database.
+
+    python benchmarks/query_count_check.py
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Every GET route that returns a list of rows, without its page size. The
+# exports are left out: they stream the whole result in fixed-size batches.
+LIST_ROUTES = [
+    '/api/books?',
+    '/api/books?sort=title&genre=Mystery&',
+    '/api/books/search?q=book&',
+    '/api/authors?sort=name&',
+    '/api/borrowers?sort=name&',
+    '/api/loans?',
+    '/api/loans?sort=loan_date&',
+    '/api/loans/active?',
+    '/api/loans/overdue?',
+    '/api/holds?',
+    '/api/changes?since=0&',
+    '/api/stats/top-books?',
+    '/api/stats/genres?',
+    '/api/stats/authors?',
+    '/api/stats/borrowers?',
+]
+
+# The two page sizes compared; the larger must return more rows, though not always all 20 (there are 8 genres)
+PAGE_SIZES = (2, 20)
+
+
+def seed_holds(db, books, borrowers):
+    from app.models.models import Hold
+    rng = random.Random(11)
+    pairs = {(rng.randint(1, books), rng.randint(1, borrowers)) for _ in range(200)}
+    db.session.execute(Hold.__table__.insert(), [
+        {'book_id': book_id, 'borrower_id': borrower_id, 'status': 'waiting'} for book_id, borrower_id in pairs
+    ])
+    db.session.commit()
+
+
+def row_count(body):
+    """The number of rows in a list response, whether a bare list or the first list in an object"""
+    if isinstance(body, list):
+        return len(body)
+    return next((len(value) for value in body.values() if isinstance(value, list)), 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=2000)
+    args = parser.parse_args()
+
+    if 'DATABASE_URL' not in os.environ:
+        path = os.path.join(tempfile.mkdtemp(), 'query_count_check.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    from sqlalchemy import event
+    from app import create_app
+    from app.changes import record_changes
+    from app.extensions import db
+    from app.search import create_search_index, rebuild_search_index
+    from app.stats import rebuild_stats
+    from explain_check import seed
+
+    app = create_app()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        create_search_index()
+        seed(db, args.books)
+        seed_holds(db, args.books, max(args.books // 10, 1))
+        record_changes('books', range(1, 101))
+        db.session.commit()
+        rebuild_search_index()
+        rebuild_stats()
+        db.session.commit()
+        engine = db.engine
+
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    client = app.test_client()
+    failures = 0
+    for route in LIST_ROUTES:
+        counts, rows = [], []
+        for size in PAGE_SIZES:
+            url = f'{route}limit={size}'
+            statements.clear()
+            event.listen(engine, 'before_cursor_execute', count)
+            response = client.get(url)
+            event.remove(engine, 'before_cursor_execute', count)
+            if response.status_code != 200:
+                counts.append(f'HTTP {response.status_code}')
+                rows.append(0)
+            else:
+                counts.append(f'{len(statements)} queries')
+                rows.append(row_count(response.get_json()))
+        failed = len(set(counts)) != 1 or 'HTTP' in counts[0] or rows[0] >= rows[1]
+        failures += failed
+        print(f"{'FAIL' if failed else 'ok  '} {route.rstrip('?&')}: "
+              + ', '.join(f'{n} for {r} rows' for n, r in zip(counts, rows)))
+
+    print(f'{failures} list route(s) whose query count grows with the page' if failures
+          else 'Every list route issues a constant number of queries')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Throughput of the ORM and row fast-path serializers on large responses.
+
+Seeds a throwaway database, then serializes the same N books and N loans
+three ways: ORM instances through to_dict() and jsonify (the old path),
+RowSerializer with orjson, and RowSerializer with the stdlib json
+fallback. Checks that all three produce identical bytes and prints rows
+per second for each, plus the NDJSON export endpoint end to end.
+
+    python benchmarks/serialization_benchmark.py --rows 100000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+GENRES = ['Fiction', 'Mystery', 'Science', 'History', 'Fantasy']
+
+
+def seed(db, rows):
+    from app.models.models import Author, Book, Borrower, Loan
+    rng = random.Random(3)
+    today = date.today()
+    authors = max(rows // 20, 1)
+    borrowers = max(rows // 10, 1)
+    db.session.execute(Author.__table__.insert(), [{'name': f'Author {i}'} for i in range(authors)])
+    db.session.execute(Book.__table__.insert(), [
+        {'title': f'Book {i}', 'author_id': rng.randint(1, authors), 'genre': rng.choice(GENRES),
+         'description': 'A description long enough to look like a real blurb. ' * 3,
+         'publication_year': rng.randint(1900, 2024), 'isbn': str(9780000000000 + i), 'pages': rng.randint(80, 900),
+         'image_url': f'https://covers.example.com/{i}.jpg', 'available': rng.random() < 0.9}
+        for i in range(rows)
+    ])
+    db.session.execute(Borrower.__table__.insert(), [
+        {'name': f'Borrower {i}', 'email': f'borrower{i}@example.com'} for i in range(borrowers)
+    ])
+    loans = []
+    for _ in range(rows):
+        loan_date = today - timedelta(days=rng.randint(0, 365))
+        returned = rng.random() < 0.8
+        loans.append({
+            'book_id': rng.randint(1, rows), 'borrower_id': rng.randint(1, borrowers), 'loan_date': loan_date,
+            'due_date': loan_date + timedelta(days=14), 'return_date': loan_date + timedelta(days=7) if returned else None,
+            'status': 'returned' if returned else 'active', 'fine': 0,
+        })
+    db.session.execute(Loan.__table__.insert(), loans)
+    db.session.commit()
+
+
+def timed(fn, repeat):
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3, help='report the best of this many runs')
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'serialization_benchmark.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    from flask import jsonify
+    from app import create_app
+    from app.extensions import db
+    from app.models import serializers
+    from app.models.models import Book, Loan
+    from app.models.serializers import BOOK_ROWS, LOAN_ROWS, load_related
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        seed(db, args.rows)
+
+    orjson = serializers.orjson
+    cases = [
+        ('books', lambda: load_related(Book.query, Book.author).order_by(Book.id), BOOK_ROWS),
+        ('loans', lambda: load_related(Loan.query, Loan.book, Loan.borrower).order_by(Loan.id), LOAN_ROWS),
+    ]
+    for name, orm_query, rows in cases:
+        with app.test_request_context():
+            orm_time, orm_body = timed(lambda: jsonify([item.to_dict() for item in orm_query()]).get_data(), args.repeat)
+            results = [('ORM + to_dict + jsonify', orm_time)]
+            encoders = [('rows + orjson', orjson), ('rows + json', None)] if orjson else [('rows + json', None)]
+            for label, encoder in encoders:
+                serializers.orjson = encoder
+                fast_time, fast_body = timed(
+                    lambda: rows.response(rows.query().order_by(rows.model.id).all()).get_data(), args.repeat)
+                assert fast_body == orm_body, f'{label} output differs from to_dict() + jsonify'
+                results.append((label, fast_time))
+            serializers.orjson = orjson
+        print(f'{name} ({args.rows} rows, {len(orm_body) / 1e6:.1f} MB)')
+        for label, elapsed in results:
+            print(f'  {label:<26}{args.rows / elapsed:>12,.0f} rows/s  {orm_time / elapsed:>5.1f}x')
+
+    client = app.test_client()
+    for url in ('/api/books/export', '/api/loans/export'):
+        elapsed, body = timed(lambda: client.get(url).get_data(), args.repeat)
+        lines = body.count(b'\n')
+        print(f'GET {url:<20}{lines / elapsed:>12,.0f} rows/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,17 @@
+import argparse
+from datetime import datetime
+
+from app import create_app
+from app.changes import compact_changes
+
+app = create_app()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Drop superseded changes and those older than CHANGE_LOG_RETENTION_DAYS from the change log (run nightly from cron)')
+    parser.add_argument('--before', type=datetime.fromisoformat, help='drop every change logged before this time (YYYY-MM-DD[THH:MM])')
+    parser.add_argument('--batch-size', type=int)
+    args = parser.parse_args()
+
+    with app.app_context():
+        deleted = compact_changes(args.before, args.batch_size)
+    print(f"Deleted {deleted} changes from the change log")
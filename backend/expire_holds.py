@@ -0,0 +1,9 @@
+from app import create_app
+from app.circulation import expire_holds
+
+app = create_app()
+
+if __name__ == '__main__':
+    with app.app_context():
+        expired = expire_holds()
+    print(f"Expired {expired} holds that were not picked up")
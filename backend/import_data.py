@@ -0,0 +1,34 @@
+import argparse
+import sys
+
+from app import create_app
+from app.bulk_import import FORMATS, BulkImporter, iter_records
+
+app = create_app()
+
+def import_data(entity, path, fmt=None, batch_size=None, create_authors=True):
+    """Load a CSV or NDJSON file (or stdin when path is '-') into the database"""
+    fmt = fmt or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+    stream = sys.stdin.buffer if path == '-' else open(path, 'rb')
+    try:
+        with app.app_context():
+            importer = BulkImporter(batch_size=batch_size, create_authors=create_authors)
+            return importer.run(entity, iter_records(stream, fmt))
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bulk import authors, books or borrowers')
+    parser.add_argument('entity', choices=['authors', 'books', 'borrowers'])
+    parser.add_argument('path', help="CSV or NDJSON file, or '-' for stdin")
+    parser.add_argument('--format', choices=FORMATS, help='defaults to the file extension')
+    parser.add_argument('--batch-size', type=int)
+    parser.add_argument('--no-create-authors', action='store_true',
+                        help='reject books whose author name is unknown instead of creating the author')
+    args = parser.parse_args()
+
+    report = import_data(args.entity, args.path, args.format, args.batch_size, not args.no_create_authors)
+    print(f"Imported {report['imported']} {args.entity}, rejected {report['rejected']}")
+    for error in report['errors']:
+        print(f"  row {error['row']}: {error['error']}")
@@ -0,0 +1,76 @@
+"""initial schema
+
+The tables as run.py used to create them with db.create_all(). Databases
+created that way should be stamped at this revision (``flask db stamp
+0001``) before running ``flask db upgrade``.
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-18 19:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('authors',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.Column('biography', sa.Text(), nullable=True),
+        sa.Column('birth_date', sa.Date(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('borrowers',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.Column('email', sa.String(length=255), nullable=False),
+        sa.Column('phone', sa.String(length=20), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('email')
+    )
+    op.create_table('books',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(length=255), nullable=False),
+        sa.Column('author_id', sa.Integer(), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('publication_year', sa.Integer(), nullable=True),
+        sa.Column('isbn', sa.String(length=13), nullable=True),
+        sa.Column('genre', sa.String(length=100), nullable=True),
+        sa.Column('pages', sa.Integer(), nullable=True),
+        sa.Column('image_url', sa.Text(), nullable=True),
+        sa.Column('available', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['author_id'], ['authors.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('isbn')
+    )
+    op.create_table('loans',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('book_id', sa.Integer(), nullable=False),
+        sa.Column('borrower_id', sa.Integer(), nullable=False),
+        sa.Column('loan_date', sa.Date(), nullable=False),
+        sa.Column('due_date', sa.Date(), nullable=False),
+        sa.Column('return_date', sa.Date(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['book_id'], ['books.id'], ),
+        sa.ForeignKeyConstraint(['borrower_id'], ['borrowers.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('loans')
+    op.drop_table('books')
+    op.drop_table('borrowers')
+    op.drop_table('authors')
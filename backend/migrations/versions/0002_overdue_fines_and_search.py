@@ -0,0 +1,56 @@
+"""overdue fines and full-text search index
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 19:31:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+OUTSTANDING = sa.text("status IN ('active', 'overdue')")
+
+
+def upgrade():
+    with op.batch_alter_table('loans') as batch_op:
+        batch_op.add_column(sa.Column('fine', sa.Numeric(precision=10, scale=2), server_default='0', nullable=False))
+    op.create_index('ix_loans_outstanding_due_date', 'loans', ['due_date'],
+                    postgresql_where=OUTSTANDING, sqlite_where=OUTSTANDING)
+
+    # Same layout as app/search.py; filled from the existing catalog
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('CREATE TABLE book_search (book_id INTEGER PRIMARY KEY, document TSVECTOR NOT NULL)')
+        op.execute('CREATE INDEX ix_book_search_document ON book_search USING GIN (document)')
+        op.execute("""
+            INSERT INTO book_search (book_id, document)
+            SELECT b.id,
+                setweight(to_tsvector('english', coalesce(b.title, '')), 'A') ||
+                setweight(to_tsvector('english', coalesce(a.name, '')), 'B') ||
+                setweight(to_tsvector('english', coalesce(b.genre, '')), 'C') ||
+                setweight(to_tsvector('english', coalesce(b.description, '')), 'D')
+            FROM books b LEFT JOIN authors a ON a.id = b.author_id
+        """)
+    elif dialect == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE book_search USING fts5("
+                   "title, author_name, genre, description, tokenize = 'porter unicode61')")
+        op.execute("""
+            INSERT INTO book_search (rowid, title, author_name, genre, description)
+            SELECT b.id, b.title, a.name, b.genre, b.description
+            FROM books b LEFT JOIN authors a ON a.id = b.author_id
+        """)
+
+
+def downgrade():
+    if op.get_bind().dialect.name in ('postgresql', 'sqlite'):
+        op.execute('DROP TABLE book_search')
+    op.drop_index('ix_loans_outstanding_due_date', table_name='loans')
+    with op.batch_alter_table('loans') as batch_op:
+        batch_op.drop_column('fine')
@@ -0,0 +1,44 @@
+"""indexes for filtered and keyset-paginated lists
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 19:32:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_authors_name', 'authors', ['name', 'id']),
+    ('ix_books_author_id', 'books', ['author_id', 'id']),
+    ('ix_books_genre', 'books', ['genre', 'id']),
+    ('ix_books_title', 'books', ['title', 'id']),
+    ('ix_borrowers_name', 'borrowers', ['name', 'id']),
+    ('ix_loans_book_id_status', 'loans', ['book_id', 'status']),
+    ('ix_loans_borrower_id_status', 'loans', ['borrower_id', 'status']),
+    ('ix_loans_status', 'loans', ['status', 'id']),
+]
+
+OUTSTANDING = sa.text("status IN ('active', 'overdue')")
+
+
+def upgrade():
+    # On a busy PostgreSQL database, build these with CREATE INDEX CONCURRENTLY
+    # by hand first; create_index then finds nothing left to do
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, if_not_exists=True)
+    op.create_index('ix_loans_outstanding_id', 'loans', ['id'], if_not_exists=True,
+                    postgresql_where=OUTSTANDING, sqlite_where=OUTSTANDING)
+
+
+def downgrade():
+    op.drop_index('ix_loans_outstanding_id', table_name='loans')
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,65 @@
+"""circulation rollups behind /api/stats
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 19:33:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('monthly_circulation',
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('genre', sa.String(length=100), nullable=False),
+    sa.Column('author_id', sa.Integer(), nullable=False),
+    sa.Column('loans', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('returns', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('month', 'genre', 'author_id')
+    )
+    op.create_table('book_circulation',
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('total_loans', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('active_loans', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['book_id'], ['books.id'], ),
+    sa.PrimaryKeyConstraint('book_id')
+    )
+    op.create_index('ix_book_circulation_total_loans', 'book_circulation', ['total_loans', 'book_id'])
+
+    # Same totals as app/stats.py rebuild_stats(), from the existing loans
+    if op.get_bind().dialect.name == 'postgresql':
+        loan_month, return_month = "date_trunc('month', l.loan_date)::date", "date_trunc('month', l.return_date)::date"
+    else:
+        loan_month, return_month = "date(l.loan_date, 'start of month')", "date(l.return_date, 'start of month')"
+    op.execute(f"""
+        INSERT INTO monthly_circulation (month, genre, author_id, loans, returns)
+        SELECT month, genre, author_id, sum(loans), sum(returns) FROM (
+            SELECT {loan_month} AS month, coalesce(b.genre, '') AS genre, b.author_id, 1 AS loans, 0 AS returns
+            FROM loans l JOIN books b ON b.id = l.book_id
+            UNION ALL
+            SELECT {return_month}, coalesce(b.genre, ''), b.author_id, 0, 1
+            FROM loans l JOIN books b ON b.id = l.book_id
+            WHERE l.return_date IS NOT NULL
+        ) AS events
+        GROUP BY month, genre, author_id
+    """)
+    op.execute("""
+        INSERT INTO book_circulation (book_id, total_loans, active_loans)
+        SELECT l.book_id, count(*), sum(CASE WHEN l.status IN ('active', 'overdue') THEN 1 ELSE 0 END)
+        FROM loans l JOIN books b ON b.id = l.book_id
+        GROUP BY l.book_id
+    """)
+
+
+def downgrade():
+    op.drop_index('ix_book_circulation_total_loans', table_name='book_circulation')
+    op.drop_table('book_circulation')
+    op.drop_table('monthly_circulation')
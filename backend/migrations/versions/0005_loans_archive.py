@@ -0,0 +1,47 @@
+"""archive table for old returned loans
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 19:36:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('loans_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('borrower_id', sa.Integer(), nullable=False),
+    sa.Column('loan_date', sa.Date(), nullable=False),
+    sa.Column('due_date', sa.Date(), nullable=False),
+    sa.Column('return_date', sa.Date(), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('fine', sa.Numeric(precision=10, scale=2), server_default='0', nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['book_id'], ['books.id'], ),
+    sa.ForeignKeyConstraint(['borrower_id'], ['borrowers.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_loans_archive_book_id', 'loans_archive', ['book_id', 'id'])
+    op.create_index('ix_loans_archive_borrower_id', 'loans_archive', ['borrower_id', 'id'])
+
+
+def downgrade():
+    # Put archived loans back first so no history is lost
+    op.execute("""
+        INSERT INTO loans (id, book_id, borrower_id, loan_date, due_date, return_date, status, fine, created_at)
+        SELECT id, book_id, borrower_id, loan_date, due_date, return_date, status, fine, created_at
+        FROM loans_archive
+    """)
+    op.drop_index('ix_loans_archive_borrower_id', table_name='loans_archive')
+    op.drop_index('ix_loans_archive_book_id', table_name='loans_archive')
+    op.drop_table('loans_archive')
@@ -0,0 +1,70 @@
+"""loan counters on books and borrowers, replacing book_circulation
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 19:39:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+COUNTERS = (('books', 'book_id'), ('borrowers', 'borrower_id'))
+
+
+def upgrade():
+    for table, _ in COUNTERS:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('active_loans', sa.Integer(), server_default='0', nullable=False))
+            batch_op.add_column(sa.Column('total_loans', sa.Integer(), server_default='0', nullable=False))
+            batch_op.add_column(sa.Column('last_loaned_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_books_total_loans', 'books', ['total_loans', 'id'])
+    op.create_index('ix_borrowers_active_loans', 'borrowers', ['active_loans', 'id'])
+
+    # Same values as app/stats.py reconcile_counters(), from the live and archived loans
+    for table, column in COUNTERS:
+        op.execute(f"""
+            UPDATE {table} SET
+                total_loans = (SELECT count(*) FROM loans l WHERE l.{column} = {table}.id)
+                    + (SELECT count(*) FROM loans_archive a WHERE a.{column} = {table}.id),
+                active_loans = (SELECT count(*) FROM loans l
+                                WHERE l.{column} = {table}.id AND l.status IN ('active', 'overdue')),
+                last_loaned_at = (SELECT max(coalesce(h.created_at, h.loan_date)) FROM (
+                    SELECT created_at, loan_date FROM loans WHERE {column} = {table}.id
+                    UNION ALL
+                    SELECT created_at, loan_date FROM loans_archive WHERE {column} = {table}.id
+                ) AS h)
+            WHERE id IN (SELECT {column} FROM loans UNION SELECT {column} FROM loans_archive)
+        """)
+
+    op.drop_index('ix_book_circulation_total_loans', table_name='book_circulation')
+    op.drop_table('book_circulation')
+
+
+def downgrade():
+    op.create_table('book_circulation',
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('total_loans', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('active_loans', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['book_id'], ['books.id'], ),
+    sa.PrimaryKeyConstraint('book_id')
+    )
+    op.create_index('ix_book_circulation_total_loans', 'book_circulation', ['total_loans', 'book_id'])
+    op.execute("""
+        INSERT INTO book_circulation (book_id, total_loans, active_loans)
+        SELECT id, total_loans, active_loans FROM books WHERE total_loans > 0
+    """)
+
+    op.drop_index('ix_borrowers_active_loans', table_name='borrowers')
+    op.drop_index('ix_books_total_loans', table_name='books')
+    for table, _ in COUNTERS:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('last_loaned_at')
+            batch_op.drop_column('total_loans')
+            batch_op.drop_column('active_loans')
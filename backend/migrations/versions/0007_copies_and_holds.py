@@ -0,0 +1,68 @@
+"""copies per title and the holds queue
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 21:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('books') as batch_op:
+        batch_op.add_column(sa.Column('copies', sa.Integer(), server_default='1', nullable=False))
+        batch_op.add_column(sa.Column('available_copies', sa.Integer(), server_default='1', nullable=False))
+
+    # Every existing title is one copy, unless more are out on loan at once
+    op.execute("""
+        UPDATE books SET
+            copies = CASE WHEN active_loans > 1 THEN active_loans ELSE 1 END,
+            available_copies = CASE WHEN active_loans > 1 THEN 0 ELSE 1 - active_loans END
+    """)
+    op.execute("UPDATE books SET available = (available_copies > 0)")
+
+    op.create_table('holds',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('borrower_id', sa.Integer(), nullable=False),
+    sa.Column('priority', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('status', sa.String(length=20), server_default='waiting', nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('ready_at', sa.DateTime(), nullable=True),
+    sa.Column('closed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['book_id'], ['books.id'], ),
+    sa.ForeignKeyConstraint(['borrower_id'], ['borrowers.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_holds_borrower_id', 'holds', ['borrower_id', 'id'])
+    op.create_index('ix_holds_book_id', 'holds', ['book_id', 'id'])
+    op.create_index('ix_holds_open', 'holds', ['book_id', 'borrower_id'], unique=True,
+                    postgresql_where=sa.text("status IN ('waiting', 'ready')"),
+                    sqlite_where=sa.text("status IN ('waiting', 'ready')"))
+    op.create_index('ix_holds_ready_at', 'holds', ['ready_at'],
+                    postgresql_where=sa.text("status = 'ready'"),
+                    sqlite_where=sa.text("status = 'ready'"))
+    op.create_index('ix_holds_queue', 'holds', ['book_id', sa.text('priority DESC'), 'id'],
+                    postgresql_where=sa.text("status = 'waiting'"),
+                    sqlite_where=sa.text("status = 'waiting'"))
+
+
+def downgrade():
+    op.drop_index('ix_holds_queue', table_name='holds')
+    op.drop_index('ix_holds_ready_at', table_name='holds')
+    op.drop_index('ix_holds_open', table_name='holds')
+    op.drop_index('ix_holds_book_id', table_name='holds')
+    op.drop_index('ix_holds_borrower_id', table_name='holds')
+    op.drop_table('holds')
+
+    with op.batch_alter_table('books') as batch_op:
+        batch_op.drop_column('available_copies')
+        batch_op.drop_column('copies')
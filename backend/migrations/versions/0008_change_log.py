@@ -0,0 +1,42 @@
+"""change log for delta sync
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 22:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('changes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('resource', sa.String(length=20), nullable=False),
+    sa.Column('resource_id', sa.Integer(), nullable=False),
+    sa.Column('action', sa.String(length=10), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sqlite_autoincrement=True
+    )
+    op.create_index('ix_changes_key', 'changes', ['resource', 'resource_id', 'id'])
+
+    op.create_table('change_log_state',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('compacted_through', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute("INSERT INTO change_log_state (id, compacted_through) VALUES (1, 0)")
+
+
+def downgrade():
+    op.drop_table('change_log_state')
+    op.drop_index('ix_changes_key', table_name='changes')
+    op.drop_table('changes')
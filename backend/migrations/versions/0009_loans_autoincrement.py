@@ -0,0 +1,35 @@
+"""never reuse loan ids on SQLite
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-19 09:30:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # PostgreSQL sequences never hand out an id twice. SQLite reuses the highest ids once
+    # those loans are archived unless the table is AUTOINCREMENT, which needs a rebuild
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    with op.batch_alter_table('loans', recreate='always', table_kwargs={'sqlite_autoincrement': True}):
+        pass
+    # Start after every id handed out so far, archived loans included
+    op.execute("DELETE FROM sqlite_sequence WHERE name = 'loans'")
+    op.execute("INSERT INTO sqlite_sequence (name, seq) SELECT 'loans', max("
+               "(SELECT coalesce(max(id), 0) FROM loans), (SELECT coalesce(max(id), 0) FROM loans_archive))")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    with op.batch_alter_table('loans', recreate='always', table_kwargs={'sqlite_autoincrement': False}):
+        pass
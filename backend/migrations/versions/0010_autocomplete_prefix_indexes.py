@@ -0,0 +1,37 @@
+"""lower(column) text_pattern_ops indexes for autocomplete lookups
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-19 10:15:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_authors_name_lower', 'authors', 'name'),
+    ('ix_books_title_lower', 'books', 'title'),
+    ('ix_borrowers_name_lower', 'borrowers', 'name'),
+    ('ix_borrowers_email_lower', 'borrowers', 'email'),
+]
+
+
+def upgrade():
+    # On a busy PostgreSQL database, build these with CREATE INDEX CONCURRENTLY
+    # by hand first; create_index then finds nothing left to do
+    postgresql = op.get_bind().dialect.name == 'postgresql'
+    for name, table, column in INDEXES:
+        expression = f'lower({column}) text_pattern_ops' if postgresql else f'lower({column})'
+        op.create_index(name, table, [sa.text(expression)], if_not_exists=True)
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
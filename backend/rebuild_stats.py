@@ -0,0 +1,9 @@
+from app import create_app
+from app.stats import rebuild_stats
+
+app = create_app()
+
+if __name__ == '__main__':
+    with app.app_context():
+        rebuild_stats()
+    print("Rebuilt circulation stats")
@@ -0,0 +1,9 @@
+from app import create_app
+from app.stats import reconcile_counters
+
+app = create_app()
+
+if __name__ == '__main__':
+    with app.app_context():
+        repaired = reconcile_counters()
+    print(f"Repaired loan counters on {repaired['books']} books and {repaired['borrowers']} borrowers")
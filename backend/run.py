@@ -1,12 +1,12 @@
+from flask_migrate import upgrade
 from app import create_app
-from app.extensions import db
 
 app = create_app()
 
-# Create database tables
+# Bring the database schema up to date
 with app.app_context():
-    db.create_all()
-    print("Database tables created successfully!")
+    upgrade()
+    print("Database migrations applied successfully!")
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
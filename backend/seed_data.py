@@ -1,6 +1,8 @@
+from flask_migrate import stamp
 from app import create_app
 from app.extensions import db
 from app.models.models import Author, Book, Borrower
+from app.search import create_search_index, rebuild_search_index
 
 app = create_app()
 
@@ -10,6 +12,8 @@ def seed_data():
         # Clear existing data
         db.drop_all()
         db.create_all()
+        create_search_index()
+        stamp()  # create_all built the latest schema; record it as fully migrated
         
         # Create sample authors
         authors = [
@@ -29,21 +33,21 @@ def seed_data():
         
         # Create sample books with images
         books = [
-            Book(title="Harry Potter and the Philosopher's Stone", author_id=1, published_year=1997, isbn="9780747532699", 
+            Book(title="Harry Potter and the Philosopher's Stone", author_id=1, publication_year=1997, isbn="9780747532699", 
                  image_url="https://images-na.ssl-images-amazon.com/images/I/91ocU8970hL.jpg"),
-            Book(title="1984", author_id=2, published_year=1949, isbn="9780451524935",
+            Book(title="1984", author_id=2, publication_year=1949, isbn="9780451524935",
                  image_url="https://images-na.ssl-images-amazon.com/images/I/71kxa1-0mfL.jpg"),
-            Book(title="To Kill a Mockingbird", author_id=3, published_year=1960, isbn="9780446310789",
+            Book(title="To Kill a Mockingbird", author_id=3, publication_year=1960, isbn="9780446310789",
                  image_url="https://images-na.ssl-images-amazon.com/images/I/81aY1lxk+9L.jpg"),
-            Book(title="The Great Gatsby", author_id=4, published_year=1925, isbn="9780743273565",
+            Book(title="The Great Gatsby", author_id=4, publication_year=1925, isbn="9780743273565",
                  image_url="https://images-na.ssl-images-amazon.com/images/I/81af+MCATTL.jpg"),
-            Book(title="Pride and Prejudice", author_id=5, published_year=1813, isbn="9780141439518",
+            Book(title="Pride and Prejudice", author_id=5, publication_year=1813, isbn="9780141439518",
                  image_url="https://images-na.ssl-images-amazon.com/images/I/81NLDvyAHrL.jpg"),
-            Book(title="The Shining", author_id=6, published_year=1977, isbn="9780307743657",
+            Book(title="The Shining", author_id=6, publication_year=1977, isbn="9780307743657",
                  image_url="https://images-na.ssl-images-amazon.com/images/I/91kKWG5cjTL.jpg"),
-            Book(title="Murder on the Orient Express", author_id=7, published_year=1934, isbn="9780062693662",
+            Book(title="Murder on the Orient Express", author_id=7, publication_year=1934, isbn="9780062693662",
                  image_url="https://images-na.ssl-images-amazon.com/images/I/81lJEKKMKLL.jpg"),
-            Book(title="Harry Potter and the Chamber of Secrets", author_id=1, published_year=1998, isbn="9780747538493",
+            Book(title="Harry Potter and the Chamber of Secrets", author_id=1, publication_year=1998, isbn="9780747538493",
                  image_url="https://images-na.ssl-images-amazon.com/images/I/91OmBTrpMsL.jpg")
         ]
         
@@ -62,6 +66,7 @@ def seed_data():
             db.session.add(borrower)
         
         db.session.commit()
+        rebuild_search_index()
         
         print("Sample data added successfully!")
         print(f"Added {len(authors)} authors, {len(books)} books, and {len(borrowers)} borrowers")
@@ -0,0 +1,17 @@
+import argparse
+from datetime import date
+
+from app import create_app
+from app.overdue import sweep_overdue
+
+app = create_app()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Mark past-due loans overdue and update their fines (run daily from cron)')
+    parser.add_argument('--date', type=date.fromisoformat, help='treat this day (YYYY-MM-DD) as today')
+    parser.add_argument('--batch-size', type=int)
+    args = parser.parse_args()
+
+    with app.app_context():
+        updated = sweep_overdue(args.date, args.batch_size)
+    print(f"Updated {updated} overdue loans")
@@ -2,6 +2,8 @@ import axios from 'axios';
 
 // Use environment variable for production, fallback to localhost for development
 const API_BASE_URL = process.env.REACT_APP_API_URL || 'https://library-manager-2qw8.onrender.com/api';
+// Send cookies so reads right after a write are served by the primary database
+axios.defaults.withCredentials = true;
 console.log('API_BASE_URL:', API_BASE_URL);
 // Books API
 export const getBooks = () => axios.get(`${API_BASE_URL}/books`);
@@ -9,6 +11,14 @@ export const getBook = (id) => axios.get(`${API_BASE_URL}/books/${id}`);
 export const createBook = (book) => axios.post(`${API_BASE_URL}/books`, book);
 export const updateBook = (id, book) => axios.put(`${API_BASE_URL}/books/${id}`, book);
 export const deleteBook = (id) => axios.delete(`${API_BASE_URL}/books/${id}`);
+// Cover served from our own cache; v changes with image_url, so the browser may keep each one for a year
+const coverVersion = (url) => {
+  let hash = 0x811c9dc5;
+  for (const byte of new TextEncoder().encode(url)) hash = Math.imul(hash ^ byte, 0x01000193);
+  return (hash >>> 0).toString(16).padStart(8, '0');
+};
+export const getCoverUrl = (book, size = 'medium') =>
+  `${API_BASE_URL}/books/${book.id}/cover?size=${size}` + (book.image_url ? `&v=${coverVersion(book.image_url)}` : '');
 
 // Authors API
 export const getAuthors = () => axios.get(`${API_BASE_URL}/authors`);
@@ -22,4 +32,52 @@ export const createBorrower = (borrower) => axios.post(`${API_BASE_URL}/borrower
 export const getLoans = () => axios.get(`${API_BASE_URL}/loans`);
 export const getActiveLoans = () => axios.get(`${API_BASE_URL}/loans/active`);
 export const createLoan = (loan) => axios.post(`${API_BASE_URL}/loans`, loan);
-export const returnBook = (loanId) => axios.put(`${API_BASE_URL}/loans/${loanId}/return`);
\ No newline at end of file
+export const returnBook = (loanId) => axios.put(`${API_BASE_URL}/loans/${loanId}/return`);
+
+// Autocomplete API: up to limit authors, borrowers or books with a word starting with prefix
+export const autocomplete = (resource, prefix, limit = 10) =>
+  axios.get(`${API_BASE_URL}/autocomplete/${resource}`, { params: { prefix, limit } });
+
+// Batch API: several requests in one round trip, e.g. batch([{ path: '/api/books' }, { path: '/api/authors' }]).
+// Resolves to one { status, headers, body } per request; with atomic, writes commit together or not at all
+export const batch = (requests, atomic = false) => axios.post(`${API_BASE_URL}/batch`, { requests, atomic });
+// The books and the change feed cursor in one round trip; the cursor is taken first so nothing
+// written during the load is missed
+export const getBooksWithCursor = async () => {
+  const res = await batch([{ path: '/api/changes' }, { path: '/api/books' }]);
+  const [changes, books] = res.data.responses;
+  if (books.status !== 200) throw new Error('Failed to fetch books');
+  return { books: books.body, cursor: changes.body.cursor };
+};
+
+// Change feed: take a cursor before loading a list, then fetch only what changed since instead of
+// reloading it. resource narrows the feed, e.g. 'books,authors'
+export const getChanges = (since, resource) => axios.get(`${API_BASE_URL}/changes`, { params: { since, resource } });
+export const getChangeCursor = async (resource) => (await getChanges(undefined, resource)).data.cursor;
+// Resolves to { changes, cursor }, following every page. changes is null when the log has been
+// compacted past since: reload the lists, then sync from the cursor returned
+export const syncChanges = async (since, resource) => {
+  const changes = [];
+  let cursor = since;
+  for (;;) {
+    let res;
+    try {
+      res = await getChanges(cursor, resource);
+    } catch (err) {
+      if (err.response?.status === 410) return { changes: null, cursor: err.response.data.cursor };
+      throw err;
+    }
+    changes.push(...res.data.changes);
+    cursor = res.data.cursor;
+    if (!res.data.more) return { changes, cursor };
+  }
+};
+// Apply the changes of one resource to a list; rows that are gone or fail keep() drop out
+export const applyChanges = (rows, changes, keep = () => true) => {
+  const byId = new Map(rows.map(row => [row.id, row]));
+  for (const { resource_id, data } of changes) {
+    if (data && keep(data)) byId.set(resource_id, data);
+    else byId.delete(resource_id);
+  }
+  return [...byId.values()];
+};
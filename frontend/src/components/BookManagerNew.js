@@ -1,5 +1,8 @@
-import React, { useEffect, useState } from 'react';
-import { getBooks, getAuthors, createBook, updateBook, deleteBook, createAuthor } from '../api/api';
+import React, { useEffect, useRef, useState } from 'react';
+import {
+  getBooksWithCursor, syncChanges, applyChanges, autocomplete,
+  createBook, updateBook, deleteBook, createAuthor, getCoverUrl
+} from '../api/api';
 import BorrowDialog from './BorrowDialog';
 import {
   Box, Typography, TextField, Button, Grid, Card, CardMedia, CardContent, CardActions,
@@ -22,6 +25,7 @@ const initialForm = {
 
 export default function BookManager() {
   const [books, setBooks] = useState([]);
+  // Authors suggested for what is typed in the author field
   const [authors, setAuthors] = useState([]);
   const [form, setForm] = useState(initialForm);
   const [editingId, setEditingId] = useState(null);
@@ -30,30 +34,47 @@ export default function BookManager() {
   const [selectedBook, setSelectedBook] = useState(null);
   const [error, setError] = useState('');
   const [success, setSuccess] = useState('');
+  const cursor = useRef(null);
+  const lastAuthorInput = useRef('');
 
   const fetchBooks = async () => {
     try {
-      const res = await getBooks();
-      setBooks(res.data);
+      const { books: loaded, cursor: next } = await getBooksWithCursor();
+      cursor.current = next;
+      setBooks(loaded);
     } catch (err) {
       setBooks([]);
       setError('Failed to fetch books');
     }
   };
 
-  const fetchAuthors = async () => {
+  const suggestAuthors = async (prefix) => {
+    lastAuthorInput.current = prefix;
+    if (!prefix.trim()) {
+      setAuthors([]);
+      return;
+    }
     try {
-      const res = await getAuthors();
-      setAuthors(res.data);
+      const res = await autocomplete('authors', prefix);
+      if (lastAuthorInput.current === prefix) setAuthors(res.data);
     } catch (err) {
       setAuthors([]);
     }
   };
 
-  useEffect(() => { 
-    fetchBooks(); 
-    fetchAuthors();
-  }, []);
+  // Pick up only the books that changed since the last load or sync (an author rename logs their books too)
+  const syncBooks = async () => {
+    try {
+      const { changes, cursor: next } = await syncChanges(cursor.current, 'books');
+      if (changes === null) return fetchBooks();
+      cursor.current = next;
+      setBooks(current => applyChanges(current, changes));
+    } catch (err) {
+      setError('Failed to fetch books');
+    }
+  };
+
+  useEffect(() => { fetchBooks(); }, []);
 
   const handleChange = e => {
     setForm({ ...form, [e.target.name]: e.target.value });
@@ -88,8 +109,6 @@ export default function BookManager() {
           const newAuthorResponse = await createAuthor({ name: form.author_input });
           authorId = newAuthorResponse.data.id;
           console.log('New author created with ID:', authorId);
-          // Refresh authors list
-          await fetchAuthors();
         }
       }
       
@@ -127,7 +146,7 @@ export default function BookManager() {
       setForm(initialForm);
       setEditingId(null);
       setDialogOpen(false);
-      await fetchBooks();
+      await syncBooks();
     } catch (err) {
       console.error('Error submitting book:', err);
       console.error('Error response:', err.response?.data);
@@ -137,11 +156,11 @@ export default function BookManager() {
   };
 
   const handleEdit = book => {
-    const selectedAuthor = authors.find(author => author.id === book.author_id);
+    setAuthors([{ id: book.author_id, name: book.author_name }]);
     setForm({
       title: book.title,
       author_id: book.author_id,
-      author_input: selectedAuthor ? selectedAuthor.name : '',
+      author_input: book.author_name || '',
       description: book.description || '',
       publication_year: book.publication_year || '',
       isbn: book.isbn || '',
@@ -161,7 +180,7 @@ export default function BookManager() {
       try {
         await deleteBook(id);
         setSuccess('Book deleted successfully!');
-        fetchBooks();
+        syncBooks();
       } catch (err) {
         console.error('Delete error:', err);
         const errorMessage = err.response?.data?.error || 'Failed to delete book';
@@ -177,7 +196,7 @@ export default function BookManager() {
 
   const handleBorrowSuccess = () => {
     setSuccess('Book borrowed successfully!');
-    fetchBooks();
+    syncBooks();
   };
 
   const handleAddNew = () => {
@@ -243,7 +262,7 @@ export default function BookManager() {
                 <CardMedia
                   component="img"
                   height="200"
-                  image={book.image_url || 'https://via.placeholder.com/150x200?text=No+Image'}
+                  image={getCoverUrl(book)}
                   alt={book.title}
                   sx={{ objectFit: 'cover' }}
                 />
@@ -357,7 +376,9 @@ export default function BookManager() {
                 inputValue={form.author_input}
                 onInputChange={(event, newInputValue) => {
                   setForm({ ...form, author_input: newInputValue, author_id: '' });
+                  suggestAuthors(newInputValue);
                 }}
+                filterOptions={(options) => options}
                 freeSolo
                 renderInput={(params) => (
                   <TextField
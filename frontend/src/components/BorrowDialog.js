@@ -1,9 +1,9 @@
-import React, { useState } from 'react';
+import React, { useRef, useState } from 'react';
 import {
   Dialog, DialogTitle, DialogContent, DialogActions,
-  TextField, Button, Stack, MenuItem, Alert
+  TextField, Button, Stack, MenuItem, Alert, Autocomplete
 } from '@mui/material';
-import { createBorrower, createLoan } from '../api/api';
+import { autocomplete, createBorrower, createLoan } from '../api/api';
 
 const BorrowDialog = ({ open, onClose, book, onBorrow }) => {
   const [step, setStep] = useState(1); // 1: Borrower details, 2: Loan details
@@ -17,11 +17,36 @@ const BorrowDialog = ({ open, onClose, book, onBorrow }) => {
   });
   const [error, setError] = useState('');
   const [loading, setLoading] = useState(false);
+  const [suggestions, setSuggestions] = useState([]);
+  const lastPrefix = useRef('');
 
   const handleBorrowerChange = (e) => {
     setBorrowerData({ ...borrowerData, [e.target.name]: e.target.value });
   };
 
+  // Suggest registered borrowers by name or email as the librarian types
+  const handleNameInput = async (event, value, reason) => {
+    if (reason === 'reset') return;
+    setBorrowerData(current => ({ ...current, name: value }));
+    lastPrefix.current = value;
+    if (!value.trim()) {
+      setSuggestions([]);
+      return;
+    }
+    try {
+      const res = await autocomplete('borrowers', value);
+      if (lastPrefix.current === value) setSuggestions(res.data);
+    } catch (err) {
+      setSuggestions([]);
+    }
+  };
+
+  const handleSuggestion = (event, borrower) => {
+    if (borrower && typeof borrower === 'object') {
+      setBorrowerData({ name: borrower.name, email: borrower.email, phone: borrower.phone || '' });
+    }
+  };
+
   const handleLoanChange = (e) => {
     setLoanData({ ...loanData, [e.target.name]: parseInt(e.target.value) });
   };
@@ -63,6 +88,7 @@ const BorrowDialog = ({ open, onClose, book, onBorrow }) => {
   const handleClose = () => {
     setStep(1);
     setBorrowerData({ name: '', email: '', phone: '' });
+    setSuggestions([]);
     setLoanData({ days_to_return: 14 });
     setError('');
     onClose();
@@ -83,18 +109,31 @@ const BorrowDialog = ({ open, onClose, book, onBorrow }) => {
         
         {step === 1 && (
           <Stack spacing={2} sx={{ mt: 1 }}>
-            <TextField
-              name="name"
-              label="👤 Borrower Name"
-              value={borrowerData.name}
-              onChange={handleBorrowerChange}
-              required
-              fullWidth
-              sx={{
-                '& .MuiOutlinedInput-root': {
-                  background: 'rgba(255,255,255,0.8)'
-                }
-              }}
+            <Autocomplete
+              freeSolo
+              options={suggestions}
+              filterOptions={(options) => options}
+              getOptionLabel={(option) => typeof option === 'string' ? option : option.name}
+              renderOption={(props, option) => (
+                <li {...props} key={option.id}>{option.name} ({option.email})</li>
+              )}
+              inputValue={borrowerData.name}
+              onInputChange={handleNameInput}
+              onChange={handleSuggestion}
+              renderInput={(params) => (
+                <TextField
+                  {...params}
+                  name="name"
+                  label="👤 Borrower Name"
+                  required
+                  fullWidth
+                  sx={{
+                    '& .MuiOutlinedInput-root': {
+                      background: 'rgba(255,255,255,0.8)'
+                    }
+                  }}
+                />
+              )}
             />
             <TextField
               name="email"
@@ -1,5 +1,5 @@
-import React, { useEffect, useState } from 'react';
-import { getActiveLoans, returnBook } from '../api/api';
+import React, { useEffect, useRef, useState } from 'react';
+import { applyChanges, getActiveLoans, getChangeCursor, returnBook, syncChanges } from '../api/api';
 import {
   Box, Typography, Table, TableBody, TableCell, TableContainer, TableHead, TableRow, 
   Paper, Button, Chip, Alert, Snackbar, Card, CardContent, Grid, Avatar
@@ -10,9 +10,11 @@ export default function LoansManager() {
   const [loans, setLoans] = useState([]);
   const [error, setError] = useState('');
   const [success, setSuccess] = useState('');
+  const cursor = useRef(null);
 
   const fetchLoans = async () => {
     try {
+      cursor.current = await getChangeCursor('loans');
       const res = await getActiveLoans();
       setLoans(res.data);
     } catch (err) {
@@ -20,6 +22,18 @@ export default function LoansManager() {
     }
   };
 
+  // Pick up only the loans that changed since the last load or sync
+  const syncLoans = async () => {
+    try {
+      const { changes, cursor: next } = await syncChanges(cursor.current, 'loans');
+      if (changes === null) return fetchLoans();
+      cursor.current = next;
+      setLoans(current => applyChanges(current, changes, loan => loan.status !== 'returned'));
+    } catch (err) {
+      setError('Failed to fetch loans');
+    }
+  };
+
   useEffect(() => { fetchLoans(); }, []);
 
   const handleReturn = async (loanId) => {
@@ -27,7 +41,7 @@ export default function LoansManager() {
       try {
         await returnBook(loanId);
         setSuccess('Book returned successfully!');
-        fetchLoans();
+        syncLoans();
       } catch (err) {
         setError(err.response?.data?.error || 'Failed to return book');
       }